@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List, Optional, Sequence
+
+from sources.helpers.compressed_io import iterate_in_background, open_text
+from sources.helpers.corpus_runner import BACKENDS, normalize_stream
+from sources.helpers.read_news_stream import read_news_lines, read_news_stream
+from sources.normalizers.abstract_normalizer import AbstractNormalizer
+from sources.normalizers.budget import DocumentBudget
+from sources.normalizers.normalization_pipeline import DEFAULT_NORMALIZERS, NormalizationPipeline
+
+NORMALIZERS_BY_NAME = {normalizer.name(): normalizer for normalizer in DEFAULT_NORMALIZERS}
+
+OUTPUT_FORMATS = ["text", "jsonl", "edits"]
+
+
+def parse_normalizers(value: str) -> List[type]:
+    """Parses a comma-separated list of normalizer names, see AbstractNormalizer.name."""
+    normalizers = []
+    for name in value.split(","):
+        name = name.strip()
+        if name not in NORMALIZERS_BY_NAME:
+            raise argparse.ArgumentTypeError(
+                f"Unknown normalizer {name}, choose from {', '.join(NORMALIZERS_BY_NAME)}"
+            )
+        normalizers.append(NORMALIZERS_BY_NAME[name])
+
+    return normalizers
+
+
+class Progress:
+    """Prints the number of processed documents and the rate to stderr at most every interval seconds."""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.printed = self.started
+        self.documents = 0
+
+    def update(self, documents: int):
+        self.documents = documents
+        now = time.perf_counter()
+        if now - self.printed >= self.interval:
+            self.printed = now
+            self.print("\r")
+
+    def finish(self):
+        self.print("\r")
+        sys.stderr.write("\n")
+
+    def print(self, prefix: str):
+        seconds = time.perf_counter() - self.started
+        rate = self.documents / seconds if seconds > 0 else 0.0
+        sys.stderr.write(f"{prefix}{self.documents:,} docs, {rate:,.0f} docs/sec")
+        sys.stderr.flush()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m sources",
+        description="Normalizes Ukrainian news separated by empty lines, e.g. a corpus file or standard input.",
+    )
+    parser.add_argument("input", nargs="?", default="-",
+                        help="Corpus file, possibly compressed with gzip, bz2, xz or zstd, - for standard input")
+    parser.add_argument("-o", "--output", default="-",
+                        help="Output file, compressed by its extension (.gz, .bz2, .xz, .zst), - for standard output")
+    parser.add_argument("-n", "--normalizers", type=parse_normalizers,
+                        help=f"Comma-separated names of the normalizers to run, all by default: "
+                             f"{','.join(NORMALIZERS_BY_NAME)}")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of workers, 0 for one per CPU")
+    parser.add_argument("--backend", choices=BACKENDS, default="process",
+                        help="Run the workers as processes, or as threads sharing the normalizers, "
+                             "which run in parallel on free-threaded Python")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default="text",
+                        help="text: normalized news separated by empty lines; jsonl: a JSON object with the text, "
+                             "warnings and errors for every news; edits: a JSON object with the [start, end, "
+                             "replacement] edits of the input instead of the text")
+    parser.add_argument("--report",
+                        help="Path to write the warnings and errors of the text format to as JSON lines")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Number of documents sent to a worker at once")
+    parser.add_argument("--compression-level", type=int, help="Compression level of the output")
+    parser.add_argument("--progress", action="store_true", help="Print the number of documents and docs/sec to stderr")
+    parser.add_argument("--max-document-length", type=int,
+                        help="Pass longer documents through unchanged with an error instead of normalizing them")
+    parser.add_argument("--max-document-seconds", type=float,
+                        help="Pass documents through unchanged with an error if normalizing them takes longer")
+    arguments = parser.parse_args(argv)
+
+    if arguments.jobs < 0:
+        parser.error("--jobs must not be negative")
+    if arguments.report and arguments.format != "text":
+        parser.error("--report is only used with the text format, the other formats contain the warnings and errors")
+    if arguments.normalizers:
+        try:
+            NormalizationPipeline.validate_order(arguments.normalizers)
+        except ValueError as error:
+            parser.error(str(error))
+    budget = None
+    if arguments.max_document_length is not None or arguments.max_document_seconds is not None:
+        try:
+            budget = DocumentBudget(arguments.max_document_length, arguments.max_document_seconds)
+        except ValueError as error:
+            parser.error(str(error))
+
+    if arguments.input != "-":
+        # The corpus is read lazily by a background thread, so a missing file would only fail in the middle of the run
+        try:
+            open(arguments.input, "rb").close()
+        except OSError as error:
+            parser.error(f"can't open '{arguments.input}': {error.strerror}")
+
+    try:
+        if arguments.output == "-":
+            sys.stdout.reconfigure(encoding="utf-8")
+            output = sys.stdout
+        else:
+            output = open_text(arguments.output, "w", level=arguments.compression_level)
+        report = open(arguments.report, "w", encoding="utf-8") if arguments.report else None
+    except OSError as error:
+        parser.error(f"can't open '{error.filename}': {error.strerror}")
+
+    if arguments.input == "-":
+        sys.stdin.reconfigure(encoding="utf-8")
+        texts = iterate_in_background(read_news_lines(sys.stdin), name="stdin reader")
+    else:
+        texts = read_news_stream(arguments.input, background=True)
+    progress = Progress() if arguments.progress else None
+    broken_pipe = False
+
+    results = normalize_stream(
+        texts, arguments.normalizers, arguments.jobs or None, arguments.chunk_size, edits=arguments.format == "edits",
+        backend=arguments.backend, budget=budget,
+    )
+
+    try:
+        for index, _, (result, warnings, errors) in results:
+            if arguments.format == "text":
+                output.write(result)
+                output.write("\n\n")
+                if report is not None and (warnings or errors):
+                    report.write(json.dumps({"document": index, "warnings": warnings, "errors": errors},
+                                            ensure_ascii=False))
+                    report.write("\n")
+            else:
+                key = "text" if arguments.format == "jsonl" else "edits"
+                output.write(json.dumps({"document": index, key: result, "warnings": warnings, "errors": errors},
+                                        ensure_ascii=False))
+                output.write("\n")
+
+            if progress is not None:
+                progress.update(index + 1)
+    except BrokenPipeError:
+        # The reader of the output stopped, e.g. head. Standard output goes to devnull, so flushing it at exit
+        # does not raise again, see https://docs.python.org/3/library/signal.html#note-on-sigpipe
+        broken_pipe = True
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    finally:
+        if progress is not None and not broken_pipe:
+            progress.finish()
+        if output is not sys.stdout:
+            output.close()
+        if report is not None:
+            report.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from sources.benchmarks.synthetic_news import SyntheticNewsGenerator
+from sources.normalizers.normalization_pipeline import DEFAULT_NORMALIZERS, NormalizationPipeline
+
+
+def benchmark_targets() -> List[Tuple[str, Callable[[str], object]]]:
+    """Returns (name, normalize function) for every normalizer and the full chain."""
+    targets = [(normalizer.name(), normalizer.normalize) for normalizer in DEFAULT_NORMALIZERS]
+    targets.append(("NormalizationPipeline", NormalizationPipeline().normalize))
+
+    return targets
+
+
+def measure_throughput(function: Callable[[str], object], documents: Sequence[str], repeats: int = 3) -> dict:
+    """
+    Runs the function over all documents repeats times and reports the fastest pass,
+    which is the least affected by other processes on the machine.
+    """
+    characters = sum(map(len, documents))
+    timings = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for document in documents:
+            function(document)
+        timings.append(time.perf_counter() - start)
+
+    seconds = min(timings)
+    return {
+        "seconds": seconds,
+        "docs_per_sec": len(documents) / seconds,
+        "chars_per_sec": characters / seconds,
+    }
+
+
+def measure_peak_memory(function: Callable[[str], object], documents: Sequence[str]) -> int:
+    """
+    Returns the peak number of bytes allocated by Python during a pass over the documents.
+    Measured in a separate pass, because tracing allocations slows the code down.
+    """
+    tracemalloc.start()
+    try:
+        for document in documents:
+            function(document)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def run_benchmarks(documents: Sequence[str], repeats: int = 3, memory: bool = True) -> Dict[str, dict]:
+    """
+    Benchmarks every normalizer and the full chain on the documents.
+
+    Returns:
+        Dict[str, dict]: Seconds, docs/sec, chars/sec and peak memory in bytes for every benchmark name
+    """
+    results = {}
+    for name, function in benchmark_targets():
+        # Warm-up pass, so the first benchmark does not pay for imports and regex compilation
+        for document in documents[:10]:
+            function(document)
+
+        results[name] = measure_throughput(function, documents, repeats)
+        if memory:
+            results[name]["peak_memory_bytes"] = measure_peak_memory(function, documents)
+
+    return results
+
+
+def measure_thread_scaling(documents: Sequence[str], threads: Sequence[int], repeats: int = 3) -> Dict[str, dict]:
+    """
+    Measures the throughput of one NormalizationPipeline shared by a pool of threads, see normalize_batch.
+    Threads only run the normalizers in parallel on a free-threaded build, with the GIL the speedup stays about 1.
+
+    Returns:
+        Dict[str, dict]: Seconds, docs/sec, chars/sec and speedup over the first entry for every number of threads
+    """
+    pipeline = NormalizationPipeline()
+    pipeline.normalize_batch(documents[:10])
+    results = {}
+
+    characters = sum(map(len, documents))
+    for count in threads:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            pipeline.normalize_batch(documents, workers=count)
+            timings.append(time.perf_counter() - start)
+
+        seconds = min(timings)
+        results[str(count)] = {
+            "seconds": seconds,
+            "docs_per_sec": len(documents) / seconds,
+            "chars_per_sec": characters / seconds,
+        }
+
+    first = next(iter(results.values()), None)
+    for result in results.values():
+        result["speedup"] = first["seconds"] / result["seconds"]
+
+    return results
+
+
+def compare_results(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = 0.1) -> List[str]:
+    """
+    Compares the throughput with a baseline run.
+
+    Args:
+        results: Results of run_benchmarks
+        baseline: Results of an earlier run_benchmarks call on the same documents
+        threshold: Allowed relative slowdown, e.g. 0.1 for 10%
+
+    Returns:
+        List[str]: Description of every benchmark that is slower than the baseline by more than the threshold
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        ratio = result["chars_per_sec"] / baseline[name]["chars_per_sec"]
+        if ratio < 1 - threshold:
+            regressions.append(
+                f"{name}: {result['chars_per_sec']:,.0f} chars/sec, "
+                f"{(1 - ratio) * 100:.1f}% slower than {baseline[name]['chars_per_sec']:,.0f} chars/sec"
+            )
+
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the normalizers on synthetic Ukrainian news.")
+    parser.add_argument("--documents", type=int, default=2000, help="Number of generated documents")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the news generator")
+    parser.add_argument("--phone-density", type=float, default=0.05)
+    parser.add_argument("--apostrophe-density", type=float, default=0.3)
+    parser.add_argument("--quote-density", type=float, default=0.2)
+    parser.add_argument("--nested-quote-density", type=float, default=0.05)
+    parser.add_argument("--spaced-apostrophe-density", type=float, default=0.02)
+    parser.add_argument("--long-document-ratio", type=float, default=0.02)
+    parser.add_argument("--repeats", type=int, default=3, help="Number of timed passes, the fastest is reported")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory measurement")
+    parser.add_argument("--output", help="Path to save the results as JSON")
+    parser.add_argument("--baseline", help="Path to the JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed relative slowdown against the baseline")
+    parser.add_argument("--threads", type=lambda value: [int(count) for count in value.split(",")],
+                        help="Comma-separated numbers of threads to measure the scaling of a shared pipeline with, "
+                             "e.g. 1,2,4")
+    arguments = parser.parse_args(argv)
+
+    generator_options = {
+        "seed": arguments.seed,
+        "phone_density": arguments.phone_density,
+        "apostrophe_density": arguments.apostrophe_density,
+        "quote_density": arguments.quote_density,
+        "nested_quote_density": arguments.nested_quote_density,
+        "spaced_apostrophe_density": arguments.spaced_apostrophe_density,
+        "long_document_ratio": arguments.long_document_ratio,
+    }
+    documents = SyntheticNewsGenerator(**generator_options).documents(arguments.documents)
+    results = run_benchmarks(documents, arguments.repeats, memory=not arguments.no_memory)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "generator": generator_options,
+        "documents": len(documents),
+        "characters": sum(map(len, documents)),
+        "repeats": arguments.repeats,
+        "results": results,
+    }
+    if arguments.threads:
+        report["gil_enabled"] = getattr(sys, "_is_gil_enabled", lambda: True)()
+        report["thread_scaling"] = measure_thread_scaling(documents, arguments.threads, arguments.repeats)
+
+    for name, result in results.items():
+        memory = f", peak {result['peak_memory_bytes'] / 2 ** 20:.1f} MiB" if "peak_memory_bytes" in result else ""
+        print(f"{name}: {result['docs_per_sec']:,.0f} docs/sec, {result['chars_per_sec']:,.0f} chars/sec{memory}")
+    for count, result in report.get("thread_scaling", {}).items():
+        print(f"{count} threads: {result['docs_per_sec']:,.0f} docs/sec, {result['speedup']:.2f}x "
+              f"(GIL {'enabled' if report['gil_enabled'] else 'disabled'})")
+
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+        if baseline["generator"] != generator_options or baseline["documents"] != len(documents):
+            print("Warning: the baseline was measured on other documents", file=sys.stderr)
+
+        regressions = compare_results(results, baseline["results"], arguments.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
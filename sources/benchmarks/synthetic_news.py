@@ -0,0 +1,144 @@
+from typing import Iterator, List
+import random
+
+from sources.normalizers.constants import Constants
+
+WORDS = [
+    "уряд", "президент", "місто", "область", "рада", "депутати", "закон", "новини", "економіка", "війна",
+    "країна", "люди", "рік", "день", "питання", "компанія", "ринок", "ціни", "школа", "лікарня", "дорога",
+    "повідомили", "заявив", "зазначила", "ухвалили", "розповів", "відбулася", "триває", "зросла", "знизилися",
+    "нова", "велика", "державна", "місцева", "українська", "важливий", "останній", "перший", "2023", "15",
+    "у", "в", "на", "з", "до", "та", "і", "що", "за", "про", "після", "через", "щодо", "понад",
+]
+APOSTROPHE_WORDS = [
+    ("сім", "я"), ("прем", "єр"), ("об", "єкт"), ("м", "ясо"), ("п", "ять"), ("комп", "ютер"),
+    ("з", "явився"), ("пам", "ять"), ("зв", "язок"), ("інтерв", "ю"), ("обов", "язково"), ("здоров", "я"),
+]
+QUOTED_NAMES = [
+    "Укрзалізниця", "Нафтогаз", "Слуга народу", "Дія", "Азов", "Карпати", "Ми переможемо", "Так працює держава",
+]
+PHONE_FORMATS = [
+    "0XX XXX XX XX", "(0XX) XXX-XX-XX", "+380 XX XXX XX XX", "+38 (0XX) XXX-XX-XX", "0XXXXXXXXX",
+    "0XX-XXX-XX-XX", "(0XXX) XX-XX-XX", "0 800 XXX XXX", "+380 (XX) XXX-XX-XX",
+]
+OPERATOR_CODES = ["50", "63", "66", "67", "68", "73", "93", "95", "96", "97", "98", "99", "44", "32"]
+QUOTE_PAIRS = [('"', '"'), ("«", "»"), ("„", "“"), ("“", "”"), ("''", "''"), ("'", "'")]
+
+
+class SyntheticNewsGenerator:
+    """
+    Seeded generator of news-like Ukrainian texts for benchmarks.
+    The same seed and densities always produce the same documents.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        phone_density: float = 0.05,
+        apostrophe_density: float = 0.3,
+        quote_density: float = 0.2,
+        nested_quote_density: float = 0.05,
+        spaced_apostrophe_density: float = 0.02,
+        long_document_ratio: float = 0.02,
+        sentences_per_document: int = 12,
+        sentences_per_long_document: int = 600,
+    ):
+        """
+        Args:
+            seed: Seed of the random generator
+            phone_density: Probability of a phone number in a sentence
+            apostrophe_density: Probability of a word with an apostrophe in a sentence
+            quote_density: Probability of a quotation in a sentence
+            nested_quote_density: Probability of a quotation inside another quotation in a sentence
+            spaced_apostrophe_density: Probability that a word with an apostrophe has spaces around it: «сім ' я»
+            long_document_ratio: Share of long documents
+            sentences_per_document: Average number of sentences in a regular document
+            sentences_per_long_document: Average number of sentences in a long document
+        """
+        self.random = random.Random(seed)
+        self.phone_density = phone_density
+        self.apostrophe_density = apostrophe_density
+        self.quote_density = quote_density
+        self.nested_quote_density = nested_quote_density
+        self.spaced_apostrophe_density = spaced_apostrophe_density
+        self.long_document_ratio = long_document_ratio
+        self.sentences_per_document = sentences_per_document
+        self.sentences_per_long_document = sentences_per_long_document
+
+    def phone(self) -> str:
+        digits = self.random.choice(OPERATOR_CODES) + "".join(self.random.choice("0123456789") for _ in range(7))
+        phone_format = self.random.choice(PHONE_FORMATS)
+
+        # Special numbers have the code in the format, otherwise the first two X are the operator code
+        digits = iter(digits[2:] if "800" in phone_format else digits)
+        return "".join(next(digits) if symbol == "X" else symbol for symbol in phone_format)
+
+    def apostrophe_word(self) -> str:
+        start, end = self.random.choice(APOSTROPHE_WORDS)
+        apostrophe = self.random.choice(Constants.APOSTROPHES)
+
+        if self.random.random() < self.spaced_apostrophe_density:
+            return f"{start} {apostrophe} {end}"
+        return f"{start}{apostrophe}{end}"
+
+    def quotation(self, nested: bool) -> str:
+        quote_open, quote_close = self.random.choice(QUOTE_PAIRS)
+        words = self.words(self.random.randint(1, 4))
+
+        if nested:
+            inner_open, inner_close = self.random.choice(QUOTE_PAIRS)
+            words += f" {inner_open}{self.random.choice(QUOTED_NAMES)}{inner_close}"
+
+        return f"{quote_open}{words}{quote_close}"
+
+    def words(self, count: int) -> str:
+        return " ".join(self.random.choice(WORDS) for _ in range(count))
+
+    def sentence(self) -> str:
+        parts = [self.words(self.random.randint(4, 12))]
+
+        if self.random.random() < self.apostrophe_density:
+            parts.append(self.apostrophe_word())
+        if self.random.random() < self.quote_density:
+            parts.append(self.quotation(nested=self.random.random() < self.nested_quote_density))
+        if self.random.random() < self.phone_density:
+            parts.append(f"телефон {self.phone()}")
+
+        self.random.shuffle(parts)
+        sentence = " ".join(parts)
+        return sentence[0].upper() + sentence[1:] + self.random.choice([".", ".", ".", "!", "?", ":", "..."])
+
+    def document(self) -> str:
+        if self.random.random() < self.long_document_ratio:
+            average = self.sentences_per_long_document
+        else:
+            average = self.sentences_per_document
+
+        count = max(1, int(self.random.gauss(average, average / 4)))
+        return " ".join(self.sentence() for _ in range(count))
+
+    def documents(self, count: int) -> List[str]:
+        return [self.document() for _ in range(count)]
+
+    def stream(self) -> Iterator[str]:
+        while True:
+            yield self.document()
+
+
+if __name__ == "__main__":
+    first = SyntheticNewsGenerator(seed=1).documents(50)
+    second = SyntheticNewsGenerator(seed=1).documents(50)
+    assert first == second, "The same seed must produce the same documents"
+    assert first != SyntheticNewsGenerator(seed=2).documents(50)
+
+    text = " ".join(SyntheticNewsGenerator(seed=3, phone_density=1, apostrophe_density=1, quote_density=1).documents(20))
+    assert any(apostrophe in text for apostrophe in Constants.APOSTROPHES)
+    assert "телефон" in text and any(mark in text for mark in Constants.QUOTATION_MARKS)
+
+    assert "телефон" not in " ".join(SyntheticNewsGenerator(seed=3, phone_density=0).documents(20))
+
+    short_documents = SyntheticNewsGenerator(seed=4, long_document_ratio=0).documents(20)
+    long_documents = SyntheticNewsGenerator(seed=4, long_document_ratio=1).documents(3)
+    assert min(map(len, long_documents)) > 10 * max(map(len, short_documents))
+
+    print("All tests passed!")
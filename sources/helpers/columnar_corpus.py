@@ -0,0 +1,277 @@
+from typing import Callable, Iterator, List, Optional, Sequence
+import os
+
+import pyarrow
+import pyarrow.compute
+import pyarrow.dataset
+import pyarrow.ipc
+import pyarrow.parquet
+
+from sources.helpers.news_index import NewsIndex
+from sources.normalizers.normalization_pipeline import NormalizationPipeline, NormalizerSpec
+from sources.normalizers.triggers import Trigger, detect_batch_triggers
+
+# Columns of a converted corpus. The offset is the byte offset of the news in the text corpus, see NewsIndex,
+# and triggers is the profile of the text, see detect_triggers, for filters that skip the text column
+CORPUS_SCHEMA = pyarrow.schema([
+    ("id", pyarrow.int64()),
+    ("text", pyarrow.string()),
+    ("offset", pyarrow.int64()),
+    ("triggers", pyarrow.int8()),
+])
+
+# Columns of a normalized corpus, warnings and errors are the numbers of them
+NORMALIZED_SCHEMA = pyarrow.schema([
+    ("id", pyarrow.int64()),
+    ("offset", pyarrow.int64()),
+    ("text", pyarrow.string()),
+    ("changed", pyarrow.bool_()),
+    ("warnings", pyarrow.int32()),
+    ("errors", pyarrow.int32()),
+])
+
+# Extensions of the supported formats: Parquet and the Arrow IPC file format
+DATASET_FORMATS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
+
+
+def dataset_format(path: str, format: Optional[str] = None) -> str:
+    """
+    Returns the format of a dataset file, "parquet" or "arrow", by its extension if not given.
+
+    Raises:
+        ValueError: If the format is not supported or cannot be detected
+    """
+    if format is None:
+        format = DATASET_FORMATS.get(os.path.splitext(path)[1].lower())
+
+    if format not in ("parquet", "arrow"):
+        raise ValueError(f"Unknown dataset format of {path}, use .parquet or .arrow!")
+
+    return format
+
+
+class DatasetWriter:
+    """Writes record batches to a Parquet or Arrow IPC file."""
+
+    def __init__(self, path: str, schema: pyarrow.Schema, format: Optional[str] = None, compression: str = "zstd"):
+        """
+        Args:
+            path: Path to the dataset file
+            schema: Schema of the batches
+            format: "parquet" or "arrow", detected by the extension if not given
+            compression: Codec of the columns, "zstd", "lz4" or None, Parquet also supports "snappy" and "gzip"
+        """
+        self.schema = schema
+        self.format = dataset_format(path, format)
+
+        if self.format == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(path, schema, compression=compression or "none")
+        else:
+            options = pyarrow.ipc.IpcWriteOptions(compression=compression)
+            self.writer = pyarrow.ipc.new_file(path, schema, options=options)
+
+    def write(self, batch: pyarrow.RecordBatch):
+        # Every batch becomes a row group of the Parquet file
+        if self.format == "parquet":
+            self.writer.write_table(pyarrow.Table.from_batches([batch], self.schema))
+        else:
+            self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def convert_corpus(
+    corpus_path: str,
+    dataset_path: str,
+    index_path: Optional[str] = None,
+    format: Optional[str] = None,
+    batch_size: int = 100000,
+    compression: str = "zstd",
+) -> int:
+    """
+    Converts a text corpus to a Parquet or Arrow IPC dataset with the columns of CORPUS_SCHEMA,
+    so later runs read record batches instead of parsing the text again.
+
+    Texts are the same as those of read_news_stream and ids are their numbers in the corpus.
+
+    Args:
+        corpus_path: Path to the corpus file with news separated by empty lines
+        dataset_path: Path to write the dataset to
+        index_path: Path to the corpus index, see NewsIndex. Built if it does not exist
+        format: "parquet" or "arrow", detected by the extension if not given
+        batch_size: Number of news in a record batch, or a row group of a Parquet file
+        compression: Codec of the columns, see DatasetWriter
+
+    Returns:
+        int: Number of converted news
+    """
+    with NewsIndex(corpus_path, index_path) as index, DatasetWriter(
+        dataset_path, CORPUS_SCHEMA, format, compression
+    ) as writer:
+        for start in range(0, len(index), batch_size):
+            stop = min(start + batch_size, len(index))
+            texts = list(index.read_range(start, stop))
+
+            writer.write(pyarrow.record_batch([
+                pyarrow.array(range(start, stop), pyarrow.int64()),
+                pyarrow.array(texts, pyarrow.string()),
+                pyarrow.array(index.offsets[start:stop].tolist(), pyarrow.int64()),
+                pyarrow.array([profile.value for profile in detect_batch_triggers(texts)], pyarrow.int8()),
+            ], schema=CORPUS_SCHEMA))
+
+        return len(index)
+
+
+def documents_with(triggers: Trigger) -> pyarrow.dataset.Expression:
+    """
+    Returns a filter of read_batches for the documents with any of the trigger classes,
+    e.g. documents_with(Trigger.PHONE_DIGITS). Only the small triggers column is read to evaluate it.
+    """
+    return pyarrow.compute.bit_wise_and(pyarrow.dataset.field("triggers"), int(triggers)) != 0
+
+
+def documents_matching(pattern: str) -> pyarrow.dataset.Expression:
+    """Returns a filter of read_batches for the documents whose text matches the regular expression, e.g. r"\\d"."""
+    return pyarrow.compute.match_substring_regex(pyarrow.dataset.field("text"), pattern)
+
+
+def read_batches(
+    dataset_path: str,
+    columns: Optional[List[str]] = None,
+    filter: Optional[pyarrow.dataset.Expression] = None,
+    batch_size: int = 10000,
+    format: Optional[str] = None,
+) -> Iterator[pyarrow.RecordBatch]:
+    """
+    Reads a dataset in record batches. Only the requested columns are read, and the filter is pushed down
+    to the scan, so Parquet row groups whose statistics exclude it are skipped.
+
+    Args:
+        dataset_path: Path to a dataset file or a directory of them
+        columns: Columns to read, all if not given
+        filter: Expression that the rows must satisfy, e.g. documents_with(Trigger.PHONE_DIGITS)
+        batch_size: Maximum number of rows in a batch
+        format: "parquet" or "arrow", detected by the extension if not given
+
+    Returns:
+        Iterator[pyarrow.RecordBatch]: Batches in the order of the dataset
+    """
+    if format is None and os.path.isdir(dataset_path):
+        format = next(
+            (DATASET_FORMATS[os.path.splitext(name)[1].lower()] for name in sorted(os.listdir(dataset_path))
+             if os.path.splitext(name)[1].lower() in DATASET_FORMATS),
+            None,
+        )
+    format = dataset_format(dataset_path, format)
+
+    dataset = pyarrow.dataset.dataset(dataset_path, format="parquet" if format == "parquet" else "ipc")
+    yield from dataset.to_batches(columns=columns, filter=filter, batch_size=batch_size)
+
+
+def normalize_dataset(
+    dataset_path: str,
+    output_path: str,
+    normalizers: Optional[Sequence[NormalizerSpec]] = None,
+    filter: Optional[pyarrow.dataset.Expression] = None,
+    batch_size: int = 10000,
+    format: Optional[str] = None,
+    output_format: Optional[str] = None,
+    compression: str = "zstd",
+    progress: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """
+    Normalizes a converted corpus batch by batch and writes the columns of NORMALIZED_SCHEMA:
+    the normalized text, whether it changed and the numbers of warnings and errors.
+
+    Args:
+        dataset_path: Path to the dataset written by convert_corpus
+        output_path: Path to write the normalized dataset to
+        normalizers: Normalizer classes or instances of the pipeline, DEFAULT_NORMALIZERS if not given
+        filter: Expression that the documents to normalize must satisfy, all documents if not given
+        batch_size: Maximum number of documents in a batch
+        format: Format of the input, detected by the extension if not given
+        output_format: Format of the output, detected by the extension if not given
+        compression: Codec of the output columns, see DatasetWriter
+        progress: Called with the number of processed documents after every batch
+
+    Returns:
+        dict: Number of processed and changed documents and of warnings and errors
+    """
+    pipeline = NormalizationPipeline(normalizers)
+    stats = {"documents": 0, "changed": 0, "warnings": 0, "errors": 0}
+
+    with DatasetWriter(output_path, NORMALIZED_SCHEMA, output_format, compression) as writer:
+        for batch in read_batches(dataset_path, ["id", "offset", "text"], filter, batch_size, format):
+            originals = batch.column("text").to_pylist()
+            result = pipeline.normalize_batch(originals)
+
+            changed = [text != original for text, original in zip(result.texts, originals)]
+            warnings = [end - start for start, end in zip(result.warning_offsets, result.warning_offsets[1:])]
+            errors = [end - start for start, end in zip(result.error_offsets, result.error_offsets[1:])]
+
+            writer.write(pyarrow.record_batch([
+                batch.column("id"),
+                batch.column("offset"),
+                pyarrow.array(result.texts, pyarrow.string()),
+                pyarrow.array(changed, pyarrow.bool_()),
+                pyarrow.array(warnings, pyarrow.int32()),
+                pyarrow.array(errors, pyarrow.int32()),
+            ], schema=NORMALIZED_SCHEMA))
+
+            stats["documents"] += len(originals)
+            stats["changed"] += sum(changed)
+            stats["warnings"] += len(result.warnings)
+            stats["errors"] += len(result.errors)
+
+            if progress:
+                progress(stats["documents"])
+
+    return stats
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from sources.helpers.read_news_stream import read_news_stream
+
+    news = ["Сім ` я", "''Дерево'', прем`єр", "Телефон: 099 123 45 67", "У 2023 році", "'Він!' - сказав він"]
+    expected_news = ["Сімʼя", "«Дерево», премʼєр", "Телефон: +380 (99) 123-45-67", "У 2023 році", "«Він!» - сказав він"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        corpus_path = os.path.join(directory, "corpus.txt")
+        with open(corpus_path, "w", encoding="utf-8") as file:
+            file.write("\n\n".join(news))
+
+        for extension in [".parquet", ".arrow"]:
+            dataset_path = os.path.join(directory, "corpus" + extension)
+            assert convert_corpus(corpus_path, dataset_path, batch_size=2) == len(news)
+
+            table = pyarrow.Table.from_batches(read_batches(dataset_path))
+            assert table.column("text").to_pylist() == list(read_news_stream(corpus_path))
+            assert table.column("id").to_pylist() == list(range(len(news)))
+            assert table.column("offset").to_pylist()[:2] == [0, len("Сім ` я\n\n".encode("utf-8"))]
+
+            phones = pyarrow.Table.from_batches(read_batches(dataset_path, ["id"], documents_with(Trigger.PHONE_DIGITS)))
+            assert phones.column("id").to_pylist() == [2]
+            digits = pyarrow.Table.from_batches(read_batches(dataset_path, ["id"], documents_matching(r"\d")))
+            assert digits.column("id").to_pylist() == [2, 3]
+
+            output_path = os.path.join(directory, "normalized" + extension)
+            stats = normalize_dataset(dataset_path, output_path, batch_size=2)
+            assert stats == {"documents": 5, "changed": 4, "warnings": 0, "errors": 0}, stats
+
+            normalized = pyarrow.Table.from_batches(read_batches(output_path))
+            assert normalized.column("text").to_pylist() == expected_news
+            assert normalized.column("changed").to_pylist() == [True, True, True, False, True]
+
+            stats = normalize_dataset(dataset_path, output_path, filter=documents_with(Trigger.APOSTROPHE))
+            assert stats["documents"] == 3, stats
+
+    print("All tests passed!")
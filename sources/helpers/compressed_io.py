@@ -0,0 +1,273 @@
+from typing import IO, Iterable, Iterator, Optional, TypeVar
+import bz2
+import gzip
+import io
+import lzma
+import os
+import queue
+import re
+import threading
+
+T = TypeVar("T")
+
+# First bytes of the files of every supported compression format. For bz2 the whole stream header is matched:
+# "BZh", the block size digit and the magic of the first block or of the end of an empty stream,
+# because text can start with "BZh" too, e.g. "BZhytomyr"
+COMPRESSION_MAGIC = {
+    "gzip": re.compile(rb"\x1f\x8b"),
+    "bz2": re.compile(rb"BZh[1-9](?:\x31\x41\x59\x26\x53\x59|\x17\x72\x45\x38\x50\x90)"),
+    "xz": re.compile(rb"\xfd7zXZ\x00"),
+    "zstd": re.compile(rb"\x28\xb5\x2f\xfd"),
+}
+# Number of first bytes that detect_compression reads
+COMPRESSION_HEADER_SIZE = 10
+
+COMPRESSION_EXTENSIONS = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz", ".zst": "zstd"}
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """Returns the compression format of an existing file by its first bytes, or None for an uncompressed file."""
+    with open(path, "rb") as file:
+        head = file.read(COMPRESSION_HEADER_SIZE)
+
+    for compression, magic in COMPRESSION_MAGIC.items():
+        if magic.match(head):
+            return compression
+
+    return None
+
+
+def compression_by_extension(path: str) -> Optional[str]:
+    """Returns the compression format of a file by its extension, e.g. "gzip" for corpus.txt.gz, or None."""
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def resolve_compression(path: str, mode: str) -> Optional[str]:
+    """
+    Returns the compression format of a file by its first bytes for reading and by its extension for writing.
+    A file opened for reading and writing, e.g. an output resumed with "r+", is treated as written.
+    """
+    if mode.startswith("r") and "+" not in mode:
+        return detect_compression(path)
+
+    return compression_by_extension(path)
+
+
+def open_compressed(path: str, mode: str = "rb", compression: Optional[str] = None, level: Optional[int] = None) -> IO:
+    """
+    Opens a file in binary mode, decompressing it on reading and compressing it on writing.
+
+    Args:
+        path: Path to the file
+        mode: "rb", "wb" or "ab"
+        compression: "gzip", "bz2", "xz", "zstd" or None for no compression. If not given, detected by the first bytes
+            of the file for reading and by the extension for writing
+        level: Compression level of the format, its default if not given
+
+    Returns:
+        IO: Binary file object
+
+    Raises:
+        ValueError: If the compression format is not supported
+        ImportError: If the format is zstd and the zstandard package is not installed
+    """
+    if compression is None:
+        compression = resolve_compression(path, mode)
+
+    options = {} if level is None else {"preset" if compression == "xz" else "compresslevel": level}
+
+    if compression is None:
+        return open(path, mode)
+    if compression == "gzip":
+        return gzip.open(path, mode, **options)
+    if compression == "bz2":
+        return bz2.open(path, mode, **options)
+    if compression == "xz":
+        return lzma.open(path, mode, **options)
+    if compression == "zstd":
+        import zstandard
+
+        file = open(path, mode)
+        if mode.startswith("r"):
+            return zstandard.ZstdDecompressor().stream_reader(file, closefd=True, read_across_frames=True)
+        return zstandard.ZstdCompressor(level=3 if level is None else level).stream_writer(file, closefd=True)
+
+    raise ValueError(f"Unknown compression format {compression}!")
+
+
+def open_text(path: str, mode: str = "r", compression: Optional[str] = None, level: Optional[int] = None) -> IO[str]:
+    """
+    Opens a possibly compressed file in UTF-8 text mode with the line break handling of open().
+
+    Args:
+        path: Path to the file
+        mode: "r", "w" or "a"
+        compression: Compression format, detected if not given, see open_compressed
+        level: Compression level of the format, its default if not given
+
+    Returns:
+        IO[str]: Text file object
+    """
+    if compression is None:
+        compression = resolve_compression(path, mode)
+
+    if compression is None:
+        return open(path, mode, encoding="utf-8")
+
+    return io.TextIOWrapper(open_compressed(path, mode + "b", compression, level), encoding="utf-8")
+
+
+class BackgroundFailure:
+    """Exception raised by the background thread, passed to the consumer."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+END_OF_ITEMS = object()
+
+
+def iterate_in_background(
+    items: Iterable[T], max_pending_batches: int = 16, batch_size: int = 256, name: str = "background reader"
+) -> Iterator[T]:
+    """
+    Iterates over the items in a background thread, so reading, decompression and decoding overlap with the work
+    of the consumer. Items are passed in batches through a bounded queue, which limits the memory when the
+    consumer is slower. Exceptions of the iteration are raised in the consumer.
+
+    Decompression and file reads release the GIL, so they run in parallel with the consumer.
+
+    Args:
+        items: Iterable to read in the background, e.g. read_news_stream(path)
+        max_pending_batches: Maximum number of batches waiting for the consumer
+        batch_size: Number of items passed through the queue at once
+        name: Name of the thread
+
+    Returns:
+        Iterator[T]: The items in their order
+    """
+    batches = queue.Queue(max_pending_batches)
+    stopped = threading.Event()
+
+    def put(value) -> bool:
+        # Gives up when the consumer stops iterating, so the thread never blocks on a full queue forever
+        while not stopped.is_set():
+            try:
+                batches.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(items)
+        try:
+            batch = []
+            for item in iterator:
+                batch.append(item)
+                if len(batch) == batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch and not put(batch):
+                return
+            put(END_OF_ITEMS)
+        except BaseException as error:
+            put(BackgroundFailure(error))
+        finally:
+            # Generators are closed in the thread that runs them, which closes their files
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            batch = batches.get()
+            if batch is END_OF_ITEMS:
+                return
+            if isinstance(batch, BackgroundFailure):
+                raise batch.error
+            yield from batch
+    finally:
+        stopped.set()
+        thread.join()
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    text = "Перша новина\r\n\r\nДруга новина\n" * 100
+
+    with tempfile.TemporaryDirectory() as directory:
+        extensions = ["", ".gz", ".bz2", ".xz"]
+        try:
+            import zstandard
+            extensions.append(".zst")
+        except ImportError:
+            pass
+
+        for extension in extensions:
+            path = os.path.join(directory, "empty.txt" + extension)
+            with open_text(path, "w") as file:
+                pass
+            assert detect_compression(path) == compression_by_extension(path)
+
+            path = os.path.join(directory, "corpus.txt" + extension)
+            with open_text(path, "w", level=1) as file:
+                file.write(text)
+
+            assert detect_compression(path) == compression_by_extension(path)
+            with open_text(path) as file:
+                assert file.read() == text.replace("\r\n", "\n")
+
+            # The format is detected by the content, not by the name
+            renamed = os.path.join(directory, "renamed" + extension)
+            os.replace(path, renamed + ".txt")
+            with open_text(renamed + ".txt") as file:
+                assert file.read() == text.replace("\r\n", "\n")
+
+        # Text that starts like a compression header is not taken for a compressed file
+        path = os.path.join(directory, "plain.txt")
+        for start in ["BZhytomyr", "BZh9", "\x1f"]:
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(start + " новина")
+            assert detect_compression(path) is None
+            with open_text(path) as file:
+                assert file.read() == start + " новина"
+            with open_text(path, "r+") as file:
+                assert file.read() == start + " новина"
+
+    assert list(iterate_in_background(range(1000), max_pending_batches=2, batch_size=7)) == list(range(1000))
+    assert list(iterate_in_background([])) == []
+
+    def failing():
+        yield 1
+        raise OSError("broken file")
+
+    try:
+        list(iterate_in_background(failing()))
+    except OSError as error:
+        assert str(error) == "broken file"
+    else:
+        raise AssertionError("The error of the background thread should be raised")
+
+    closed = []
+
+    def endless():
+        try:
+            number = 0
+            while True:
+                yield number
+                number += 1
+        finally:
+            closed.append(True)
+
+    stream = iterate_in_background(endless(), max_pending_batches=1, batch_size=10)
+    assert [next(stream) for _ in range(25)] == list(range(25))
+    stream.close()
+    assert closed == [True]
+
+    print("All tests passed!")
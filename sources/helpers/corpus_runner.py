@@ -0,0 +1,618 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from collections import deque
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Tuple, Sequence, Optional, Callable
+import json
+import multiprocessing
+import os
+import threading
+
+from sources.helpers.news_index import NewsIndex
+from sources.helpers.compressed_io import compression_by_extension, open_text
+from sources.helpers.read_news_stream import read_news_stream
+from sources.normalizers.budget import DocumentBudget
+from sources.normalizers.normalization_cache import NormalizationCache
+from sources.normalizers.normalization_pipeline import NormalizationPipeline, NormalizerSpec
+from sources.normalizers.profiling import NormalizationProfiler
+
+Result = Tuple[str, List[str], List[str]]
+ChunkResult = Tuple[List[Tuple[Optional[str], List[str], List[str]]], Optional[NormalizationProfiler]]
+
+# Worker pools: "process" runs the chunks in worker processes, "thread" in threads of this process,
+# which share the compiled patterns and the cache without pickling, and scale on free-threaded CPython
+BACKENDS = ["process", "thread"]
+
+# State of the current worker, a process or a thread, created once by init_worker:
+# pipeline, the normalization pipeline of the worker,
+# slowest_documents, the number of the slowest documents kept by the profiler of every chunk, None if disabled,
+# indexes, the corpus indexes opened by the worker, by (corpus path, index path)
+worker_state = threading.local()
+
+
+def process_context() -> multiprocessing.context.BaseContext:
+    """
+    Returns the multiprocessing context of worker processes. A forked worker inherits the locks held by the threads
+    of the parent, e.g. the background reader of a compressed corpus, and can deadlock on them, so workers are
+    started by a fork server where the platform has one and spawned otherwise.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+
+    context = multiprocessing.get_context("forkserver")
+    # The server imports the runner and the normalizers once, and workers are forked from it with compiled patterns
+    context.set_forkserver_preload([NormalizationPipeline.__module__, __name__])
+    return context
+
+
+def init_worker(
+    normalizers: Optional[Sequence[NormalizerSpec]],
+    slowest_documents: Optional[int] = None,
+    cache: Optional[NormalizationCache] = None,
+    budget: Optional[DocumentBudget] = None,
+):
+    """
+    Creates the normalization pipeline of a worker. Worker processes get their own copy of the cache,
+    worker threads share it. Normalizer instances are immutable, so threads share them too.
+    """
+    worker_state.pipeline = NormalizationPipeline(normalizers, cache=cache, budget=budget)
+    worker_state.slowest_documents = slowest_documents
+    worker_state.indexes = {}
+
+
+def normalize_chunk(texts: List[str], first_index: int = 0) -> ChunkResult:
+    """
+    Normalizes a chunk of documents in a worker.
+    Unchanged texts are returned as None, so they are not sent back to the main process.
+    If profiling is enabled, also returns the profiler of the chunk with documents numbered from first_index.
+    """
+    pipeline = worker_state.pipeline
+    profiler = None
+    if worker_state.slowest_documents is not None:
+        profiler = pipeline.profiler = NormalizationProfiler(worker_state.slowest_documents)
+        profiler.next_document = first_index
+
+    results = []
+    for text in texts:
+        output, warnings, errors = pipeline.normalize(text)
+        results.append((None if output == text else output, warnings, errors))
+
+    if pipeline.cache is not None:
+        # Makes the new results visible to the other workers and keeps them if the pool is shut down
+        pipeline.cache.commit()
+
+    return results, profiler
+
+
+def edit_chunk(texts: List[str], first_index: int = 0) -> ChunkResult:
+    """
+    Normalizes a chunk of documents in a worker and returns their edits instead of the normalized texts,
+    see NormalizationPipeline.normalize_edits.
+    """
+    return [worker_state.pipeline.normalize_edits(text) for text in texts], None
+
+
+def worker_index(corpus_path: str, index_path: Optional[str]) -> NewsIndex:
+    """Returns the index of a corpus opened by the current worker, opening it on first use."""
+    key = (corpus_path, index_path)
+    indexes = worker_state.indexes
+    if key not in indexes:
+        indexes[key] = NewsIndex(corpus_path, index_path)
+
+    return indexes[key]
+
+
+def normalize_index_range(corpus_path: str, index_path: Optional[str], start: int, stop: int) -> ChunkResult:
+    """
+    Reads the documents from start to stop straight from the indexed corpus and normalizes them in a worker,
+    so only the document numbers are sent to the worker.
+    """
+    return normalize_chunk(list(worker_index(corpus_path, index_path).read_range(start, stop)), start)
+
+
+def read_chunks(texts: Iterable[str], chunk_size: int) -> Iterator[List[str]]:
+    """Groups a stream of documents into lists of chunk_size documents."""
+    iterator = iter(texts)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def normalize_stream(
+    texts: Iterable[str],
+    normalizers: Optional[Sequence[NormalizerSpec]] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = 1000,
+    max_pending_chunks: Optional[int] = None,
+    ordered: bool = True,
+    profiler: Optional[NormalizationProfiler] = None,
+    cache: Optional[NormalizationCache] = None,
+    edits: bool = False,
+    backend: str = "process",
+    budget: Optional[DocumentBudget] = None,
+) -> Iterator[Tuple[int, str, Result]]:
+    """
+    Normalizes a stream of documents on a pool of worker processes.
+
+    Documents are read in chunks of chunk_size and at most max_pending_chunks chunks are in flight at once,
+    so memory stays bounded no matter how fast the input can be read.
+
+    Args:
+        texts: Stream of documents, e.g. read_news_stream(corpus_path)
+        normalizers: Normalizer classes or instances of the pipeline, DEFAULT_NORMALIZERS if not given
+        workers: Number of worker processes or threads, os.cpu_count() if not given. With 1 worker runs in this process
+        chunk_size: Number of documents sent to a worker at once
+        max_pending_chunks: Maximum number of chunks in flight, twice the number of workers if not given
+        ordered: Whether to yield the results in the input order or as soon as they are ready
+        profiler: Collects the timings of all workers, with documents numbered from its next_document
+        cache: Cache of the stage results. Every worker gets an empty copy, so the cache needs a path
+            to share results between workers
+        edits: Whether to return the edits of every document instead of the normalized text,
+            see NormalizationPipeline.normalize_edits. Edits are neither profiled nor cached
+        backend: "process" for a pool of worker processes, "thread" for a pool of threads, see BACKENDS
+        budget: Length and time limits of a document, documents over them are passed through with an error
+
+    Returns:
+        Iterator[Tuple[int, str, Result]]: Document index in the input, the document and its normalization result,
+            or its edits, warnings and errors
+    """
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        pipeline = NormalizationPipeline(normalizers, profiler, cache, budget)
+        normalize = pipeline.normalize_edits if edits else pipeline.normalize
+        for index, text in enumerate(texts):
+            yield index, text, normalize(text)
+        return
+
+    first_document = profiler.next_document if profiler else 0
+    documents = 0
+
+    def tasks():
+        nonlocal documents
+        for chunk in read_chunks(texts, chunk_size):
+            yield documents, chunk, edit_chunk if edits else normalize_chunk, (chunk, first_document + documents)
+            documents += len(chunk)
+
+    results = run_pool(tasks(), normalizers, workers, max_pending_chunks, ordered, profiler, cache, backend, budget)
+    for first_index, chunk, chunk_results in results:
+        for offset, (text, (output, warnings, errors)) in enumerate(zip(chunk, chunk_results)):
+            if not edits and output is None:
+                output = text
+            yield first_index + offset, text, (output, warnings, errors)
+
+    if profiler:
+        profiler.next_document = first_document + documents
+
+
+def normalize_indexed(
+    corpus_path: str,
+    index_path: Optional[str] = None,
+    start: int = 0,
+    stop: Optional[int] = None,
+    normalizers: Optional[Sequence[NormalizerSpec]] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = 1000,
+    max_pending_chunks: Optional[int] = None,
+    ordered: bool = True,
+    profiler: Optional[NormalizationProfiler] = None,
+    cache: Optional[NormalizationCache] = None,
+    backend: str = "process",
+    budget: Optional[DocumentBudget] = None,
+) -> Iterator[Tuple[int, str, Result]]:
+    """
+    Normalizes the documents from start to stop of an indexed corpus on a pool of worker processes.
+
+    Unlike normalize_stream, workers read their chunks straight from the memory-mapped corpus, so only
+    document numbers and changed documents pass between the processes. Any slice of the corpus can be
+    processed, e.g. to retry a failed region.
+
+    Args:
+        corpus_path: Path to the corpus file with news separated by empty lines
+        index_path: Path to the corpus index, see NewsIndex
+        start: Number of the first document to normalize
+        stop: Number of the document to stop before, the end of the corpus if not given
+        normalizers: Normalizer classes or instances of the pipeline, DEFAULT_NORMALIZERS if not given
+        workers: Number of worker processes or threads, os.cpu_count() if not given. With 1 worker runs in this process
+        chunk_size: Number of documents read by a worker at once
+        max_pending_chunks: Maximum number of chunks in flight, twice the number of workers if not given
+        ordered: Whether to yield the results in the input order or as soon as they are ready
+        profiler: Collects the timings of all workers, with documents numbered by their number in the corpus
+        cache: Cache of the stage results, see normalize_stream
+        backend: "process" for a pool of worker processes, "thread" for a pool of threads, see BACKENDS
+        budget: Length and time limits of a document, see normalize_stream
+
+    Returns:
+        Iterator[Tuple[int, str, Result]]: Document number in the corpus, the document and its normalization result
+    """
+    workers = workers or os.cpu_count() or 1
+
+    with NewsIndex(corpus_path, index_path) as index:
+        stop = len(index) if stop is None else min(stop, len(index))
+        if profiler:
+            profiler.next_document = start
+
+        if workers == 1:
+            pipeline = NormalizationPipeline(normalizers, profiler, cache, budget)
+            for number in range(start, stop):
+                text = index.read(number)
+                yield number, text, pipeline.normalize(text)
+            return
+
+        def tasks():
+            for first in range(start, stop, chunk_size):
+                last = min(first + chunk_size, stop)
+                yield first, range(first, last), normalize_index_range, (corpus_path, index_path, first, last)
+
+        results = run_pool(
+            tasks(), normalizers, workers, max_pending_chunks, ordered, profiler, cache, backend, budget
+        )
+        for _, numbers, chunk_results in results:
+            for number, (output, warnings, errors) in zip(numbers, chunk_results):
+                text = index.read(number)
+                yield number, text, (text if output is None else output, warnings, errors)
+
+        if profiler:
+            profiler.next_document = stop
+
+
+def run_pool(
+    tasks: Iterable[Tuple[int, Any, Callable, tuple]],
+    normalizers: Optional[Sequence[NormalizerSpec]],
+    workers: int,
+    max_pending_chunks: Optional[int],
+    ordered: bool,
+    profiler: Optional[NormalizationProfiler] = None,
+    cache: Optional[NormalizationCache] = None,
+    backend: str = "process",
+    budget: Optional[DocumentBudget] = None,
+) -> Iterator[Tuple[int, Any, List[Tuple[Optional[str], List[str], List[str]]]]]:
+    """
+    Runs chunk tasks (index of the first document, chunk, worker function, arguments) on a pool of worker processes
+    or threads with at most max_pending_chunks tasks in flight,
+    and yields (index of the first document, chunk, results).
+    If a profiler is given, workers profile every chunk and their profilers are merged into it.
+    If a cache is given, every worker process normalizes through its own copy of it, worker threads share it.
+    If a budget is given, the pipelines of the workers pass documents over it through with an error.
+    Worker processes are not forked, see process_context, so the normalizers, the cache and the budget are pickled.
+
+    Raises:
+        ValueError: If the backend is not one of BACKENDS
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, use {' or '.join(BACKENDS)}!")
+
+    max_pending_chunks = max_pending_chunks or 2 * workers
+    slowest_documents = profiler.slowest_documents if profiler else None
+    options = {"initializer": init_worker, "initargs": (normalizers, slowest_documents, cache, budget)}
+    if backend == "process":
+        pool = ProcessPoolExecutor
+        options["mp_context"] = process_context()
+    else:
+        pool = ThreadPoolExecutor
+
+    def chunk_results(future):
+        results, chunk_profiler = future.result()
+        if profiler:
+            profiler.merge(chunk_profiler)
+        return results
+
+    with pool(workers, **options) as executor:
+        # (index of the first document, chunk, future) in the submission order
+        pending = deque()
+
+        def completed():
+            if ordered:
+                return pending.popleft()
+
+            done, _ = wait([future for _, _, future in pending], return_when=FIRST_COMPLETED)
+            position = next(position for position, (_, _, future) in enumerate(pending) if future in done)
+            task = pending[position]
+            del pending[position]
+            return task
+
+        for first_index, chunk, function, arguments in tasks:
+            while len(pending) >= max_pending_chunks:
+                first, done_chunk, future = completed()
+                yield first, done_chunk, chunk_results(future)
+
+            pending.append((first_index, chunk, executor.submit(function, *arguments)))
+
+        while pending:
+            first, done_chunk, future = completed()
+            yield first, done_chunk, chunk_results(future)
+
+
+def load_checkpoint(checkpoint_path: str, corpus_path: str) -> Optional[dict]:
+    """
+    Reads the checkpoint of an interrupted run_corpus call.
+
+    Returns:
+        Optional[dict]: The checkpoint or None if there is no checkpoint file
+
+    Raises:
+        ValueError: If the checkpoint was written for another corpus or another version of it
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+
+    with open(checkpoint_path, encoding="utf-8") as file:
+        checkpoint = json.load(file)
+
+    if checkpoint["corpus"] != os.path.abspath(corpus_path) or checkpoint["corpus_size"] != os.path.getsize(corpus_path):
+        raise ValueError(f"{checkpoint_path} was written for another corpus!")
+
+    return checkpoint
+
+
+def save_checkpoint(checkpoint_path: str, checkpoint: dict):
+    """Atomically replaces the checkpoint file, so an interrupted write never leaves a damaged checkpoint."""
+    temporary_path = checkpoint_path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temporary_path, checkpoint_path)
+
+
+def run_corpus(
+    corpus_path: str,
+    output_path: str,
+    report_path: Optional[str] = None,
+    normalizers: Optional[Sequence[NormalizerSpec]] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = 1000,
+    max_pending_chunks: Optional[int] = None,
+    ordered: bool = True,
+    progress: Optional[Callable[[int], None]] = None,
+    index_path: Optional[str] = None,
+    checkpoint_path: Optional[str] = None,
+    checkpoint_every: int = 100000,
+    profile_path: Optional[str] = None,
+    slowest_documents: int = 10,
+    cache_path: Optional[str] = None,
+    cache_entries: int = 100000,
+    compression_level: Optional[int] = None,
+    backend: str = "process",
+    budget: Optional[DocumentBudget] = None,
+) -> dict:
+    """
+    Normalizes a news corpus and writes the result to disk.
+
+    The output has the same format as the corpus: documents separated by empty lines. A corpus compressed with gzip,
+    bz2, xz or zstd is decompressed in a background thread while the documents are normalized, and the output
+    is compressed if its extension is .gz, .bz2, .xz or .zst. Documents with warnings
+    or errors are written to the report as JSON lines with the document index in the corpus.
+
+    With a checkpoint path, the number of written documents, the statistics and the positions of the flushed
+    output and report are saved every checkpoint_every documents. If the checkpoint exists when the run starts,
+    the output and report are cut back to the saved positions and the run continues after the last saved document,
+    so the final output and statistics are identical to those of an uninterrupted run.
+    The checkpoint is removed when the run finishes.
+
+    Args:
+        corpus_path: Path to the corpus file with news separated by empty lines, possibly compressed
+        output_path: Path to write the normalized corpus to, compressed by its extension
+        report_path: Path to write warnings and errors to, output_path + ".report.jsonl" if not given
+        normalizers: Normalizer classes or instances of the pipeline, DEFAULT_NORMALIZERS if not given
+        workers: Number of worker processes or threads, os.cpu_count() if not given
+        chunk_size: Number of documents sent to a worker at once
+        max_pending_chunks: Maximum number of chunks in flight, twice the number of workers if not given
+        ordered: Whether to write the documents in the corpus order or as soon as they are ready
+        progress: Called with the number of processed documents after every chunk
+        index_path: Path to the corpus index. If given, workers read the corpus through the index, see normalize_indexed
+        checkpoint_path: Path to save the progress to and resume from
+        checkpoint_every: Number of documents between checkpoints
+        profile_path: Path to write the timings of stages, phone patterns and the slowest documents to as JSON,
+            see NormalizationProfiler. A resumed run profiles only the documents after the checkpoint
+        slowest_documents: Number of the slowest documents in the profile
+        cache_path: Path to the SQLite database of cached stage results shared by the workers and kept between runs,
+            see NormalizationCache. After a rule change only the stages with changed rules are run again
+        cache_entries: Number of cached results kept in the memory of every worker
+        compression_level: Compression level of the output, the default of the format if not given
+        backend: "process" for a pool of worker processes, "thread" for a pool of threads, see BACKENDS
+        budget: Length and time limits of a document, documents over them are written unchanged
+            and reported with an error, see DocumentBudget
+
+    Returns:
+        dict: Number of processed and changed documents and of warnings and errors
+
+    Raises:
+        ValueError: If checkpoints are requested for an unordered run or a compressed output,
+            or the checkpoint belongs to another corpus
+    """
+    if checkpoint_path and not ordered:
+        raise ValueError("Checkpoints require the documents to be written in the corpus order!")
+    if checkpoint_path and compression_by_extension(output_path):
+        raise ValueError("Checkpoints require an uncompressed output, which can be cut back to a saved position!")
+
+    report_path = report_path or output_path + ".report.jsonl"
+    stats = {"documents": 0, "changed": 0, "warnings": 0, "errors": 0}
+    checkpoint = load_checkpoint(checkpoint_path, corpus_path) if checkpoint_path else None
+    mode = "r+" if checkpoint else "w"
+    profiler = NormalizationProfiler(slowest_documents) if profile_path else None
+    cache = NormalizationCache(cache_entries, path=cache_path) if cache_path else None
+
+    with open_text(output_path, mode, level=compression_level) as output, \
+            open(report_path, mode, encoding="utf-8") as report:
+        if checkpoint:
+            stats = checkpoint["stats"]
+            for file, position in [(output, checkpoint["output_position"]), (report, checkpoint["report_position"])]:
+                file.seek(position)
+                file.truncate()
+
+        start = stats["documents"]
+        if index_path:
+            results = normalize_indexed(
+                corpus_path, index_path, start, None, normalizers, workers, chunk_size, max_pending_chunks, ordered,
+                profiler, cache, backend, budget,
+            )
+        else:
+            if profiler:
+                profiler.next_document = start
+            results = normalize_stream(
+                islice(read_news_stream(corpus_path, background=True), start, None),
+                normalizers, workers, chunk_size, max_pending_chunks, ordered, profiler, cache, backend=backend,
+                budget=budget,
+            )
+            results = ((start + index, original, result) for index, original, result in results)
+
+        for index, original, (text, warnings, errors) in results:
+            output.write(text)
+            output.write("\n\n")
+
+            if warnings or errors:
+                report.write(json.dumps({"document": index, "warnings": warnings, "errors": errors}, ensure_ascii=False))
+                report.write("\n")
+
+            stats["documents"] += 1
+            stats["changed"] += text != original
+            stats["warnings"] += len(warnings)
+            stats["errors"] += len(errors)
+
+            if progress and stats["documents"] % chunk_size == 0:
+                progress(stats["documents"])
+
+            if checkpoint_path and stats["documents"] % checkpoint_every == 0:
+                output.flush()
+                report.flush()
+                os.fsync(output.fileno())
+                os.fsync(report.fileno())
+                save_checkpoint(checkpoint_path, {
+                    "corpus": os.path.abspath(corpus_path),
+                    "corpus_size": os.path.getsize(corpus_path),
+                    "stats": stats,
+                    "output_position": output.tell(),
+                    "report_position": report.tell(),
+                })
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    if profiler:
+        profiler.save(profile_path)
+
+    if cache:
+        cache.close()
+
+    return stats
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    news = ["Сім ` я", "''Дерево'', прем`єр", "Телефон: 099 123 45 67", "У 2023 році", "'Він!' - сказав він"]
+    expected_news = ["Сімʼя", "«Дерево», премʼєр", "Телефон: +380 (99) 123-45-67", "У 2023 році", "«Він!» - сказав він"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        corpus_path = os.path.join(directory, "corpus.txt")
+        output_path = os.path.join(directory, "output.txt")
+
+        with open(corpus_path, "w", encoding="utf-8") as corpus:
+            corpus.write("\n\n".join(news * 10))
+
+        index_path = os.path.join(directory, "corpus.txt.index")
+        for workers, ordered, index, backend in [
+            (1, True, None, "process"), (2, True, None, "process"), (2, False, None, "process"),
+            (1, True, index_path, "process"), (2, True, index_path, "process"), (2, False, index_path, "process"),
+            (4, True, None, "thread"), (3, False, index_path, "thread"),
+        ]:
+            stats = run_corpus(corpus_path, output_path, workers=workers, chunk_size=3, ordered=ordered,
+                               index_path=index, backend=backend)
+            output = list(read_news_stream(output_path))
+
+            assert stats == {"documents": 50, "changed": 40, "warnings": 0, "errors": 0}, stats
+            if ordered:
+                assert output == expected_news * 10, output
+            else:
+                assert sorted(output) == sorted(expected_news * 10), output
+
+        compressed_path = os.path.join(directory, "corpus.txt.xz")
+        with open_text(compressed_path, "w") as corpus:
+            corpus.write("\n\n".join(news * 10))
+        stats = run_corpus(compressed_path, output_path + ".gz", workers=1, chunk_size=3, compression_level=1)
+        assert stats["documents"] == 50 and list(read_news_stream(output_path + ".gz")) == expected_news * 10
+
+        checkpoint_path = os.path.join(directory, "checkpoint.json")
+        quotes_path = os.path.join(directory, "quotes.txt")
+        with open(quotes_path, "w", encoding="utf-8") as corpus:
+            corpus.write("\n\n".join(["„так“ і 'ні", "' і „", "''Дерево''"] * 10))
+
+        def read_files():
+            with open(output_path, "rb") as output, open(output_path + ".report.jsonl", "rb") as report:
+                return output.read(), report.read()
+
+        def interrupt_after(limit):
+            def progress(documents):
+                if documents >= limit:
+                    raise KeyboardInterrupt
+            return progress
+
+        for path, index in [(corpus_path, None), (quotes_path, None), (corpus_path, index_path)]:
+            expected_stats = run_corpus(path, output_path, workers=1)
+            expected_files = read_files()
+
+            for limit in [4, 17, 23]:
+                try:
+                    run_corpus(path, output_path, workers=2, chunk_size=1, progress=interrupt_after(limit),
+                               index_path=index, checkpoint_path=checkpoint_path, checkpoint_every=5)
+                except KeyboardInterrupt:
+                    pass
+                assert os.path.exists(checkpoint_path) == (limit >= 5)
+
+            stats = run_corpus(path, output_path, workers=2, chunk_size=3, index_path=index,
+                               checkpoint_path=checkpoint_path, checkpoint_every=5)
+            assert stats == expected_stats, stats
+            assert read_files() == expected_files
+            assert not os.path.exists(checkpoint_path)
+
+        profile_path = os.path.join(directory, "profile.json")
+        for workers, index, backend in [(1, None, "process"), (2, None, "process"), (2, index_path, "process"),
+                                        (3, index_path, "thread")]:
+            run_corpus(corpus_path, output_path, workers=workers, chunk_size=3, index_path=index,
+                       profile_path=profile_path, slowest_documents=4, backend=backend)
+            with open(profile_path, encoding="utf-8") as file:
+                profile = json.load(file)
+
+            assert profile["documents"]["calls"] == 50, profile["documents"]
+            assert profile["stages"]["UkrainianPhoneNormalizer"]["calls"] == 10, profile["stages"]
+            assert sum(rule["calls"] for rule in profile["rules"].values()) >= 10, profile["rules"]
+            slowest = profile["slowest_documents"]
+            assert len(slowest) == 4 and all(0 <= entry["document"] < 50 for entry in slowest), slowest
+            assert len({entry["document"] for entry in slowest}) == 4, slowest
+
+        cache_path = os.path.join(directory, "cache.sqlite")
+        expected_stats = run_corpus(corpus_path, output_path, workers=1)
+        expected_files = read_files()
+        for workers, index, backend in [(2, None, "process"), (2, index_path, "process"), (1, None, "process"),
+                                        (4, None, "thread")]:
+            stats = run_corpus(corpus_path, output_path, workers=workers, chunk_size=3, index_path=index,
+                               cache_path=cache_path, backend=backend)
+            assert stats == expected_stats, stats
+            assert read_files() == expected_files
+
+        cache = NormalizationCache(path=cache_path)
+        pipeline = NormalizationPipeline(cache=cache)
+        assert [pipeline.normalize(text)[0] for text in news] == expected_news
+        assert cache.misses == 0 and cache.stored_hits > 0, cache.stats()
+        cache.close()
+
+        # Documents longer than the budget are written unchanged and reported with an error
+        budget = DocumentBudget(max_length=15)
+        for workers, index in [(1, None), (2, None), (2, index_path)]:
+            stats = run_corpus(corpus_path, output_path, workers=workers, chunk_size=3, index_path=index, budget=budget)
+            assert stats == {"documents": 50, "changed": 10, "warnings": 0, "errors": 30}, stats
+            assert list(read_news_stream(output_path)) == ([expected_news[0]] + news[1:]) * 10
+            with open(output_path + ".report.jsonl", encoding="utf-8") as report:
+                assert json.loads(report.readline())["errors"] == [budget.length_error]
+
+        try:
+            run_corpus(corpus_path, output_path, workers=2, backend="fiber")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("An unknown backend should be rejected")
+
+    print("All tests passed!")
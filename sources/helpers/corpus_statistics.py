@@ -0,0 +1,676 @@
+from array import array
+from collections import Counter
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import json
+import math
+
+from sources.helpers.format_phone_number import decode_phone_format, encode_phone_format, format_phone_number
+from sources.helpers.unicode import unicode
+from sources.normalizers.abstract_normalizer import AbstractNormalizer
+from sources.normalizers.apostrophe_normalizer import ApostropheNormalizer
+from sources.normalizers.constants import Constants
+from sources.normalizers.events import EventKind, EventSink, NormalizationEvent
+from sources.normalizers.normalization_pipeline import NormalizationPipeline, StageObserver
+from sources.normalizers.quotation_marks_normalizer import QuotationMarksNormalizer
+from sources.normalizers.redundant_apostrophe_spaces_normalizer import RedundantApostropheSpacesNormalizer
+from sources.normalizers.triggers import Trigger, detect_triggers
+from sources.normalizers.ukrainian_phone_normalizer import UkrainianPhoneNormalizer
+
+Key = Union[str, int]
+
+
+def stable_hash(key: Key) -> int:
+    """
+    Returns a 64-bit hash of a string or integer key. Unlike hash(), it is the same in every process,
+    so sketches built by different workers can be merged.
+    """
+    if isinstance(key, str):
+        data = b"s" + key.encode("utf-8")
+    else:
+        data = b"i" + key.to_bytes(key.bit_length() // 8 + 1, "little", signed=True)
+
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), "little")
+
+
+class SymbolCounter:
+    """Exact counts of a small fixed set of symbols, e.g. Constants.APOSTROPHES, in constant memory."""
+
+    def __init__(self, symbols: Sequence[str]):
+        self.symbols = list(symbols)
+        self.counts = array("q", [0] * len(self.symbols))
+
+    def update(self, text: str):
+        counts = self.counts
+        for position, symbol in enumerate(self.symbols):
+            counts[position] += text.count(symbol)
+
+    def merge(self, other: "SymbolCounter"):
+        if other.symbols != self.symbols:
+            raise ValueError("Only counters of the same symbols can be merged!")
+
+        for position, count in enumerate(other.counts):
+            self.counts[position] += count
+
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def items(self) -> List[Tuple[str, int]]:
+        return list(zip(self.symbols, self.counts))
+
+    def to_dict(self) -> dict:
+        return {"symbols": self.symbols, "counts": self.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "SymbolCounter":
+        counter = cls(state["symbols"])
+        counter.counts = array("q", state["counts"])
+        return counter
+
+
+class CountMinSketch:
+    """
+    Approximate counts of an open-ended set of keys in width * depth counters. Estimates never undercount,
+    and overcount by at most 2 / width of the total count with probability 1 - 1 / 2 ** depth.
+    Sketches of the same size are merged by adding their counters.
+    """
+
+    def __init__(self, width: int = 4096, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = array("q", [0] * (width * depth))
+
+    def positions(self, hash_value: int) -> List[int]:
+        # Double hashing derives the positions of all rows from the two halves of one hash
+        first = hash_value & 0xFFFFFFFF
+        second = (hash_value >> 32) | 1
+        width = self.width
+        return [row * width + (first + row * second) % width for row in range(self.depth)]
+
+    def add(self, hash_value: int, count: int = 1) -> int:
+        """Adds the count to the key with the given stable_hash and returns the new estimate of the key."""
+        table = self.table
+        estimate = None
+        for position in self.positions(hash_value):
+            table[position] += count
+            if estimate is None or table[position] < estimate:
+                estimate = table[position]
+
+        return estimate
+
+    def estimate(self, hash_value: int) -> int:
+        return min(self.table[position] for position in self.positions(hash_value))
+
+    def merge(self, other: "CountMinSketch"):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Only sketches of the same width and depth can be merged!")
+
+        self.table = array("q", map(int.__add__, self.table, other.table))
+
+
+class HyperLogLog:
+    """
+    Approximate number of distinct keys in 2 ** precision one-byte registers, with a relative error
+    of about 1.04 / sqrt(2 ** precision), 1.6% for the default precision. Merged by the maximum of the registers.
+    """
+
+    def __init__(self, precision: int = 12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, hash_value: int):
+        bits = 64 - self.precision
+        register = hash_value >> bits
+        rank = bits - (hash_value & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def count(self) -> int:
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -rank for rank in self.registers)
+
+        # Linear counting is more accurate for small cardinalities
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+
+        return round(estimate)
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Only HyperLogLogs of the same precision can be merged!")
+
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+
+def by_count(item: Tuple[Key, int]) -> tuple:
+    """Sort key of (key, count) pairs by decreasing count, ties broken by the key, so merges are deterministic."""
+    key, count = item
+    return -count, isinstance(key, str), key
+
+
+class FrequencySketch:
+    """
+    Counts of an open-ended set of keys, e.g. phone format signatures, in memory that does not grow with the corpus:
+    the exact total, a count-min sketch of the counts, the capacity keys with the highest counts
+    and a HyperLogLog of the number of distinct keys.
+
+    The most frequent keys are exact while the number of distinct keys does not exceed the capacity, see complete.
+    Beyond it they are approximate: the top keeps the keys that were frequent enough when they were last added,
+    so sketches of the same keys added in another order or merged from shards can keep different keys
+    at the end of the top. The count of a key is always estimated from the sketch, so it does not depend on the order.
+    """
+
+    def __init__(self, capacity: int = 1000, width: int = 4096, depth: int = 4, precision: int = 12):
+        """
+        Args:
+            capacity: Number of the most frequent keys to keep
+            width: Width of the count-min sketch, see CountMinSketch
+            depth: Depth of the count-min sketch
+            precision: Precision of the HyperLogLog, see HyperLogLog
+        """
+        self.capacity = capacity
+        self.total = 0
+        self.sketch = CountMinSketch(width, depth)
+        self.distinct = HyperLogLog(precision)
+        # The most frequent keys with their estimates, and a lower bound of the smallest estimate
+        self.top: Dict[Key, int] = {}
+        self.threshold = 0
+        # Whether every key added so far is in the top, so the most frequent keys are exact
+        self.complete = True
+
+    def add(self, key: Key, count: int = 1):
+        hash_value = stable_hash(key)
+        estimate = self.sketch.add(hash_value, count)
+        self.distinct.add(hash_value)
+        self.total += count
+
+        top = self.top
+        if key in top or len(top) < self.capacity:
+            top[key] = estimate
+            return
+
+        self.complete = False
+        if estimate > self.threshold:
+            # Keys were estimated when they were last added and estimates only grow, so keys above the new one
+            # stay in the top and only the others are estimated again, like in merge
+            estimates = {key: estimate}
+            for candidate, count in top.items():
+                if count <= estimate:
+                    estimates[candidate] = self.sketch.estimate(stable_hash(candidate))
+            smallest, _ = max(estimates.items(), key=by_count)
+            del estimates[smallest]
+            if smallest != key:
+                del top[smallest]
+            top.update(estimates)
+            self.threshold = min(top.values())
+
+    def update(self, keys: Iterable[Key]):
+        for key in keys:
+            self.add(key)
+
+    def estimate(self, key: Key) -> int:
+        return self.sketch.estimate(stable_hash(key))
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[Key, int]]:
+        """Returns the n most frequent keys of the top with their counts estimated from the sketch, see complete."""
+        estimates = [(key, self.sketch.estimate(stable_hash(key))) for key in self.top]
+        return sorted(estimates, key=by_count)[:n]
+
+    def merge(self, other: "FrequencySketch"):
+        """
+        Adds the counts of another sketch of the same size. The sketch, the total and the distinct count are the same
+        as those of one sketch of all keys, and so are the most frequent keys while the number of distinct keys
+        does not exceed the capacity, see complete.
+        """
+        self.sketch.merge(other.sketch)
+        self.distinct.merge(other.distinct)
+        self.total += other.total
+
+        # Candidates of both sides are estimated again from the merged sketch
+        estimates = {key: self.sketch.estimate(stable_hash(key)) for key in {**self.top, **other.top}}
+        self.complete = self.complete and other.complete and len(estimates) <= self.capacity
+        self.top = dict(sorted(estimates.items(), key=by_count)[:self.capacity])
+        self.threshold = min(self.top.values(), default=0)
+
+    def to_dict(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "total": self.total,
+            "width": self.sketch.width,
+            "depth": self.sketch.depth,
+            "table": self.sketch.table.tolist(),
+            "registers": self.distinct.registers.hex(),
+            "top": list(self.top.items()),
+            "complete": self.complete,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "FrequencySketch":
+        sketch = cls(state["capacity"], state["width"], state["depth"], (len(state["registers"]) // 2).bit_length() - 1)
+        sketch.total = state["total"]
+        sketch.sketch.table = array("q", state["table"])
+        sketch.distinct.registers = bytearray.fromhex(state["registers"])
+        sketch.top = {key: count for key, count in state["top"]}
+        sketch.threshold = min(sketch.top.values(), default=0)
+        # States saved without the flag are complete if the top was never full, since only a full top drops keys
+        sketch.complete = state.get("complete", len(sketch.top) < sketch.capacity)
+        return sketch
+
+
+def symbol_rows(before: SymbolCounter, after: SymbolCounter, digits: int = 4) -> List[dict]:
+    """
+    Rows of the before/after table of the experiments notebook: every symbol with its counts and shares,
+    sorted by the count before normalization, and a total row.
+    """
+    total_before = before.total()
+    total_after = after.total()
+
+    rows = [
+        {
+            "Unicode": unicode(symbol),
+            "Symbol": symbol,
+            "Before Normalization": count_before,
+            "Percentage Before": round(count_before / total_before * 100, digits) if total_before else 0.0,
+            "After Normalization": count_after,
+            "Percentage After": round(count_after / total_after * 100, digits) if total_after else 0.0,
+        }
+        for (symbol, count_before), (_, count_after) in zip(before.items(), after.items())
+    ]
+    rows.sort(key=lambda row: row["Before Normalization"], reverse=True)
+
+    rows.append({
+        "Unicode": "Total",
+        "Symbol": "",
+        "Before Normalization": total_before,
+        "Percentage Before": 100,
+        "After Normalization": total_after,
+        "Percentage After": 100,
+    })
+    return rows
+
+
+def format_rows(formats: FrequencySketch, n: Optional[int] = None) -> List[dict]:
+    """
+    Rows of the phone format table of the experiments notebook: the n most frequent formats with their shares.
+    Formats counted as integers are decoded, see encode_phone_format.
+    """
+    return [
+        {
+            "Phone Number": decode_phone_format(key) if isinstance(key, int) else key,
+            "Count": count,
+            "Percentage": count / formats.total * 100,
+        }
+        for key, count in formats.most_common(n)
+    ]
+
+
+def format_summary(formats: FrequencySketch, top: int = 10) -> dict:
+    """
+    Number of distinct formats, estimated by the HyperLogLog, the share of the top most frequent ones
+    and whether the most frequent formats are exact, see FrequencySketch.complete.
+    """
+    top_count = sum(count for _, count in formats.most_common(top))
+    top_percentage = top_count / formats.total * 100 if formats.total else 0.0
+    return {
+        "total": formats.total,
+        "distinct": formats.distinct.count(),
+        "top": top,
+        "top_percentage": top_percentage,
+        "remaining_percentage": 100 - top_percentage if formats.total else 0.0,
+        "complete": formats.complete,
+    }
+
+
+class CorpusStatistics(StageObserver):
+    """
+    Statistics of the experiments notebook in constant memory: exact counts of every apostrophe and quotation mark
+    before and after normalization, sketches of the phone number formats before and after normalization,
+    and the numbers of warnings and errors.
+
+    Statistics of different workers or corpus shards are combined with merge, so they are collected in parallel.
+    Documents are added with add, which normalizes them like the notebook, or with observe, which collects
+    the statistics from the stages of a pipeline that normalizes them anyway.
+    """
+
+    def __init__(self, format_capacity: int = 1000, width: int = 4096, depth: int = 4, precision: int = 12):
+        """
+        Args:
+            format_capacity: Number of the most frequent phone formats to keep, see FrequencySketch
+            width: Width of the count-min sketches of the phone formats
+            depth: Depth of the count-min sketches of the phone formats
+            precision: Precision of the HyperLogLogs of the phone formats
+        """
+        self.documents = 0
+        self.apostrophes_before = SymbolCounter(Constants.APOSTROPHES)
+        self.apostrophes_after = SymbolCounter(Constants.APOSTROPHES)
+        self.quotation_marks_before = SymbolCounter(Constants.QUOTATION_MARKS)
+        self.quotation_marks_after = SymbolCounter(Constants.QUOTATION_MARKS)
+        self.phone_formats_before = FrequencySketch(format_capacity, width, depth, precision)
+        self.phone_formats_after = FrequencySketch(format_capacity, width, depth, precision)
+        # Numbers of warnings and errors by normalizer name
+        self.warnings = Counter()
+        self.errors = Counter()
+
+    def add(self, text: str):
+        """Adds the statistics of a document, normalized the same way as in the experiments notebook."""
+        self.documents += 1
+        triggers = detect_triggers(text)
+
+        if triggers & Trigger.PHONE_DIGITS:
+            UkrainianPhoneNormalizer.normalize(text, sink=self.count_phone_number)
+
+        # Without apostrophes and quotation marks every symbol count is zero and the normalizers change nothing
+        if not triggers & (Trigger.APOSTROPHE | Trigger.QUOTATION_MARK):
+            return
+
+        text, _, _ = RedundantApostropheSpacesNormalizer.normalize(text)
+        self.apostrophes_before.update(text)
+        self.quotation_marks_before.update(text)
+
+        text, warnings, errors = ApostropheNormalizer.normalize(text)
+        self.count_messages(ApostropheNormalizer.name(), warnings, errors)
+        self.apostrophes_after.update(text)
+
+        text, warnings, errors = QuotationMarksNormalizer.normalize(text)
+        self.count_messages(QuotationMarksNormalizer.name(), warnings, errors)
+        self.quotation_marks_after.update(text)
+
+    def update(self, texts: Iterable[str]):
+        for text in texts:
+            self.add(text)
+
+    def observe(self, pipeline: NormalizationPipeline, text: str) -> Tuple[str, List[str], List[str]]:
+        """
+        Normalizes a document with the pipeline and adds its statistics from the results of the stages,
+        so the document is normalized once for both. Marks before normalization are counted in the input
+        of ApostropheNormalizer, so with DEFAULT_NORMALIZERS the statistics are the same as those of add.
+
+        Args:
+            pipeline: Pipeline of the run, which bypasses its cache of whole documents for the call
+            text: Input text for normalization
+
+        Returns:
+            Tuple[str, List[str], List[str]]: Result of the pipeline
+        """
+        self.documents += 1
+        return pipeline.normalize(text, observer=self)
+
+    def stage_sink(self, normalizer: AbstractNormalizer) -> Optional[EventSink]:
+        return self.count_phone_number if normalizer.name() == UkrainianPhoneNormalizer.name() else None
+
+    def observe_stage(self, normalizer: AbstractNormalizer, text: str, result: Tuple[str, List[str], List[str]]):
+        output, warnings, errors = result
+        name = normalizer.name()
+
+        if name == ApostropheNormalizer.name():
+            self.apostrophes_before.update(text)
+            self.quotation_marks_before.update(text)
+            self.count_messages(name, warnings, errors)
+            self.apostrophes_after.update(output)
+        elif name == QuotationMarksNormalizer.name():
+            self.count_messages(name, warnings, errors)
+            self.quotation_marks_after.update(output)
+
+    def count_phone_number(self, event: NormalizationEvent):
+        """
+        Event sink of UkrainianPhoneNormalizer that counts the formats of every matched phone number,
+        encoded as integers, see encode_phone_format.
+        """
+        if event.kind is EventKind.REPLACEMENT:
+            self.phone_formats_before.add(encode_phone_format(format_phone_number(event.original)))
+            self.phone_formats_after.add(encode_phone_format(format_phone_number(event.replacement)))
+
+    def count_messages(self, normalizer: str, warnings: List[str], errors: List[str]):
+        if warnings:
+            self.warnings[normalizer] += len(warnings)
+        if errors:
+            self.errors[normalizer] += len(errors)
+
+    def merge(self, other: "CorpusStatistics"):
+        self.documents += other.documents
+        self.apostrophes_before.merge(other.apostrophes_before)
+        self.apostrophes_after.merge(other.apostrophes_after)
+        self.quotation_marks_before.merge(other.quotation_marks_before)
+        self.quotation_marks_after.merge(other.quotation_marks_after)
+        self.phone_formats_before.merge(other.phone_formats_before)
+        self.phone_formats_after.merge(other.phone_formats_after)
+        self.warnings.update(other.warnings)
+        self.errors.update(other.errors)
+
+    def tables(self) -> Dict[str, List[dict]]:
+        """Rows of the tables of the experiments notebook, pass them to pandas.DataFrame to display them."""
+        return {
+            "apostrophes": symbol_rows(self.apostrophes_before, self.apostrophes_after, digits=4),
+            "quotation_marks": symbol_rows(self.quotation_marks_before, self.quotation_marks_after, digits=3),
+            "phone_formats_before": format_rows(self.phone_formats_before),
+            "phone_formats_after": format_rows(self.phone_formats_after),
+        }
+
+    def report(self) -> dict:
+        return {
+            "documents": self.documents,
+            "warnings": dict(self.warnings),
+            "errors": dict(self.errors),
+            "phone_formats_before": format_summary(self.phone_formats_before),
+            "phone_formats_after": format_summary(self.phone_formats_after),
+            "tables": self.tables(),
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "documents": self.documents,
+            "apostrophes_before": self.apostrophes_before.to_dict(),
+            "apostrophes_after": self.apostrophes_after.to_dict(),
+            "quotation_marks_before": self.quotation_marks_before.to_dict(),
+            "quotation_marks_after": self.quotation_marks_after.to_dict(),
+            "phone_formats_before": self.phone_formats_before.to_dict(),
+            "phone_formats_after": self.phone_formats_after.to_dict(),
+            "warnings": dict(self.warnings),
+            "errors": dict(self.errors),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "CorpusStatistics":
+        statistics = cls()
+        statistics.documents = state["documents"]
+        for name in ["apostrophes_before", "apostrophes_after", "quotation_marks_before", "quotation_marks_after"]:
+            setattr(statistics, name, SymbolCounter.from_dict(state[name]))
+        for name in ["phone_formats_before", "phone_formats_after"]:
+            setattr(statistics, name, FrequencySketch.from_dict(state[name]))
+        statistics.warnings = Counter(state["warnings"])
+        statistics.errors = Counter(state["errors"])
+        return statistics
+
+    def save(self, path: str):
+        """Saves the mergeable state, e.g. of a corpus shard, see load."""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "CorpusStatistics":
+        with open(path, encoding="utf-8") as file:
+            return cls.from_dict(json.load(file))
+
+
+def collect_chunk(texts: List[str], first_index: int = 0) -> Tuple[CorpusStatistics, None]:
+    """Collects the statistics of a chunk of documents in a worker process, see run_pool."""
+    statistics = CorpusStatistics()
+    statistics.update(texts)
+    return statistics, None
+
+
+def collect_statistics(
+    texts: Iterable[str], workers: Optional[int] = None, chunk_size: int = 1000
+) -> CorpusStatistics:
+    """
+    Collects the statistics of a stream of documents on a pool of worker processes
+    and merges the statistics of their chunks.
+
+    Args:
+        texts: Stream of documents, e.g. read_news_stream(corpus_path)
+        workers: Number of worker processes, os.cpu_count() if not given. With 1 worker runs in this process
+        chunk_size: Number of documents sent to a worker at once
+
+    Returns:
+        CorpusStatistics: Statistics of all documents
+    """
+    # Imported here, the corpus runner is only needed with several workers
+    from sources.helpers.corpus_runner import read_chunks, run_pool
+    import os
+
+    statistics = CorpusStatistics()
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        statistics.update(texts)
+        return statistics
+
+    tasks = ((0, None, collect_chunk, (chunk,)) for chunk in read_chunks(texts, chunk_size))
+    for _, _, chunk_statistics in run_pool(tasks, None, workers, None, ordered=False):
+        statistics.merge(chunk_statistics)
+
+    return statistics
+
+
+if __name__ == "__main__":
+    import random
+
+    # Exact symbol counts
+    counter = SymbolCounter(["'", "ʼ"])
+    counter.update("п'ять п'ятниць ʼ")
+    other = SymbolCounter(["'", "ʼ"])
+    other.update("м'ята")
+    counter.merge(other)
+    assert counter.items() == [("'", 3), ("ʼ", 1)] and counter.total() == 4
+
+    # Hashes do not depend on the process
+    assert stable_hash("+380 (XX) XXX-XX-XX") == stable_hash("+380 (XX) XXX-XX-XX")
+    assert stable_hash(1) != stable_hash("1")
+
+    # Sketches of two shards merge into the sketch of the whole stream
+    generator = random.Random(7)
+    keys = [f"format {min(int(generator.paretovariate(1.2)), 5000)}" for _ in range(20000)]
+    exact = Counter(keys)
+
+    whole = FrequencySketch(capacity=20)
+    whole.update(keys)
+    first, second = FrequencySketch(capacity=20), FrequencySketch(capacity=20)
+    first.update(keys[:7000])
+    second.update(keys[7000:])
+    first.merge(second)
+
+    for sketch in [whole, first]:
+        assert sketch.total == len(keys)
+        top_keys = [key for key, _ in sketch.most_common(10)]
+        assert top_keys[:5] == [key for key, _ in exact.most_common(5)], top_keys
+        for key, count in sketch.most_common(10):
+            assert exact[key] <= count <= exact[key] + 2 * len(keys) / 4096, (key, count, exact[key])
+        assert abs(sketch.distinct.count() - len(exact)) <= 0.05 * len(exact), (sketch.distinct.count(), len(exact))
+
+    assert first.sketch.table == whole.sketch.table and first.distinct.registers == whole.distinct.registers
+    restored = FrequencySketch.from_dict(json.loads(json.dumps(first.to_dict())))
+    assert restored.most_common() == first.most_common() and restored.distinct.count() == first.distinct.count()
+    assert not restored.complete
+
+    # With more distinct keys than the capacity the tops are approximate, but the merged and the single-pass
+    # sketch report the same count for every key and the same most frequent keys, also when a narrow sketch
+    # raises the estimates of keys after they were added
+    for width in [4096, 64]:
+        whole, first, second = [FrequencySketch(capacity=20, width=width) for _ in range(3)]
+        whole.update(keys)
+        first.update(keys[:7000])
+        second.update(keys[7000:])
+        first.merge(second)
+        assert len(exact) > 20 and not whole.complete and not first.complete
+        whole_counts, merged_counts = dict(whole.most_common()), dict(first.most_common())
+        assert all(whole_counts[key] == merged_counts[key] for key in whole_counts.keys() & merged_counts.keys())
+        assert whole.most_common(10) == first.most_common(10), (width, whole.most_common(10), first.most_common(10))
+
+    # Within the capacity the merged top is the exact single-pass top
+    whole, first, second = [FrequencySketch(capacity=len(exact)) for _ in range(3)]
+    whole.update(keys)
+    first.update(keys[:7000])
+    second.update(keys[7000:])
+    first.merge(second)
+    assert whole.complete and first.complete and whole.most_common() == first.most_common()
+
+    # Memory does not grow with the number of distinct keys
+    wide = FrequencySketch(capacity=5)
+    wide.update(range(100000))
+    assert len(wide.top) == 5 and len(wide.sketch.table) == 4 * 4096 and len(wide.distinct.registers) == 4096
+    assert abs(wide.distinct.count() - 100000) <= 5000, wide.distinct.count()
+
+    # Statistics of the notebook
+    news = [
+        "Телефон: 099 123 45 67, або +38 (099) 123-45-67",
+        "''Дерево'', прем`єр сім ` я",
+        "\"Він\" сказав 'так'",
+        "У 2023 році",
+    ]
+    statistics = CorpusStatistics()
+    statistics.update(news)
+    assert statistics.documents == 4
+    assert sorted(decode_phone_format(key) for key, _ in statistics.phone_formats_before.most_common()) == [
+        "+38 (0XX) XXX-XX-XX", "0XX XXX XX XX"
+    ]
+    assert statistics.phone_formats_after.most_common() == [(encode_phone_format("+380 (XX) XXX-XX-XX"), 2)]
+
+    tables = statistics.tables()
+    apostrophes = {row["Symbol"]: row for row in tables["apostrophes"]}
+    assert apostrophes["'"]["Before Normalization"] == 6 and apostrophes["'"]["After Normalization"] == 0
+    assert apostrophes["`"]["Before Normalization"] == 2
+    assert apostrophes["ʼ"]["After Normalization"] == 2
+    assert tables["apostrophes"][-1]["Unicode"] == "Total"
+    quotes = {row["Symbol"]: row for row in tables["quotation_marks"]}
+    assert quotes["\""]["Before Normalization"] == 2 and quotes["«"]["After Normalization"] == 3
+
+    # The whole quotation table is the one the notebook built from its dicts, with labels U+XXXX of every mark
+    before = {mark: 0 for mark in Constants.QUOTATION_MARKS}
+    after = {mark: 0 for mark in Constants.QUOTATION_MARKS}
+    for text in news:
+        text = RedundantApostropheSpacesNormalizer.normalize(text)[0]
+        for mark in before:
+            before[mark] += text.count(mark)
+        text = QuotationMarksNormalizer.normalize(ApostropheNormalizer.normalize(text)[0])[0]
+        for mark in after:
+            after[mark] += text.count(mark)
+    notebook_rows = [
+        {
+            "Unicode": f"U+{ord(mark):04X}",
+            "Symbol": mark,
+            "Before Normalization": before[mark],
+            "Percentage Before": round(before[mark] / sum(before.values()) * 100, 3),
+            "After Normalization": after[mark],
+            "Percentage After": round(after[mark] / sum(after.values()) * 100, 3),
+        }
+        for mark in Constants.QUOTATION_MARKS
+    ]
+    notebook_rows.sort(key=lambda row: row["Before Normalization"], reverse=True)
+    notebook_rows.append({"Unicode": "Total", "Symbol": "", "Before Normalization": sum(before.values()),
+                          "Percentage Before": 100, "After Normalization": sum(after.values()), "Percentage After": 100})
+    assert tables["quotation_marks"] == notebook_rows, tables["quotation_marks"]
+
+    # Merging the statistics of shards gives the statistics of the whole corpus
+    shards = [CorpusStatistics(), CorpusStatistics()]
+    shards[0].update(news[:2])
+    shards[1].update(news[2:])
+    shards[0].merge(CorpusStatistics.from_dict(json.loads(json.dumps(shards[1].to_dict()))))
+    assert shards[0].tables() == tables
+    assert shards[0].report()["phone_formats_after"]["distinct"] == 1
+
+    # Statistics observed in the stages of the production pipeline are those of the notebook
+    observed = CorpusStatistics()
+    pipeline = NormalizationPipeline()
+    assert [observed.observe(pipeline, text) for text in news] == [pipeline.normalize(text) for text in news]
+    assert observed.to_dict() == statistics.to_dict()
+
+    parallel = collect_statistics(news * 10, workers=2, chunk_size=3)
+    assert parallel.documents == 40
+    assert parallel.apostrophes_before.total() == 10 * statistics.apostrophes_before.total()
+    assert parallel.tables()["phone_formats_after"] == [
+        {"Phone Number": "+380 (XX) XXX-XX-XX", "Count": 20, "Percentage": 100.0}
+    ]
+
+    print("All tests passed!")
@@ -1,3 +1,23 @@
+from typing import List, Optional, Sequence
+import re
+
+# Replaces every ASCII digit of a phone number by X, the 380 or 0 prefix is restored afterwards.
+# Bytes are translated by a lookup table, much faster than str.translate
+DIGITS_TO_X = bytes.maketrans(b"0123456789", b"X" * 10)
+NOT_DIGITS = bytes(byte for byte in range(256) if not 48 <= byte <= 57)
+
+# Separates the phone numbers of a batch translated at once
+BATCH_SEPARATOR = "\x00"
+
+# Symbols of the signatures of phone numbers matched by UkrainianPhoneNormalizer, every one is encoded in 4 bits
+# by its position + 1. Other characters are encoded by ESCAPE_CODE followed by their 21-bit code point
+PHONE_FORMAT_SYMBOLS = "X038+ ()-.\t\n\xa0"
+ESCAPE_CODE = 15
+PHONE_FORMAT_PATTERN = re.compile("[" + re.escape(PHONE_FORMAT_SYMBOLS) + "]*")
+SYMBOLS_TO_HEX = bytes.maketrans(
+    PHONE_FORMAT_SYMBOLS.encode("latin-1"),
+    "".join(format(code, "x") for code in range(1, len(PHONE_FORMAT_SYMBOLS) + 1)).encode("ascii"),
+)
 
 
 def format_phone_number(text: str) -> str:
@@ -7,6 +27,103 @@ def format_phone_number(text: str) -> str:
     :param text: Input text containing a phone number
     :return: Normalized phone number with digits replaced by 'X'
     """
+    if text.isascii():
+        data = text.encode("ascii")
+        signature = restore_prefix(data, data.translate(DIGITS_TO_X))
+        if signature is not None:
+            return signature
+
+    return format_phone_number_by_characters(text)
+
+
+def format_phone_numbers(texts: Sequence[str]) -> List[str]:
+    """
+    Formats a batch of phone numbers, e.g. all phone numbers matched in a chunk of documents, see format_phone_number.
+    The digits of the whole batch are replaced by one table lookup.
+    """
+    joined = BATCH_SEPARATOR.join(texts)
+    if not joined.isascii() or joined.count(BATCH_SEPARATOR) != len(texts) - 1:
+        return [format_phone_number(text) for text in texts]
+
+    data = joined.encode("ascii")
+    separator = BATCH_SEPARATOR.encode("ascii")
+    signatures = []
+    for text, number, signature in zip(texts, data.split(separator), data.translate(DIGITS_TO_X).split(separator)):
+        signature = restore_prefix(number, signature)
+        signatures.append(format_phone_number_by_characters(text) if signature is None else signature)
+
+    return signatures
+
+
+def restore_prefix(data: bytes, signature: bytes) -> Optional[str]:
+    """
+    Restores the 380 or 0 prefix of an ASCII phone number in its signature with every digit replaced by X.
+    Returns None for a + after a digit, which starts the prefix again, so the number is left to the character loop.
+    """
+    first = len(data) - len(data.lstrip(NOT_DIGITS))
+    if first == len(data):
+        return signature.decode("ascii")
+    if data.find(b"+", first) != -1:
+        return None
+
+    digit = data[first]
+    if digit == 48:  # 0
+        return (signature[:first] + b"0" + signature[first + 1:]).decode("ascii")
+    if digit != 51:  # 3
+        return signature.decode("ascii")
+
+    # As the character loop, keeps the first 8 after the 3 and the first 0 after that 8
+    signature = bytearray(signature)
+    signature[first] = 51  # 3
+    eight = data.find(b"8", first + 1)
+    if eight != -1:
+        signature[eight] = 56  # 8
+        zero = data.find(b"0", eight + 1)
+        if zero != -1:
+            signature[zero] = 48  # 0
+
+    return signature.decode("ascii")
+
+
+def encode_phone_format(signature: str) -> int:
+    """
+    Encodes a phone format signature, e.g. "+380 (XX) XXX-XX-XX", as an integer, so histograms key on small ints.
+    Every symbol of PHONE_FORMAT_SYMBOLS takes 4 bits, the first symbol in the lowest ones, see decode_phone_format.
+    """
+    if PHONE_FORMAT_PATTERN.fullmatch(signature):
+        return int(signature.encode("latin-1").translate(SYMBOLS_TO_HEX)[::-1] or b"0", 16)
+
+    code = 0
+    for char in reversed(signature):
+        position = PHONE_FORMAT_SYMBOLS.find(char)
+        if position == -1:
+            code = (((code << 21) | ord(char)) << 4) | ESCAPE_CODE
+        else:
+            code = (code << 4) | (position + 1)
+
+    return code
+
+
+def decode_phone_format(code: int) -> str:
+    """Returns the phone format signature encoded by encode_phone_format."""
+    symbols = []
+    while code:
+        symbol = code & 15
+        code >>= 4
+        if symbol == ESCAPE_CODE:
+            symbols.append(chr(code & 0x1FFFFF))
+            code >>= 21
+        else:
+            symbols.append(PHONE_FORMAT_SYMBOLS[symbol - 1])
+
+    return "".join(symbols)
+
+
+def format_phone_number_by_characters(text: str) -> str:
+    """
+    Character by character version of format_phone_number, used for the rare numbers with non-ASCII digits
+    or a + after a digit.
+    """
     output = ""
     digits_seen = 0
     expect_digit = None  # Expected next digit in the +380 or 380 sequence
@@ -63,6 +180,19 @@ if __name__ == "__main__":
     for test, expected in tests:
         result = format_phone_number(test)
         assert result == expected, f"For {test} expected {expected} but got {result}"
+        assert format_phone_number_by_characters(test) == expected
+
+    numbers = [test for test, _ in tests] + ["+3 5 8 1 0", "099+3801", "٠٩٩ 123", "X0 1", "", "(044) 2"]
+    signatures = [format_phone_number_by_characters(number) for number in numbers]
+    assert [format_phone_number(number) for number in numbers] == signatures
+    assert format_phone_numbers(numbers) == signatures
+    assert format_phone_numbers(["0\x001"]) == [format_phone_number_by_characters("0\x001")]
+
+    for signature in signatures + ["+380\u202f(XX)", "+380 XX\u2011XXX"]:
+        code = encode_phone_format(signature)
+        assert decode_phone_format(code) == signature, signature
+    assert encode_phone_format("+380 (XX) XXX-XX-XX") < 2 ** 80
+    assert len({encode_phone_format(signature) for signature in signatures}) == len(set(signatures))
 
     print("All tests passed!")
 
@@ -0,0 +1,257 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterator, List, Optional, Tuple, Union
+import mmap
+import os
+import re
+import struct
+import tempfile
+
+from sources.helpers.compressed_io import detect_compression
+
+INDEX_MAGIC = b"NEWSIDX1"
+# Magic, number of news, size of the corpus file in bytes
+INDEX_HEADER = struct.Struct("<8sQQ")
+# Line breaks recognized by open() in text mode
+LINE_BREAK = re.compile(r"\r\n|\r|\n")
+LINE_BREAK_BYTES = re.compile(rb"\r\n|\r|\n")
+
+
+def build_news_index(corpus_path: str, index_path: Optional[str] = None, block_size: int = 1 << 24) -> str:
+    """
+    Records the byte offset and length of every news in the corpus in a compact index file.
+
+    News are split exactly as in read_news_stream: by lines that are empty after stripping whitespace.
+    The offset points to the first line of the news and the length ends after its last line.
+
+    Args:
+        corpus_path: Path to the corpus file with news separated by empty lines
+        index_path: Path to write the index to, corpus_path + ".index" if not given
+        block_size: Number of bytes to read from the corpus at once
+
+    Returns:
+        str: Path to the index file
+
+    Raises:
+        ValueError: If the corpus is compressed, byte offsets need an uncompressed corpus
+    """
+    if detect_compression(corpus_path):
+        raise ValueError(f"{corpus_path} is compressed, decompress it to build an index!")
+
+    index_path = index_path or corpus_path + ".index"
+    offsets = array("Q")
+    lengths = array("Q")
+
+    news_start = None
+    news_end = 0
+    position = 0
+    tail = b""
+
+    with open(corpus_path, "rb") as corpus:
+        while True:
+            block = corpus.read(block_size)
+            data = tail + block
+            line_start = 0
+
+            for line_break in LINE_BREAK_BYTES.finditer(data):
+                # "\r" at the end of the block may be the first half of "\r\n"
+                if block and line_break.end() == len(data) and line_break.group() == b"\r":
+                    break
+
+                line = data[line_start:line_break.start()]
+                if line.decode("utf-8").strip():
+                    if news_start is None:
+                        news_start = position + line_start
+                    news_end = position + line_break.start()
+                elif news_start is not None:
+                    offsets.append(news_start)
+                    lengths.append(news_end - news_start)
+                    news_start = None
+
+                line_start = line_break.end()
+
+            position += line_start
+            tail = data[line_start:]
+
+            if not block:
+                break
+
+        if tail.decode("utf-8").strip():
+            if news_start is None:
+                news_start = position
+            news_end = position + len(tail)
+
+        if news_start is not None:
+            offsets.append(news_start)
+            lengths.append(news_end - news_start)
+
+    # Written to a temporary file and renamed, so processes that build the same index at once,
+    # e.g. the nodes of a sharded run, never read a partly written one
+    descriptor, temporary_path = tempfile.mkstemp(
+        prefix=os.path.basename(index_path) + ".", dir=os.path.dirname(index_path) or "."
+    )
+    try:
+        with os.fdopen(descriptor, "wb") as index:
+            index.write(INDEX_HEADER.pack(INDEX_MAGIC, len(offsets), os.path.getsize(corpus_path)))
+            offsets.tofile(index)
+            lengths.tofile(index)
+        os.replace(temporary_path, index_path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+    return index_path
+
+
+def decode_news(data: bytes) -> str:
+    """Converts the bytes of a news to the text yielded by read_news_stream."""
+    return " ".join(line.strip() for line in LINE_BREAK.split(data.decode("utf-8")))
+
+
+class NewsIndex:
+    """
+    Random access to the news of a corpus through its index. Both files are memory-mapped,
+    so any news or range of news is read in O(1) without decoding the rest of the corpus.
+    """
+
+    def __init__(self, corpus_path: str, index_path: Optional[str] = None):
+        """
+        Args:
+            corpus_path: Path to the corpus file with news separated by empty lines
+            index_path: Path to the index built by build_news_index, corpus_path + ".index" if not given.
+                The index is built if the file does not exist
+
+        Raises:
+            ValueError: If the index file is damaged or was built for another version of the corpus
+        """
+        self.corpus_path = corpus_path
+        self.index_path = index_path or corpus_path + ".index"
+
+        if not os.path.exists(self.index_path):
+            build_news_index(corpus_path, self.index_path)
+
+        with open(self.index_path, "rb") as index:
+            self.index_map = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, corpus_size = INDEX_HEADER.unpack_from(self.index_map)
+        if magic != INDEX_MAGIC or len(self.index_map) != INDEX_HEADER.size + 16 * count:
+            self.close()
+            raise ValueError(f"{self.index_path} is not a news index!")
+        if corpus_size != os.path.getsize(corpus_path):
+            self.close()
+            raise ValueError(f"{self.index_path} was built for another version of {corpus_path}!")
+
+        entries = memoryview(self.index_map)[INDEX_HEADER.size:]
+        self.offsets = entries[:8 * count].cast("Q")
+        self.lengths = entries[8 * count:].cast("Q")
+
+        with open(corpus_path, "rb") as corpus:
+            # mmap cannot map empty files
+            self.corpus_map = mmap.mmap(corpus.fileno(), 0, access=mmap.ACCESS_READ) if corpus_size else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(item, slice):
+            return [self.read(number) for number in range(*item.indices(len(self)))]
+
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("News index out of range")
+
+        return self.read(item)
+
+    def read(self, number: int) -> str:
+        """Returns the news with the given number."""
+        offset = self.offsets[number]
+        return decode_news(self.corpus_map[offset:offset + self.lengths[number]])
+
+    def read_range(self, start: int, stop: int) -> Iterator[str]:
+        """Yields the news from start to stop, not including stop."""
+        for number in range(max(0, start), min(stop, len(self))):
+            yield self.read(number)
+
+    def byte_range(self, start: int, stop: int) -> Tuple[int, int]:
+        """Returns the byte range of the corpus file occupied by the news from start to stop."""
+        if start >= stop:
+            return 0, 0
+
+        return self.offsets[start], self.offsets[stop - 1] + self.lengths[stop - 1]
+
+    def partition(self, parts: int) -> List[Tuple[int, int]]:
+        """
+        Splits the news into at most parts disjoint ranges (start, stop) of about the same size in bytes.
+        """
+        count = len(self)
+        if count == 0:
+            return []
+
+        first_offset, end = self.byte_range(0, count)
+        ranges = []
+        start = 0
+        for part in range(1, parts + 1):
+            boundary = first_offset + (end - first_offset) * part // parts
+            stop = count if part == parts else bisect_left(self.offsets, boundary, start)
+            if stop > start:
+                ranges.append((start, stop))
+                start = stop
+
+        return ranges
+
+    def close(self):
+        for view in ("offsets", "lengths"):
+            if hasattr(self, view):
+                getattr(self, view).release()
+        self.index_map.close()
+        if isinstance(getattr(self, "corpus_map", None), mmap.mmap):
+            self.corpus_map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    from sources.helpers.read_news_stream import read_news_stream
+
+    corpus = "Перша новина,\r\nдругий рядок\r\n\r\n  \n Друга новина\rз \\r\n\n\n\tТретя новина  \n \u00a0\nЧетверта"
+
+    with tempfile.TemporaryDirectory() as directory:
+        corpus_path = os.path.join(directory, "corpus.txt")
+        with open(corpus_path, "w", encoding="utf-8", newline="") as file:
+            file.write(corpus)
+
+        expected_news = list(read_news_stream(corpus_path))
+
+        for block_size in [1, 3, 1 << 24]:
+            index_path = build_news_index(corpus_path, block_size=block_size)
+
+            with NewsIndex(corpus_path, index_path) as index:
+                assert len(index) == 4, len(index)
+                assert index[:] == expected_news, index[:]
+                assert [index[number] for number in range(-4, 4)] == expected_news * 2
+                assert list(index.read_range(1, 3)) == expected_news[1:3]
+
+                for parts in range(1, 6):
+                    ranges = index.partition(parts)
+                    assert [number for start, stop in ranges for number in range(start, stop)] == [0, 1, 2, 3], ranges
+
+                start, end = index.byte_range(1, 2)
+                with open(corpus_path, "rb") as file:
+                    assert file.read()[start:end].decode("utf-8") == " Друга новина\rз \\r"
+
+        with open(corpus_path, "a", encoding="utf-8") as file:
+            file.write("\n\nП'ята")
+
+        try:
+            NewsIndex(corpus_path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Index of a changed corpus should be rejected")
+
+    print("All tests passed!")
@@ -1,15 +1,33 @@
+from sources.helpers.compressed_io import iterate_in_background, open_text
 
-def read_news_stream(file_path):
-    """Generator for streaming and processing news articles."""
+
+def read_news_stream(file_path, background=False, max_pending_batches=16):
+    """
+    Generator for streaming and processing news articles.
+
+    Files compressed with gzip, bz2, xz or zstd are decompressed on the fly, the format is detected by the content.
+    With background=True, reading, decompression and decoding run in a background thread, ahead of the consumer
+    by at most max_pending_batches batches of news.
+    """
+    if background:
+        yield from iterate_in_background(read_news_stream(file_path), max_pending_batches, name="read_news_stream")
+        return
+
+    with open_text(file_path) as file:
+        yield from read_news_lines(file)
+
+
+def read_news_lines(lines):
+    """Groups lines, e.g. of an open file or sys.stdin, into news separated by empty lines, as read_news_stream."""
     current_news = []
-    with open(file_path, 'r', encoding='utf-8') as file:
-        for line in file:
-            line = line.strip()
-            if line:  # If line is not empty, add to current news
-                current_news.append(line)
-            elif current_news:  # If empty line and there's accumulated news
-                yield " ".join(current_news)
-                current_news = []
-        # Yield the last news item if it exists
-        if current_news:
-            yield " ".join(current_news)
\ No newline at end of file
+    for line in lines:
+        line = line.strip()
+        if line:  # If line is not empty, add to current news
+            current_news.append(line)
+        elif current_news:  # If empty line and there's accumulated news
+            yield " ".join(current_news)
+            current_news = []
+    # Yield the last news item if it exists
+    if current_news:
+        yield " ".join(current_news)
+
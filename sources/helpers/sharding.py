@@ -0,0 +1,562 @@
+from typing import Iterator, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import time
+
+from sources.helpers.compressed_io import COMPRESSION_EXTENSIONS, compression_by_extension, open_text
+from sources.helpers.corpus_runner import Result, normalize_chunk, run_pool, save_checkpoint, worker_index, worker_state
+from sources.helpers.corpus_statistics import CorpusStatistics
+from sources.helpers.news_index import NewsIndex
+from sources.normalizers.normalization_pipeline import NormalizationPipeline, NormalizerSpec
+
+MANIFEST_VERSION = 3
+MANIFEST_NAME = "manifest.json"
+REPORT_NAME = "report.jsonl"
+STATISTICS_NAME = "statistics.json"
+
+# Documents are assigned to shards by equal byte ranges of the corpus or by equal numbers of documents
+SHARDING_METHODS = ["bytes", "documents"]
+
+SHARD_DIRECTORY_PATTERN = re.compile(r"shard-(\d+)-of-(\d+)")
+
+
+def shard_ranges(index: NewsIndex, shards: int, by: str = "bytes") -> List[Tuple[int, int]]:
+    """
+    Splits the documents of an indexed corpus into shards contiguous ranges (start, stop).
+    The split depends only on the corpus, so every node computes the same ranges without coordination.
+    Shards that get no documents have an empty range at the end of the corpus.
+
+    Args:
+        index: Index of the corpus
+        shards: Number of shards
+        by: "bytes" for ranges of about the same size in bytes, "documents" for the same number of documents
+
+    Returns:
+        List[Tuple[int, int]]: Range of document numbers of every shard
+
+    Raises:
+        ValueError: If the number of shards is not positive or the method is unknown
+    """
+    if shards < 1:
+        raise ValueError("The number of shards must be positive!")
+    if by not in SHARDING_METHODS:
+        raise ValueError(f"Unknown sharding method {by}, use {' or '.join(SHARDING_METHODS)}!")
+
+    count = len(index)
+    if by == "documents":
+        return [(count * shard // shards, count * (shard + 1) // shards) for shard in range(shards)]
+
+    ranges = index.partition(shards)
+    return ranges + [(count, count)] * (shards - len(ranges))
+
+
+def shard_directory(output_directory: str, shard: int, shards: int) -> str:
+    return os.path.join(output_directory, f"shard-{shard:05d}-of-{shards:05d}")
+
+
+def file_checksum(path: str, block_size: int = 1 << 20) -> dict:
+    """Returns the size and SHA-256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+
+    return {"bytes": os.path.getsize(path), "sha256": digest.hexdigest()}
+
+
+def corpus_fingerprint(index: NewsIndex) -> str:
+    """
+    Returns the SHA-256 of the document offsets and lengths of an indexed corpus.
+    Shards are matched by it instead of by the corpus path, so nodes can mount the corpus at different paths.
+    """
+    digest = hashlib.sha256()
+    digest.update(index.offsets)
+    digest.update(index.lengths)
+
+    return digest.hexdigest()
+
+
+def output_name(compression: Optional[str]) -> str:
+    """Returns the name of the normalized output of a shard, e.g. output.txt.zst for zstd."""
+    extensions = {name: extension for extension, name in COMPRESSION_EXTENSIONS.items()}
+    if compression is not None and compression not in extensions:
+        raise ValueError(f"Unknown compression format {compression}!")
+
+    return "output.txt" + extensions.get(compression, "")
+
+
+def verify_files(directory: str, manifest: dict):
+    """
+    Checks that the files of a shard have the sizes and checksums recorded in its manifest.
+
+    Raises:
+        ValueError: If a file is missing or differs from the manifest
+    """
+    for name, expected in manifest["files"].items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            raise ValueError(f"{path} of the manifest is missing!")
+        if os.path.getsize(path) != expected["bytes"] or file_checksum(path) != expected:
+            raise ValueError(f"{path} does not match its checksum in the manifest!")
+
+
+def load_manifest(directory: str) -> Optional[dict]:
+    """Returns the manifest of a shard directory, or None if the shard has not finished."""
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def normalize_shard_range(
+    corpus_path: str, index_path: Optional[str], start: int, stop: int, statistics: bool
+) -> Tuple[Tuple[list, Optional[CorpusStatistics]], None]:
+    """
+    Reads the documents from start to stop straight from the indexed corpus and normalizes them in a worker,
+    see normalize_index_range. If statistics is true, also collects the CorpusStatistics of the documents
+    from the results of the stages, see CorpusStatistics.observe.
+    """
+    texts = list(worker_index(corpus_path, index_path).read_range(start, stop))
+    if not statistics:
+        results, _ = normalize_chunk(texts, start)
+        return (results, None), None
+
+    chunk_statistics = CorpusStatistics()
+    results = []
+    for text in texts:
+        output, warnings, errors = chunk_statistics.observe(worker_state.pipeline, text)
+        results.append((None if output == text else output, warnings, errors))
+
+    return (results, chunk_statistics), None
+
+
+def normalize_shard(
+    index: NewsIndex,
+    index_path: Optional[str],
+    start: int,
+    stop: int,
+    normalizers: Optional[Sequence[NormalizerSpec]],
+    workers: int,
+    chunk_size: int,
+    statistics: Optional[CorpusStatistics] = None,
+) -> Iterator[Tuple[int, str, Result]]:
+    """
+    Normalizes the documents from start to stop of an indexed corpus like normalize_indexed and, if statistics
+    are given, adds the documents to them in the same pass: every document is read and normalized once,
+    by the worker that collects its statistics from the results of the stages.
+
+    Returns:
+        Iterator[Tuple[int, str, Result]]: Document number in the corpus, the document and its normalization result
+    """
+    if workers == 1:
+        pipeline = NormalizationPipeline(normalizers)
+        for number in range(start, stop):
+            text = index.read(number)
+            yield number, text, pipeline.normalize(text) if statistics is None else statistics.observe(pipeline, text)
+        return
+
+    def tasks():
+        for first in range(start, stop, chunk_size):
+            last = min(first + chunk_size, stop)
+            arguments = (index.corpus_path, index_path, first, last, statistics is not None)
+            yield first, range(first, last), normalize_shard_range, arguments
+
+    for _, numbers, (chunk_results, chunk_statistics) in run_pool(tasks(), normalizers, workers, None, True):
+        if chunk_statistics is not None:
+            statistics.merge(chunk_statistics)
+        for number, (output, warnings, errors) in zip(numbers, chunk_results):
+            text = index.read(number)
+            yield number, text, (text if output is None else output, warnings, errors)
+
+
+def run_shard(
+    corpus_path: str,
+    output_directory: str,
+    shard: int,
+    shards: int,
+    by: str = "bytes",
+    index_path: Optional[str] = None,
+    normalizers: Optional[Sequence[NormalizerSpec]] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = 1000,
+    statistics: bool = True,
+    compression: Optional[str] = None,
+    compression_level: Optional[int] = None,
+) -> dict:
+    """
+    Normalizes one shard of a corpus, e.g. on one of several nodes that share a filesystem.
+
+    The shard directory gets the normalized documents, the warnings and errors as JSON lines with the document numbers
+    in the corpus, the CorpusStatistics of the documents and, written last, a manifest with the document range,
+    counts, fingerprints of the normalizers, checksums of the files and timings. A shard with a valid manifest
+    of the same corpus and normalizers is complete and is not run again, so the same command can be repeated
+    on every node until all shards are done.
+
+    The statistics are collected in the normalization pass: the worker that reads a chunk of documents normalizes it
+    and counts the marks and phone formats in the results of the stages, so the shard is read and normalized once,
+    see CorpusStatistics.observe.
+
+    Args:
+        corpus_path: Path to the uncompressed corpus file with news separated by empty lines
+        output_directory: Directory of the shard directories, see merge_shards
+        shard: Number of the shard, from 0 to shards - 1
+        shards: Number of shards
+        by: Sharding method, see shard_ranges
+        index_path: Path to the corpus index, see NewsIndex. Built if it does not exist
+        normalizers: Normalizer classes or instances of the pipeline, DEFAULT_NORMALIZERS if not given
+        workers: Number of worker processes, os.cpu_count() if not given
+        chunk_size: Number of documents read by a worker at once
+        statistics: Whether to collect the CorpusStatistics of the shard
+        compression: Compression format of the normalized output, see open_compressed
+        compression_level: Compression level of the output, the default of the format if not given
+
+    Returns:
+        dict: Manifest of the shard
+
+    Raises:
+        ValueError: If the shard number is out of range
+    """
+    if not 0 <= shard < shards:
+        raise ValueError(f"Shard {shard} is out of range for {shards} shards!")
+
+    directory = shard_directory(output_directory, shard, shards)
+    output_file = output_name(compression)
+
+    with NewsIndex(corpus_path, index_path) as index:
+        corpus = (corpus_fingerprint(index), os.path.getsize(corpus_path), len(index))
+    # The rules and options of every stage, so shards of another configuration are run again
+    fingerprints = [normalizer.fingerprint() for normalizer in NormalizationPipeline(normalizers).normalizers]
+
+    manifest = load_manifest(directory)
+    if manifest is not None:
+        same_run = (
+            (manifest["corpus_fingerprint"], manifest["corpus_size"], manifest["corpus_documents"],
+             manifest["normalizers"], manifest["shard"], manifest["shards"], manifest["by"])
+            == corpus + (fingerprints, shard, shards, by)
+            and output_file in manifest["files"]
+            and (STATISTICS_NAME in manifest["files"] or not statistics)
+        )
+        try:
+            if same_run:
+                verify_files(directory, manifest)
+                return manifest
+        except ValueError:
+            pass
+        os.remove(os.path.join(directory, MANIFEST_NAME))
+
+    os.makedirs(directory, exist_ok=True)
+    started = time.time()
+    timer = time.perf_counter()
+    stats = {"documents": 0, "changed": 0, "warnings": 0, "errors": 0}
+    shard_statistics = CorpusStatistics() if statistics else None
+
+    with NewsIndex(corpus_path, index_path) as index:
+        start, stop = shard_ranges(index, shards, by)[shard]
+        byte_start, byte_stop = index.byte_range(start, stop)
+
+        with open_text(os.path.join(directory, output_file), "w", compression, compression_level) as output, \
+                open(os.path.join(directory, REPORT_NAME), "w", encoding="utf-8") as report:
+            results = normalize_shard(
+                index, index_path, start, stop, normalizers, workers or os.cpu_count() or 1, chunk_size,
+                shard_statistics,
+            )
+            for number, original, (text, warnings, errors) in results:
+                output.write(text)
+                output.write("\n\n")
+
+                if warnings or errors:
+                    report.write(json.dumps({"document": number, "warnings": warnings, "errors": errors},
+                                            ensure_ascii=False))
+                    report.write("\n")
+
+                stats["documents"] += 1
+                stats["changed"] += text != original
+                stats["warnings"] += len(warnings)
+                stats["errors"] += len(errors)
+
+    files = [output_file, REPORT_NAME]
+    if statistics:
+        shard_statistics.save(os.path.join(directory, STATISTICS_NAME))
+        files.append(STATISTICS_NAME)
+
+    seconds = time.perf_counter() - timer
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "corpus": os.path.abspath(corpus_path),
+        "corpus_fingerprint": corpus[0],
+        "corpus_size": corpus[1],
+        "corpus_documents": corpus[2],
+        "normalizers": fingerprints,
+        "shard": shard,
+        "shards": shards,
+        "by": by,
+        "start": start,
+        "stop": stop,
+        "byte_range": [byte_start, byte_stop],
+        "stats": stats,
+        "files": {name: file_checksum(os.path.join(directory, name)) for name in files},
+        "timings": {
+            "host": socket.gethostname(),
+            "started": started,
+            "seconds": seconds,
+            "docs_per_sec": stats["documents"] / seconds if seconds else 0.0,
+        },
+    }
+    # Written atomically and last, so a manifest always describes complete files
+    save_checkpoint(os.path.join(directory, MANIFEST_NAME), manifest)
+
+    return manifest
+
+
+def load_manifests(output_directory: str, verify: bool = True) -> List[dict]:
+    """
+    Loads and validates the manifests of all shards of a run, in the shard order.
+
+    Args:
+        output_directory: Directory of the shard directories
+        verify: Whether to check the sizes and checksums of the shard files
+
+    Returns:
+        List[dict]: Manifest of every shard
+
+    Raises:
+        ValueError: If a shard is missing or unfinished, the shards belong to different runs, corpora or normalizers,
+            their ranges do not cover the corpus exactly once, or a file does not match its manifest
+    """
+    directories = sorted(
+        name for name in os.listdir(output_directory)
+        if SHARD_DIRECTORY_PATTERN.fullmatch(name) and os.path.isdir(os.path.join(output_directory, name))
+    )
+    if not directories:
+        raise ValueError(f"{output_directory} has no shards!")
+
+    manifests = []
+    for name in directories:
+        manifest = load_manifest(os.path.join(output_directory, name))
+        if manifest is None:
+            raise ValueError(f"Shard {name} has not finished, it has no manifest!")
+        if manifest["version"] != MANIFEST_VERSION:
+            raise ValueError(f"Shard {name} has manifest version {manifest['version']}, expected {MANIFEST_VERSION}!")
+        if name != os.path.basename(shard_directory("", manifest["shard"], manifest["shards"])):
+            raise ValueError(f"Shard {name} has the manifest of shard {manifest['shard']} of {manifest['shards']}!")
+        manifests.append(manifest)
+
+    first = manifests[0]
+    run = ["corpus_fingerprint", "corpus_size", "corpus_documents", "normalizers", "shards", "by"]
+    for manifest in manifests:
+        if [manifest[key] for key in run] != [first[key] for key in run]:
+            raise ValueError(f"Shards {first['shard']} and {manifest['shard']} belong to different runs!")
+
+    manifests.sort(key=lambda manifest: manifest["shard"])
+    missing = sorted(set(range(first["shards"])) - {manifest["shard"] for manifest in manifests})
+    if missing:
+        raise ValueError(f"Shards {', '.join(map(str, missing))} of {first['shards']} are missing!")
+
+    position = 0
+    for manifest in manifests:
+        if manifest["start"] != position or manifest["stop"] < manifest["start"]:
+            raise ValueError(f"Shard {manifest['shard']} does not start after the previous one!")
+        if manifest["stats"]["documents"] != manifest["stop"] - manifest["start"]:
+            raise ValueError(f"Shard {manifest['shard']} has not normalized all its documents!")
+        position = manifest["stop"]
+    if position != first["corpus_documents"]:
+        raise ValueError(f"The shards cover {position} of {first['corpus_documents']} documents!")
+
+    if verify:
+        for manifest in manifests:
+            verify_files(shard_directory(output_directory, manifest["shard"], manifest["shards"]), manifest)
+
+    return manifests
+
+
+def merge_shards(
+    output_directory: str,
+    output_path: str,
+    report_path: Optional[str] = None,
+    statistics_path: Optional[str] = None,
+    verify: bool = True,
+    compression_level: Optional[int] = None,
+) -> dict:
+    """
+    Validates the manifests of all shards and concatenates their outputs and reports in the corpus order.
+    The result is identical to a run_corpus run over the whole corpus on one node, and so are the statistics,
+    except for the rarest phone formats if there are more of them than the capacity of the sketch, see FrequencySketch.
+
+    Args:
+        output_directory: Directory of the shard directories written by run_shard
+        output_path: Path to write the normalized corpus to, compressed by its extension
+        report_path: Path to write warnings and errors to, output_path + ".report.jsonl" if not given
+        statistics_path: Path to save the merged CorpusStatistics to, see CorpusStatistics.load.
+            Requires the statistics of every shard
+        verify: Whether to check the sizes and checksums of the shard files
+        compression_level: Compression level of the output, if it is compressed in another format than the shards
+
+    Returns:
+        dict: Number of shards, of processed and changed documents and of warnings and errors, and the seconds
+            of the slowest shard and of all shards
+
+    Raises:
+        ValueError: If the shards are incomplete or inconsistent, see load_manifests,
+            or statistics are requested from shards without them
+    """
+    manifests = load_manifests(output_directory, verify)
+    directories = [shard_directory(output_directory, manifest["shard"], manifest["shards"]) for manifest in manifests]
+    report_path = report_path or output_path + ".report.jsonl"
+    compression = compression_by_extension(output_path)
+
+    outputs = [
+        os.path.join(directory, next(name for name in manifest["files"] if name.startswith("output.txt")))
+        for directory, manifest in zip(directories, manifests)
+    ]
+    if all(compression_by_extension(path) == compression for path in outputs):
+        # Concatenated gzip, bz2, xz and zstd streams are a valid stream of the concatenated data
+        with open(output_path, "wb") as output:
+            for path in outputs:
+                with open(path, "rb") as shard_output:
+                    shutil.copyfileobj(shard_output, output, 1 << 20)
+    else:
+        with open_text(output_path, "w", level=compression_level) as output:
+            for path in outputs:
+                with open_text(path) as shard_output:
+                    shutil.copyfileobj(shard_output, output, 1 << 20)
+
+    with open(report_path, "wb") as report:
+        for directory in directories:
+            with open(os.path.join(directory, REPORT_NAME), "rb") as shard_report:
+                shutil.copyfileobj(shard_report, report, 1 << 20)
+
+    if statistics_path:
+        statistics = CorpusStatistics()
+        for directory, manifest in zip(directories, manifests):
+            if STATISTICS_NAME not in manifest["files"]:
+                raise ValueError(f"Shard {manifest['shard']} has no statistics!")
+            statistics.merge(CorpusStatistics.load(os.path.join(directory, STATISTICS_NAME)))
+        statistics.save(statistics_path)
+
+    summary = {"shards": len(manifests), "documents": 0, "changed": 0, "warnings": 0, "errors": 0}
+    for manifest in manifests:
+        for key in ["documents", "changed", "warnings", "errors"]:
+            summary[key] += manifest["stats"][key]
+    summary["max_shard_seconds"] = max(manifest["timings"]["seconds"] for manifest in manifests)
+    summary["total_shard_seconds"] = sum(manifest["timings"]["seconds"] for manifest in manifests)
+
+    return summary
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from sources.helpers.corpus_runner import run_corpus
+    from sources.helpers.corpus_statistics import collect_statistics
+    from sources.helpers.read_news_stream import read_news_stream
+    from sources.normalizers.apostrophe_normalizer import ApostropheNormalizer
+    from sources.normalizers.normalization_pipeline import DEFAULT_NORMALIZERS
+
+    news = ["Сім ` я", "''Дерево'', прем`єр", "Телефон: 099 123 45 67", "У 2023 році", "'Він!' - сказав він"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        corpus_path = os.path.join(directory, "corpus.txt")
+        with open(corpus_path, "w", encoding="utf-8") as corpus:
+            corpus.write("\n\n".join(news * 7))
+
+        single_path = os.path.join(directory, "single.txt")
+        single_stats = run_corpus(corpus_path, single_path, workers=1)
+        single_statistics = collect_statistics(read_news_stream(corpus_path), workers=1)
+        with open(single_path, "rb") as file:
+            single_output = file.read()
+        with open(single_path + ".report.jsonl", "rb") as file:
+            single_report = file.read()
+
+        with NewsIndex(corpus_path) as index:
+            assert shard_ranges(index, 4, "documents") == [(0, 8), (8, 17), (17, 26), (26, 35)]
+            ranges = shard_ranges(index, 4)
+            assert ranges[0][0] == 0 and ranges[-1][1] == 35 and len(ranges) == 4
+            assert all(previous[1] == following[0] for previous, following in zip(ranges, ranges[1:]))
+            assert shard_ranges(index, 40)[-1] == (35, 35)
+
+        for by, shards, workers, compression, merged_name in [("bytes", 3, 1, None, "merged.txt"),
+                                                               ("documents", 4, 2, "gzip", "merged.txt.gz"),
+                                                               ("documents", 50, 1, None, "merged.txt.bz2")]:
+            output_directory = os.path.join(directory, f"{by}-{shards}")
+            # Shards run in any order, e.g. on different nodes
+            for shard in reversed(range(shards)):
+                manifest = run_shard(corpus_path, output_directory, shard, shards, by, workers=workers,
+                                     chunk_size=3, compression=compression)
+                assert manifest["stats"]["documents"] == manifest["stop"] - manifest["start"]
+
+            merged_path = os.path.join(directory, merged_name)
+            statistics_path = os.path.join(directory, "statistics.json")
+            summary = merge_shards(output_directory, merged_path, statistics_path=statistics_path)
+            assert summary["shards"] == shards
+            assert {key: summary[key] for key in single_stats} == single_stats, summary
+
+            with open_text(merged_path) as file:
+                assert file.read().encode("utf-8") == single_output
+            with open(merged_path + ".report.jsonl", "rb") as file:
+                assert file.read() == single_report
+
+            merged_statistics = CorpusStatistics.load(statistics_path)
+            assert merged_statistics.to_dict() == single_statistics.to_dict()
+
+        # A finished shard is not run again, a damaged one is
+        output_directory = os.path.join(directory, "bytes-3")
+        manifest = run_shard(corpus_path, output_directory, 1, 3, workers=1)
+        assert manifest["timings"]["started"] == load_manifest(shard_directory(output_directory, 1, 3))["timings"]["started"]
+
+        damaged_path = os.path.join(shard_directory(output_directory, 1, 3), "output.txt")
+        with open(damaged_path, "a", encoding="utf-8") as file:
+            file.write("damaged")
+        try:
+            merge_shards(output_directory, os.path.join(directory, "merged.txt"))
+        except ValueError as error:
+            assert "checksum" in str(error), error
+        else:
+            raise AssertionError("A damaged shard should not be merged")
+        run_shard(corpus_path, output_directory, 1, 3, workers=1)
+        merge_shards(output_directory, os.path.join(directory, "merged.txt"))
+
+        # A node that mounts the corpus at another path runs and skips shards of the same run
+        moved_path = os.path.join(directory, "mount", "corpus.txt")
+        os.makedirs(os.path.dirname(moved_path))
+        shutil.copy(corpus_path, moved_path)
+        assert run_shard(moved_path, output_directory, 1, 3, workers=1)["timings"]["started"] == \
+            load_manifest(shard_directory(output_directory, 1, 3))["timings"]["started"]
+        shutil.rmtree(shard_directory(output_directory, 0, 3))
+        run_shard(moved_path, output_directory, 0, 3, workers=1)
+        merge_shards(output_directory, os.path.join(directory, "merged.txt"))
+        with open(os.path.join(directory, "merged.txt"), "rb") as file:
+            assert file.read() == single_output
+
+        # A shard of other normalizer options is run again and is not merged with the shards of the defaults
+        changed = DEFAULT_NORMALIZERS[:2] + [ApostropheNormalizer.configured(apostrophe="'")] + DEFAULT_NORMALIZERS[3:]
+        started = load_manifest(shard_directory(output_directory, 1, 3))["timings"]["started"]
+        assert run_shard(corpus_path, output_directory, 1, 3, normalizers=changed, workers=1)["timings"]["started"] \
+            != started
+        try:
+            merge_shards(output_directory, os.path.join(directory, "merged.txt"))
+        except ValueError as error:
+            assert "different runs" in str(error), error
+        else:
+            raise AssertionError("Shards of different normalizers should not be merged")
+        run_shard(corpus_path, output_directory, 1, 3, workers=1)
+        merge_shards(output_directory, os.path.join(directory, "merged.txt"))
+
+        # Missing shards and shards of another run are rejected
+        shutil.rmtree(shard_directory(output_directory, 2, 3))
+        for damage in ["missing", "other run"]:
+            if damage == "other run":
+                run_shard(corpus_path, output_directory, 2, 3, "documents", workers=1)
+            try:
+                merge_shards(output_directory, os.path.join(directory, "merged.txt"))
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"A run with a {damage} shard should not be merged")
+
+    print("All tests passed!")
@@ -1,16 +1,184 @@
 from abc import ABC, abstractmethod
-from typing import Tuple, List
+from functools import lru_cache, update_wrapper
+from hashlib import blake2b
+from types import MethodType
+from typing import Tuple, List, Optional
+import inspect
+import sys
+
+from sources.normalizers.batch import BatchResult, run_batch
+from sources.normalizers.constants import Constants
+from sources.normalizers.edits import Edit, edits_from_events
+from sources.normalizers.events import EventCollector, EventSink
+from sources.normalizers.streaming import StreamingStage
+from sources.normalizers.triggers import Trigger, detect_triggers
+
+
+class default_instance_method:
+    """
+    Decorator for methods of normalizer instances that can also be called on the class, like the static methods
+    they replaced: NormalizerClass.method(...) runs on the default instance of the class.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        # Class calls by the class they are made on, so the default instance is looked up only when called
+        self.class_calls = {}
+        update_wrapper(self, function)
+
+    def __get__(self, instance, owner):
+        if instance is not None:
+            return MethodType(self.function, instance)
+
+        call = self.class_calls.get(owner)
+        if call is None:
+            function = self.function
+
+            def call(*args, **kwargs):
+                return function(owner.default(), *args, **kwargs)
+
+            self.class_calls[owner] = update_wrapper(call, function)
+
+        return call
 
 
 class AbstractNormalizer(ABC):
+    """
+    Base of the normalizers. A normalizer instance compiles its patterns and lookup sets once for its options,
+    so normalizing a document builds no patterns. Instances are not changed after construction and keep
+    the state of a call in its local variables, so one instance can be shared by many threads.
+    Methods can also be called on the class, e.g. ApostropheNormalizer.normalize(text), which uses the default instance.
+    """
+
+    # Whether normalize accepts a NormalizationProfiler as the profiler keyword to time its rules
+    PROFILES_RULES = False
+
     @staticmethod
     @abstractmethod
     def name() -> str:
         """Returns the name of the normalizer."""
         pass
 
-    @staticmethod
     @abstractmethod
-    def normalize(text: str) -> Tuple[str, List[str], List[str]]:
-        """Normalizes the text and returns it with a list of warnings and errors."""
+    def normalize(self, text: str, sink: Optional[EventSink] = None) -> Tuple[str, List[str], List[str]]:
+        """
+        Normalizes the text and returns it with a list of warnings and errors.
+        If a sink is given, every replacement, warning and error is also reported to it as a NormalizationEvent.
+        """
         pass
+
+    def options(self) -> dict:
+        """Returns the options the instance was created with, the keyword arguments of its constructor."""
+        return {}
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def configured(cls, **options) -> "AbstractNormalizer":
+        """Returns the shared instance with the given options, created on the first call."""
+        return cls(**options)
+
+    @classmethod
+    def default(cls) -> "AbstractNormalizer":
+        """Returns the shared instance with the default options."""
+        return cls.configured()
+
+    def with_options(self, **options) -> "AbstractNormalizer":
+        """
+        Returns the shared instance with the options of this one, changed by the given options that are not None.
+        Returns the instance itself if no option is given.
+        """
+        changed = {name: value for name, value in options.items() if value is not None}
+        if not changed:
+            return self
+
+        return type(self).configured(**{**self.options(), **changed})
+
+    def __repr__(self) -> str:
+        options = ", ".join(f"{name}={value!r}" for name, value in self.options().items())
+        return f"{type(self).__name__}({options})"
+
+    @default_instance_method
+    def triggers(self) -> Trigger:
+        """Returns the trigger classes the text must contain for the normalizer to change it."""
+        return Trigger.ALWAYS
+
+    @default_instance_method
+    def stream(self) -> StreamingStage:
+        """
+        Returns a stage that normalizes a text arriving in chunks with feed and finish,
+        with the same result as normalize on the whole text.
+        By default keeps the whole text until finish; normalizers with local rules emit text earlier.
+        """
+        return StreamingStage(self)
+
+    @default_instance_method
+    def fingerprint(self) -> str:
+        """
+        Returns a hash of the source code of the normalizer's module, of the constants and of the options.
+        It changes with the rules of the normalizer, so cached results of an older version are not reused.
+        """
+        digest = blake2b(repr(self).encode("utf-8"), digest_size=8)
+        for module in [sys.modules[type(self).__module__], sys.modules[Constants.__module__]]:
+            digest.update(inspect.getsource(module).encode("utf-8"))
+
+        return digest.hexdigest()
+
+    @default_instance_method
+    def is_triggered(self, profile: Trigger) -> bool:
+        """Checks if the text with the given profile contains any of the normalizer's trigger classes."""
+        return bool(profile & self.triggers())
+
+    @default_instance_method
+    def normalize_profiled(
+        self, text: str, profile: Optional[Trigger] = None, sink: Optional[EventSink] = None
+    ) -> Tuple[str, List[str], List[str]]:
+        """
+        Normalizes the text, or returns it unchanged if it contains none of the normalizer's trigger classes.
+
+        Args:
+            text: Input text for normalization
+            profile: Trigger classes present in the text, computed with detect_triggers if not given
+            sink: Receives the events of the normalizer
+
+        Returns:
+            Tuple[str, List[str], List[str]]: Tuple with normalized text and a list of warnings and errors
+        """
+        if profile is None:
+            profile = detect_triggers(text)
+
+        if not self.is_triggered(profile):
+            return text, [], []
+
+        return self.normalize(text) if sink is None else self.normalize(text, sink=sink)
+
+    @default_instance_method
+    def normalize_edits(self, text: str) -> Tuple[List[Edit], List[str], List[str]]:
+        """
+        Normalizes the text and returns the changes as edits instead of a new string.
+
+        Args:
+            text: Input text for normalization
+
+        Returns:
+            Tuple[List[Edit], List[str], List[str]]: Sorted (start, end, replacement) edits of the text
+                and a list of warnings and errors
+        """
+        collector = EventCollector()
+        output, warnings, errors = self.normalize(text, sink=collector)
+
+        return edits_from_events(text, output, collector.events), warnings, errors
+
+    @default_instance_method
+    def normalize_batch(self, texts, workers: int = 1) -> BatchResult:
+        """
+        Normalizes many texts in one call, e.g. a column of a dataframe or an Arrow table.
+        Texts without the normalizer's trigger classes are found in one pass and returned without a call.
+
+        Args:
+            texts: Sequence of strings, pyarrow string Array or ChunkedArray, or pandas Series of strings
+            workers: Number of threads sharing this normalizer, see run_batch
+
+        Returns:
+            BatchResult: Normalized texts with flat, offset-indexed warnings and errors, missing values stay None
+        """
+        return run_batch(texts, lambda text, profile: self.normalize(text), self.triggers(), workers)
@@ -1,75 +1,262 @@
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 import re
 
-from sources.normalizers.abstract_normalizer import AbstractNormalizer
+from sources.normalizers.abstract_normalizer import AbstractNormalizer, default_instance_method
 from sources.normalizers.constants import Constants
+from sources.normalizers.events import EventKind, EventSink, NormalizationEvent, ReplacementLog, sub_with_events
+from sources.normalizers.streaming import StreamingStage, last_cut
+from sources.normalizers.triggers import Trigger
 
 
 class ApostropheNormalizer(AbstractNormalizer):
 
+    APOSTROPHE_PATTERN = re.compile("[" + re.escape("".join(Constants.APOSTROPHES)) + "]")
+    DOUBLE_APOSTROPHE_PATTERN = re.compile("([" + re.escape("".join(Constants.APOSTROPHES)) + r"])\1")
+    DOUBLE_SYMBOL_PATTERNS = [re.compile(re.escape(symbol) * 2) for symbol in Constants.APOSTROPHES]
+    SYMBOL_ORDER = {symbol: order for order, symbol in enumerate(Constants.APOSTROPHES)}
+    PUNCTUATION = frozenset(Constants.PUNCTUATION)
+
+    def __init__(self, apostrophe=Constants.DEFAULT_APOSTROPHE, quote=Constants.DEFAULT_QUOTE):
+        """
+        Args:
+            apostrophe: Symbol to replace the apostrophe
+            quote: Symbol to replace the quotation marks
+        """
+        self.apostrophe = apostrophe
+        self.quote = quote
+
+        # A doubled symbol can only turn into a double of another symbol if the quote is an apostrophe itself
+        self.single_pass_doubles = len(quote) == 1 and quote not in ApostropheNormalizer.SYMBOL_ORDER
+        if self.single_pass_doubles:
+            self.double_patterns = [ApostropheNormalizer.DOUBLE_APOSTROPHE_PATTERN]
+        else:
+            self.double_patterns = ApostropheNormalizer.DOUBLE_SYMBOL_PATTERNS
+
+    def options(self) -> dict:
+        return {"apostrophe": self.apostrophe, "quote": self.quote}
+
     @staticmethod
     def name() -> str:
         return "ApostropheNormalizer"
 
     @staticmethod
+    def triggers() -> Trigger:
+        return Trigger.APOSTROPHE
+
+    @default_instance_method
+    def stream(self) -> StreamingStage:
+        if not self.single_pass_doubles:
+            return StreamingStage(self)
+
+        return ApostropheStage(self)
+
+    @default_instance_method
     def normalize(
+        self,
         text: str,
-        apostrophe=Constants.DEFAULT_APOSTROPHE,
-        quote=Constants.DEFAULT_QUOTE
+        apostrophe=None,
+        quote=None,
+        sink: Optional[EventSink] = None,
     ) -> Tuple[str, List[str], List[str]]:
         """
         Normalize apostrophes in the text. Handles possible use of apostrophes as quotation marks.
 
         Args:
             text: Input text for normalization
-            apostrophe: Symbol to replace the apostrophe
-            quote: Symbol to replace the quotation marks
+            apostrophe: Symbol to replace the apostrophe, the one of the instance if not given
+            quote: Symbol to replace the quotation marks, the one of the instance if not given
+            sink: Receives an event for every replaced symbol, unclassified symbol and odd number of quotes
 
         Returns:
             Tuple[str, List[str], List[str]]: Tuple with normalized text and a list of warnings and errors
         """
+        if apostrophe is not None or quote is not None:
+            return self.with_options(apostrophe=apostrophe, quote=quote).normalize(text, sink=sink)
 
+        apostrophe = self.apostrophe
+        quote = self.quote
         warnings = []
         errors = []
+        input_length = len(text)
+        log = None if sink is None else ReplacementLog()
 
-        for symbol in Constants.APOSTROPHES:
-            double_symbol_pattern = f"{re.escape(symbol)}{re.escape(symbol)}"
-            text = re.sub(double_symbol_pattern, quote, text)
-
-        text_list = list(text)
-        text_list_without_space_quote = list(text)
-        quote_count_before = text.count(quote)
-
-        for symbol in Constants.APOSTROPHES:
-            indices = [m.start() for m in re.finditer(symbol, text)]
-
-            for index in indices:
-                if index == 0 or index == len(text) - 1:
-                    text_list[index] = quote
-                    text_list_without_space_quote[index] = quote
-                elif text[index - 1].isalpha() and text[index + 1].isalpha():
-                    text_list[index] = apostrophe
-                    text_list_without_space_quote[index] = apostrophe
-                elif text[index - 1].isalpha() or text[index + 1].isalpha():
-                    text_list[index] = quote
-                    text_list_without_space_quote[index] = apostrophe
-                elif text[index - 1] in Constants.PUNCTUATION:
-                    text_list[index] = quote
-                    text_list_without_space_quote[index] = quote
-                elif text[index + 1] in Constants.PUNCTUATION:
-                    text_list[index] = quote
-                    text_list_without_space_quote[index] = quote
-                else:
-                    warnings.append(f"Warning: {symbol} at position {index}")
+        for pattern in self.double_patterns:
+            if sink is None:
+                text = pattern.sub(quote, text)
+            else:
+                text = sub_with_events(pattern, quote, text, sink, log, ApostropheNormalizer.name(), "double_apostrophe")
 
-        quote_count_after = "".join(text_list).count(quote)
+        records = None if sink is None else []
+        output = self.replace_apostrophes(text, warnings=warnings, records=records)
 
-        quote_diff = quote_count_after - quote_count_before
+        quote_diff = output.count(quote) - text.count(quote)
         if quote_diff % 2 != 0 and quote_diff != 0:
             errors.append("Warning: odd number of quotes")
-            return "".join(text_list_without_space_quote), warnings, errors
+            if sink is not None:
+                sink(NormalizationEvent(
+                    ApostropheNormalizer.name(), EventKind.ERROR, "quote_count", 0, input_length, "", "", "odd_quotes"
+                ))
+                records = []
+            output = self.replace_apostrophes(text, without_space_quote=True, records=records)
+
+        if sink is not None:
+            for index, symbol, replacement in records:
+                start, end = log.to_input(index, index + 1)
+                if replacement is None:
+                    sink(NormalizationEvent(
+                        ApostropheNormalizer.name(), EventKind.WARNING, "apostrophe", start, end, symbol, symbol,
+                        "unclassified_apostrophe",
+                    ))
+                else:
+                    sink(NormalizationEvent(
+                        ApostropheNormalizer.name(), EventKind.REPLACEMENT,
+                        "apostrophe" if replacement == apostrophe else "quote", start, end, symbol, replacement,
+                    ))
+
+        return output, warnings, errors
+
+    @default_instance_method
+    def replace_apostrophes(
+        self,
+        text: str,
+        apostrophe=None,
+        quote=None,
+        without_space_quote=False,
+        warnings: Optional[List[str]] = None,
+        records: Optional[List[Tuple[int, str, Optional[str]]]] = None,
+    ) -> str:
+        """
+        Replaces every apostrophe symbol in a single scan, classifying it by its neighbours.
+
+        Args:
+            text: Text without doubled apostrophe symbols
+            apostrophe: Symbol to replace the apostrophe, the one of the instance if not given
+            quote: Symbol to replace the quotation marks, the one of the instance if not given
+            without_space_quote: Whether a symbol next to a single letter is an apostrophe instead of a quote
+            warnings: List to add warnings about symbols that cannot be classified to
+            records: List to add (index, symbol, replacement) to for every symbol, with None for unclassified symbols
+
+        Returns:
+            str: Text with replaced apostrophe symbols
+        """
+        apostrophe = self.apostrophe if apostrophe is None else apostrophe
+        quote = self.quote if quote is None else quote
+        last_index = len(text) - 1
+        punctuation = ApostropheNormalizer.PUNCTUATION
+        unclassified = []
+
+        def replace(match):
+            index = match.start()
+            if index == 0 or index == last_index:
+                return quote
+
+            is_previous_alpha = text[index - 1].isalpha()
+            is_next_alpha = text[index + 1].isalpha()
 
-        return "".join(text_list), warnings, errors
+            if is_previous_alpha and is_next_alpha:
+                return apostrophe
+            if is_previous_alpha or is_next_alpha:
+                return apostrophe if without_space_quote else quote
+            if text[index - 1] in punctuation or text[index + 1] in punctuation:
+                return quote
+
+            unclassified.append(index)
+            return match.group()
+
+        if records is not None:
+            classify = replace
+
+            def replace(match):
+                replacement = classify(match)
+                index = match.start()
+                is_unclassified = bool(unclassified) and unclassified[-1] == index
+                records.append((index, match.group(), None if is_unclassified else replacement))
+                return replacement
+
+        output = ApostropheNormalizer.APOSTROPHE_PATTERN.sub(replace, text)
+
+        if warnings is not None and unclassified:
+            warnings.extend(ApostropheNormalizer.unclassified_warnings([(index, text[index]) for index in unclassified]))
+
+        return output
+
+    @staticmethod
+    def unclassified_warnings(unclassified: List[Tuple[int, str]]) -> List[str]:
+        """Formats warnings about unclassified (index, symbol), one by one in the order of Constants.APOSTROPHES."""
+        ordered = sorted(unclassified, key=lambda item: ApostropheNormalizer.SYMBOL_ORDER[item[1]])
+        return [f"Warning: {symbol} at position {index}" for index, symbol in ordered]
+
+
+class ApostropheStage(StreamingStage):
+    """
+    Streaming stage of ApostropheNormalizer with a quote of a single symbol that is not an apostrophe.
+
+    Symbols are classified by their direct neighbours, so the text is cut between two symbols that are not
+    apostrophes and every part is classified on its own. Only symbols next to a single letter depend on the
+    whole text: they become apostrophes instead of quotes if the number of quotes is odd. Parts are emitted
+    until the first such symbol, after that both variants are kept until finish.
+    """
+
+    def __init__(self, normalizer: ApostropheNormalizer):
+        """
+        Args:
+            normalizer: Configured ApostropheNormalizer
+        """
+        super().__init__(normalizer)
+        self.offset = 0
+        self.quote_diff = 0
+        self.unclassified = []
+        # Outputs of the parts with quotes and without them, once a part depends on the number of quotes
+        self.variants = None
+
+    @property
+    def pending(self) -> int:
+        return len(self.buffer) + (sum(map(len, self.variants[0])) if self.variants else 0)
+
+    def feed(self, chunk: str) -> str:
+        start = len(self.buffer)
+        self.buffer += chunk
+
+        cut = last_cut(self.buffer, ApostropheNormalizer.APOSTROPHE_PATTERN, start)
+        if not cut:
+            return ""
+
+        text, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        return self.normalize_part(text)
+
+    def normalize_part(self, text: str) -> str:
+        quote = self.normalizer.quote
+        text = ApostropheNormalizer.DOUBLE_APOSTROPHE_PATTERN.sub(quote, text)
+
+        records = []
+        with_quotes = self.normalizer.replace_apostrophes(text, records=records)
+        without_quotes = self.normalizer.replace_apostrophes(text, without_space_quote=True)
+
+        self.quote_diff += with_quotes.count(quote) - text.count(quote)
+        self.unclassified.extend(
+            (self.offset + index, symbol) for index, symbol, replacement in records if replacement is None
+        )
+        self.offset += len(text)
+
+        if self.variants is None and with_quotes == without_quotes:
+            return with_quotes
+
+        if self.variants is None:
+            self.variants = ([], [])
+        self.variants[0].append(with_quotes)
+        self.variants[1].append(without_quotes)
+        return ""
+
+    def finish(self) -> Tuple[str, List[str], List[str]]:
+        text, self.buffer = self.buffer, ""
+        output = self.normalize_part(text) if text else ""
+        odd = self.quote_diff % 2 != 0
+        errors = ["Warning: odd number of quotes"] if odd else []
+
+        if self.variants is not None:
+            output = "".join(self.variants[odd])
+
+        return output, ApostropheNormalizer.unclassified_warnings(self.unclassified), errors
 
 
 if __name__ == "__main__":
@@ -99,5 +286,12 @@ if __name__ == "__main__":
         output, _, _ = ApostropheNormalizer.normalize(input)
         assert output == expected_result, f"Input: {input}, expected: {expected_result}, result: {output}."
 
+    # Configured instances are shared and give the same result as the options of normalize
+    normalizer = ApostropheNormalizer.configured(apostrophe="'", quote="«")
+    assert normalizer is ApostropheNormalizer.default().with_options(apostrophe="'", quote="«")
+    assert normalizer.normalize("'прем’єр' сім`я") == ApostropheNormalizer.normalize("'прем’єр' сім`я", "'", "«")
+    assert normalizer.normalize("'прем’єр' сім`я")[0] == "«прем'єр« сім'я"
+    assert repr(normalizer) == "ApostropheNormalizer(apostrophe=\"'\", quote='«')"
+
     print("All tests passed!")
 #%%
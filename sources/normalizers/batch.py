@@ -0,0 +1,173 @@
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from sources.normalizers.triggers import Trigger, detect_batch_triggers
+
+
+class BatchResult:
+    """
+    Results of normalizing a batch of texts in a columnar layout.
+
+    Warnings and errors of all texts are kept in one flat list each. The warnings of text i are
+    warnings[warning_offsets[i]:warning_offsets[i + 1]], the same layout as an Arrow list array,
+    so a batch of millions of texts does not create two lists per text.
+    """
+
+    def __init__(self):
+        self.texts: List[Optional[str]] = []
+        self.warnings: List[str] = []
+        self.warning_offsets = array("q", [0])
+        self.errors: List[str] = []
+        self.error_offsets = array("q", [0])
+
+    def append(self, text: Optional[str], warnings: List[str], errors: List[str]):
+        self.texts.append(text)
+        if warnings:
+            self.warnings.extend(warnings)
+        if errors:
+            self.errors.extend(errors)
+        self.warning_offsets.append(len(self.warnings))
+        self.error_offsets.append(len(self.errors))
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, index: int) -> Tuple[Optional[str], List[str], List[str]]:
+        """Returns the result of the text at the index in the form of normalize."""
+        return self.texts[index], self.warnings_of(index), self.errors_of(index)
+
+    def warnings_of(self, index: int) -> List[str]:
+        return self.warnings[self.warning_offsets[index]:self.warning_offsets[index + 1]]
+
+    def errors_of(self, index: int) -> List[str]:
+        return self.errors[self.error_offsets[index]:self.error_offsets[index + 1]]
+
+    def to_arrow(self):
+        """
+        Returns the results as a pyarrow Table with the columns text, warnings and errors.
+        The list columns are built from the flat lists and offsets directly.
+
+        Raises:
+            ImportError: If pyarrow is not installed
+        """
+        import pyarrow
+
+        return pyarrow.table({
+            "text": pyarrow.array(self.texts, pyarrow.string()),
+            "warnings": pyarrow.ListArray.from_arrays(
+                pyarrow.array(self.warning_offsets, pyarrow.int32()), pyarrow.array(self.warnings, pyarrow.string())
+            ),
+            "errors": pyarrow.ListArray.from_arrays(
+                pyarrow.array(self.error_offsets, pyarrow.int32()), pyarrow.array(self.errors, pyarrow.string())
+            ),
+        })
+
+
+def as_text_list(texts) -> List[Optional[str]]:
+    """
+    Converts a batch of texts to a list of strings with None for missing values.
+
+    Args:
+        texts: Sequence of strings, pyarrow string Array or ChunkedArray, or pandas Series of strings
+
+    Returns:
+        List[Optional[str]]: Texts of the batch
+    """
+    # pyarrow arrays, nulls become None
+    if hasattr(texts, "to_pylist"):
+        return texts.to_pylist()
+
+    # pandas Series, missing values are None or NaN
+    if hasattr(texts, "isna") and hasattr(texts, "tolist"):
+        return [None if missing else text for text, missing in zip(texts.tolist(), texts.isna().tolist())]
+
+    return list(texts)
+
+
+def run_batch(
+    texts,
+    normalize: Callable[[str, Trigger], Tuple[str, List[str], List[str]]],
+    triggers: Trigger,
+    workers: int = 1,
+) -> BatchResult:
+    """
+    Normalizes a batch of texts. Profiles of all texts are computed in one pass over the joined texts,
+    and texts without any of the trigger classes are copied to the result without a call.
+
+    Args:
+        texts: Sequence of strings, pyarrow string Array or ChunkedArray, or pandas Series of strings
+        normalize: Normalizes a text with the given profile, called from several threads if workers > 1
+        triggers: Trigger classes of the normalizer or pipeline
+        workers: Number of threads that normalize the triggered texts in slices. The threads share the normalizers,
+            so nothing is copied or pickled. They run in parallel on free-threaded CPython
+
+    Returns:
+        BatchResult: Normalized texts, missing values stay None
+    """
+    texts = as_text_list(texts)
+    profiles = detect_batch_triggers(texts)
+    result = BatchResult()
+
+    if workers > 1:
+        triggered = [position for position, profile in enumerate(profiles) if profile & triggers]
+        outputs = dict(zip(triggered, run_in_threads(texts, profiles, triggered, normalize, workers)))
+
+        for position, text in enumerate(texts):
+            if position in outputs:
+                result.append(*outputs[position])
+            else:
+                result.append(text, [], [])
+
+        return result
+
+    for text, profile in zip(texts, profiles):
+        if profile & triggers:
+            result.append(*normalize(text, profile))
+        else:
+            result.append(text, [], [])
+
+    return result
+
+
+def run_in_threads(
+    texts: List[Optional[str]],
+    profiles: List[Trigger],
+    positions: List[int],
+    normalize: Callable[[str, Trigger], Tuple[str, List[str], List[str]]],
+    workers: int,
+) -> List[Tuple[str, List[str], List[str]]]:
+    """Normalizes the texts at the positions on a pool of threads, a few slices per thread, in their order."""
+    slice_size = max(1, -(-len(positions) // (4 * workers)))
+    slices = [positions[start:start + slice_size] for start in range(0, len(positions), slice_size)]
+
+    def normalize_slice(positions_slice: List[int]) -> List[Tuple[str, List[str], List[str]]]:
+        return [normalize(texts[position], profiles[position]) for position in positions_slice]
+
+    outputs = []
+    with ThreadPoolExecutor(min(workers, len(slices)) or 1) as executor:
+        for slice_outputs in executor.map(normalize_slice, slices):
+            outputs.extend(slice_outputs)
+
+    return outputs
+
+
+if __name__ == "__main__":
+    result = run_batch(
+        ["a'b", "c", None, "d'"],
+        lambda text, profile: (text.replace("'", "ʼ"), ["warning"] if text.endswith("'") else [], []),
+        Trigger.APOSTROPHE,
+    )
+    assert result.texts == ["aʼb", "c", None, "dʼ"]
+    assert list(result.warning_offsets) == [0, 0, 0, 0, 1] and list(result.error_offsets) == [0] * 5
+    assert result[3] == ("dʼ", ["warning"], []) and result[1] == ("c", [], [])
+    assert len(result) == 4
+
+    texts = [f"{number}'" if number % 3 else str(number) for number in range(1000)] + [None]
+    threaded = run_batch(texts, lambda text, profile: (text.replace("'", "ʼ"), [text], []), Trigger.APOSTROPHE, 4)
+    sequential = run_batch(texts, lambda text, profile: (text.replace("'", "ʼ"), [text], []), Trigger.APOSTROPHE)
+    assert threaded.texts == sequential.texts and threaded.warnings == sequential.warnings
+    assert threaded.warning_offsets == sequential.warning_offsets
+    assert run_batch([], lambda text, profile: (text, [], []), Trigger.ALWAYS, 4).texts == []
+
+    print("All tests passed!")
@@ -0,0 +1,99 @@
+from time import perf_counter
+from typing import List, Optional, Tuple
+
+from sources.normalizers.events import EventKind, EventSink, NormalizationEvent
+
+
+class DocumentBudget:
+    """
+    Limits the work NormalizationPipeline spends on a single document, so one pathological document,
+    e.g. a scraped table of digits or a wall of quotation marks, cannot stall a worker.
+
+    A document longer than max_length is not normalized, and a document that is still being normalized after
+    max_seconds is given up on after the current stage. Every stage takes time linear in the length of the text,
+    so the latency is bounded by max_seconds and a single stage. Either way the document is passed through unchanged
+    with a single error, and the sink, if given, receives an error event with LENGTH_CODE or TIME_CODE.
+    """
+
+    # Rule and codes of the error events
+    RULE = "DocumentBudget"
+    LENGTH_CODE = "length_budget"
+    TIME_CODE = "time_budget"
+
+    def __init__(self, max_length: Optional[int] = None, max_seconds: Optional[float] = None):
+        """
+        Args:
+            max_length: Maximum number of characters of a normalized document, unlimited if not given
+            max_seconds: Maximum time spent on a document in seconds, unlimited if not given
+
+        Raises:
+            ValueError: If a limit is not positive
+        """
+        if max_length is not None and max_length <= 0:
+            raise ValueError("The length budget must be positive!")
+        if max_seconds is not None and max_seconds <= 0:
+            raise ValueError("The time budget must be positive!")
+
+        self.max_length = max_length
+        self.max_seconds = max_seconds
+        self.length_error = f"The document is longer than {max_length} characters and was left unchanged!"
+        self.time_error = f"Normalization took longer than {max_seconds} seconds, the document was left unchanged!"
+
+    def __repr__(self) -> str:
+        return f"DocumentBudget(max_length={self.max_length}, max_seconds={self.max_seconds})"
+
+    def exceeds_length(self, text: str) -> bool:
+        return self.max_length is not None and len(text) > self.max_length
+
+    def deadline(self) -> Optional[float]:
+        """Returns the perf_counter value a document started now has to be normalized by, None without a time limit."""
+        return None if self.max_seconds is None else perf_counter() + self.max_seconds
+
+    def is_fallback(self, result: Tuple[str, List[str], List[str]]) -> bool:
+        """Checks if the result is the pass-through of a document over the budget, which must not be cached."""
+        return result[2] == [self.length_error] or result[2] == [self.time_error]
+
+    def fallback(
+        self, text: str, code: str, normalizer: str, sink: Optional[EventSink] = None
+    ) -> Tuple[str, List[str], List[str]]:
+        """
+        Returns the document unchanged with the error of the exceeded limit and reports it to the sink.
+
+        Args:
+            text: The document as it was given to the pipeline
+            code: LENGTH_CODE or TIME_CODE
+            normalizer: Name of the pipeline that gave up on the document
+            sink: Receives an error event spanning the whole document
+
+        Returns:
+            Tuple[str, List[str], List[str]]: The document, no warnings and the error
+        """
+        error = self.length_error if code == DocumentBudget.LENGTH_CODE else self.time_error
+        if sink is not None:
+            sink(NormalizationEvent(normalizer, EventKind.ERROR, DocumentBudget.RULE, 0, len(text), text, text, code))
+
+        return text, [], [error]
+
+
+if __name__ == "__main__":
+    from sources.normalizers.events import EventCollector
+
+    budget = DocumentBudget(max_length=5)
+    assert budget.exceeds_length("abcdef") and not budget.exceeds_length("abcde")
+    assert budget.deadline() is None
+    assert DocumentBudget(max_seconds=1.0).deadline() > perf_counter()
+
+    collector = EventCollector()
+    result = budget.fallback("abcdef", DocumentBudget.LENGTH_CODE, "NormalizationPipeline", collector)
+    assert result == ("abcdef", [], [budget.length_error]) and budget.is_fallback(result)
+    assert [event.code for event in collector.events] == [DocumentBudget.LENGTH_CODE]
+    assert not budget.is_fallback(("abcdef", [], []))
+
+    for limits in [{"max_length": 0}, {"max_seconds": -1.0}]:
+        try:
+            DocumentBudget(**limits)
+        except ValueError:
+            continue
+        raise AssertionError(f"{limits} should be rejected")
+
+    print("All tests passed!")
@@ -0,0 +1,233 @@
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Tuple
+
+from sources.normalizers.events import EventKind, NormalizationEvent
+
+# Replacement of text[start:end] with a string, in the coordinates of the original text
+Edit = Tuple[int, int, str]
+
+
+def apply_edits(text: str, edits: List[Edit]) -> str:
+    """Applies sorted, non-overlapping edits to the text."""
+    parts = []
+    position = 0
+    for start, end, replacement in edits:
+        parts.append(text[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(text[position:])
+
+    return "".join(parts)
+
+
+def trim_edit(text: str, output: str) -> List[Edit]:
+    """Returns the difference of two texts as at most one edit, without their common prefix and suffix."""
+    if text == output:
+        return []
+
+    prefix = 0
+    limit = min(len(text), len(output))
+    while prefix < limit and text[prefix] == output[prefix]:
+        prefix += 1
+
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and text[-suffix - 1] == output[-suffix - 1]:
+        suffix += 1
+
+    return [(prefix, len(text) - suffix, output[prefix:len(output) - suffix])]
+
+
+def edits_from_events(text: str, output: str, events: Iterable[NormalizationEvent]) -> List[Edit]:
+    """
+    Builds the edits that turn the input of a normalizer into its output from the replacement events it reported.
+
+    Events of later rules may overlap the spans of earlier ones, so overlapping and touching spans are merged
+    into one edit, and the replacement of every edit is cut from the output. If the events do not explain
+    the output, falls back to a single edit around the changed part.
+
+    Args:
+        text: Input of the normalizer
+        output: Output of the normalizer
+        events: Events the normalizer reported for the text
+
+    Returns:
+        List[Edit]: Sorted, non-overlapping edits
+    """
+    changes = sorted(
+        (event.start, event.end, len(event.replacement) - len(event.original))
+        for event in events
+        if event.kind is EventKind.REPLACEMENT and event.original != event.replacement
+    )
+
+    edits = []
+    shift = 0
+    position = 0
+    while position < len(changes):
+        start, end, length_change = changes[position]
+        position += 1
+        while position < len(changes) and changes[position][0] <= end:
+            end = max(end, changes[position][1])
+            length_change += changes[position][2]
+            position += 1
+
+        output_start = start + shift
+        output_end = end + shift + length_change
+        if not start <= end <= len(text) or output_end < output_start:
+            return trim_edit(text, output)
+
+        replacement = output[output_start:output_end]
+        shift += length_change
+        if replacement != text[start:end]:
+            edits.append((start, end, replacement))
+
+    if len(text) + shift != len(output) or apply_edits(text, edits) != output:
+        return trim_edit(text, output)
+
+    return edits
+
+
+def compose_edits(first: List[Edit], second: List[Edit], middle: str) -> List[Edit]:
+    """
+    Combines two consecutive edit lists into one against the original text.
+
+    Args:
+        first: Edits of the original text that produce middle
+        second: Edits of middle
+        middle: Text between the two edit lists
+
+    Returns:
+        List[Edit]: Sorted, non-overlapping edits of the original text that produce the result of second
+    """
+    result = []
+    # Difference between the positions in middle and in the original text after the processed first edits
+    shift = 0
+    i = j = 0
+
+    while i < len(first) or j < len(second):
+        first_start = first[i][0] + shift if i < len(first) else None
+        if j == len(second) or (first_start is not None and first_start <= second[j][0]):
+            group_start = first_start
+        else:
+            group_start = second[j][0]
+
+        original_start = group_start - shift
+        group_end = group_start
+        # Edits of second inside the group, relative to group_start
+        inner = []
+
+        while True:
+            if i < len(first) and first[i][0] + shift <= group_end:
+                start, end, replacement = first[i]
+                group_end = max(group_end, start + shift + len(replacement))
+                shift += len(replacement) - (end - start)
+                i += 1
+            elif j < len(second) and second[j][0] <= group_end:
+                start, end, replacement = second[j]
+                inner.append((start - group_start, end - group_start, replacement))
+                group_end = max(group_end, end)
+                j += 1
+            else:
+                break
+
+        original_end = group_end - shift
+        result.append((original_start, original_end, apply_edits(middle[group_start:group_end], inner)))
+
+    return result
+
+
+class OffsetMap:
+    """
+    Translates positions between the original and the normalized text in O(log n) from the edit list.
+
+    Positions outside the edits move by the length change of the edits before them. A position inside a replaced
+    part has no exact counterpart, so it is moved to the start of the part, or to its end for span ends,
+    which keeps a mapped span covering the whole replacement it overlaps.
+    """
+
+    def __init__(self, edits: List[Edit]):
+        """
+        Args:
+            edits: Sorted, non-overlapping edits of the original text
+        """
+        self.original_starts = []
+        self.original_ends = []
+        self.normalized_starts = []
+        self.normalized_ends = []
+
+        shift = 0
+        for start, end, replacement in edits:
+            self.original_starts.append(start)
+            self.original_ends.append(end)
+            self.normalized_starts.append(start + shift)
+            shift += len(replacement) - (end - start)
+            self.normalized_ends.append(end + shift)
+
+    @staticmethod
+    def translate(position: int, end: bool, starts: List[int], ends: List[int], target_starts: List[int],
+                  target_ends: List[int]) -> int:
+        # Last edit starting before the position, or at it for span starts
+        index = (bisect_left(starts, position) if end else bisect_right(starts, position)) - 1
+        if index < 0:
+            return position
+
+        if position < ends[index]:
+            return target_ends[index] if end else target_starts[index]
+
+        return position - ends[index] + target_ends[index]
+
+    def to_normalized(self, position: int, end: bool = False) -> int:
+        """Maps a position in the original text to the normalized text, as a span end if end is True."""
+        return self.translate(
+            position, end, self.original_starts, self.original_ends, self.normalized_starts, self.normalized_ends
+        )
+
+    def to_original(self, position: int, end: bool = False) -> int:
+        """Maps a position in the normalized text to the original text, as a span end if end is True."""
+        return self.translate(
+            position, end, self.normalized_starts, self.normalized_ends, self.original_starts, self.original_ends
+        )
+
+    def span_to_normalized(self, start: int, end: int) -> Tuple[int, int]:
+        return self.to_normalized(start), max(self.to_normalized(start), self.to_normalized(end, end=True))
+
+    def span_to_original(self, start: int, end: int) -> Tuple[int, int]:
+        return self.to_original(start), max(self.to_original(start), self.to_original(end, end=True))
+
+
+if __name__ == "__main__":
+    text = "a''b''c"
+    first = [(1, 3, '"'), (4, 6, '"')]
+    middle = apply_edits(text, first)
+    assert middle == 'a"b"c', middle
+
+    second = [(2, 2, "b"), (4, 5, "cc")]
+    composed = compose_edits(first, second, middle)
+    assert composed == [(1, 3, '"b'), (4, 7, '"cc')], composed
+    assert apply_edits(text, composed) == apply_edits(middle, second) == 'a"bb"cc'
+
+    assert compose_edits([], second, middle) == second
+    assert compose_edits(first, [], middle) == first
+
+    events = [
+        NormalizationEvent("Normalizer", EventKind.REPLACEMENT, "double", 1, 3, "''", '"'),
+        NormalizationEvent("Normalizer", EventKind.REPLACEMENT, "double", 4, 6, "''", '"'),
+        NormalizationEvent("Normalizer", EventKind.REPLACEMENT, "quote", 1, 3, '"', "«"),
+        NormalizationEvent("Normalizer", EventKind.WARNING, "quote", 0, 7, "", "", "code"),
+    ]
+    assert edits_from_events(text, "a«b\"c", events) == [(1, 3, "«"), (4, 6, '"')]
+    # Events that do not explain the output
+    assert edits_from_events(text, "a«b»»c", events) == [(1, 6, "«b»»")]
+    assert trim_edit("abc", "abc") == [] and trim_edit("aaa", "aaaa") == [(3, 3, "a")]
+
+    # "Сім ` я" -> "Сімʼя"
+    offsets = OffsetMap([(3, 6, "ʼ")])
+    assert [offsets.to_normalized(position) for position in range(8)] == [0, 1, 2, 3, 3, 3, 4, 5]
+    assert [offsets.to_original(position) for position in range(6)] == [0, 1, 2, 3, 6, 7]
+    assert offsets.span_to_normalized(0, 3) == (0, 3)
+    assert offsets.span_to_normalized(0, 7) == (0, 5)
+    assert offsets.span_to_normalized(4, 5) == (3, 4)
+    assert offsets.span_to_original(0, 5) == (0, 7)
+    assert offsets.span_to_original(3, 4) == (3, 6)
+
+    print("All tests passed!")
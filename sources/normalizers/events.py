@@ -0,0 +1,177 @@
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from enum import Enum
+from typing import Callable, List, NamedTuple, Optional, Tuple
+import re
+
+
+class EventKind(str, Enum):
+    REPLACEMENT = "replacement"
+    WARNING = "warning"
+    ERROR = "error"
+
+
+class NormalizationEvent(NamedTuple):
+    """
+    A single decision of a normalizer: a replacement, or a warning or error about a part of the text.
+
+    The span is given in the text passed to the normalizer. The original fragment is the one the rule saw,
+    so it differs from the span of the input if an earlier rule of the same normalizer has already changed it.
+    """
+
+    # Name of the normalizer, e.g. "UkrainianPhoneNormalizer"
+    normalizer: str
+    kind: EventKind
+    # Rule or pattern that made the decision, e.g. "REGULAR_PHONE_PATTERNS[3]" or "apostrophe"
+    rule: str
+    start: int
+    end: int
+    original: str
+    replacement: str
+    # Machine-readable code of a warning or error, e.g. "odd_quotes"
+    code: Optional[str] = None
+
+
+# Any callable that accepts events, e.g. EventCollector or list.append
+EventSink = Callable[[NormalizationEvent], None]
+
+
+class EventCollector:
+    """Sink that keeps all events in a list."""
+
+    def __init__(self):
+        self.events: List[NormalizationEvent] = []
+
+    def __call__(self, event: NormalizationEvent):
+        self.events.append(event)
+
+    def clear(self):
+        self.events.clear()
+
+
+class EventCounter:
+    """
+    Sink that counts events by a key, by (normalizer, kind, rule, code) if no key function is given.
+    Events for which the key function returns None are not counted.
+    """
+
+    def __init__(self, key: Optional[Callable[[NormalizationEvent], object]] = None):
+        self.key = key or (lambda event: (event.normalizer, event.kind.value, event.rule, event.code))
+        self.counts = Counter()
+
+    def __call__(self, event: NormalizationEvent):
+        key = self.key(event)
+        if key is not None:
+            self.counts[key] += 1
+
+
+class ReplacementLog:
+    """
+    Replacements made by the consecutive steps of a normalizer. Maps spans of an intermediate text
+    back to the input of the first step, so events of every step are reported in the same coordinates.
+    """
+
+    def __init__(self):
+        # For every step with replacements: their starts in the step output and (start, end, length)
+        # in the step input, sorted and non-overlapping
+        self.steps: List[Tuple[List[int], List[Tuple[int, int, int]]]] = []
+
+    def add_step(self, replacements: List[Tuple[int, int, int]]):
+        """
+        Records the replacements of a step as (start, end, replacement length) in the step input, in text order.
+        """
+        if not replacements:
+            return
+
+        output_starts = []
+        shift = 0
+        for start, end, length in replacements:
+            output_starts.append(start + shift)
+            shift += length - (end - start)
+
+        self.steps.append((output_starts, replacements))
+
+    def to_input(self, start: int, end: int) -> Tuple[int, int]:
+        """
+        Maps a span of the last step output to the input. A span that touches a replaced part
+        is extended to the whole part it replaced.
+        """
+        for output_starts, replacements in reversed(self.steps):
+            position = bisect_right(output_starts, start) - 1
+            if position >= 0:
+                input_start, input_end, length = replacements[position]
+                output_start = output_starts[position]
+                start = input_start if start < output_start + length else start - output_start - length + input_end
+
+            position = bisect_left(output_starts, end) - 1
+            if position >= 0:
+                input_start, input_end, length = replacements[position]
+                output_start = output_starts[position]
+                end = input_end if end <= output_start + length else end - output_start - length + input_end
+
+        return start, end
+
+
+def sub_with_events(
+    pattern: re.Pattern, replacement: str, text: str, sink: EventSink, log: ReplacementLog, normalizer: str, rule: str
+) -> str:
+    """
+    Same as pattern.sub(replacement, text), but reports every replacement to the sink with the span mapped
+    to the normalizer input through the log, and records the replacements in the log as the next step.
+    """
+    replacements = []
+
+    def replace(match):
+        result = match.expand(replacement)
+        replacements.append((match.start(), match.end(), match.group(), result))
+        return result
+
+    output = pattern.sub(replace, text)
+
+    for start, end, original, result in replacements:
+        input_start, input_end = log.to_input(start, end)
+        sink(NormalizationEvent(normalizer, EventKind.REPLACEMENT, rule, input_start, input_end, original, result))
+
+    log.add_step([(start, end, len(result)) for start, end, _, result in replacements])
+    return output
+
+
+if __name__ == "__main__":
+    log = ReplacementLog()
+    # "a''b''c" -> 'a"b"c' -> 'a"bb"c'
+    log.add_step([(1, 3, 1), (4, 6, 1)])
+    log.add_step([(3, 3, 1)])
+
+    tests = [
+        ((0, 1), (0, 1)),  # a
+        ((1, 2), (1, 3)),  # "
+        ((2, 3), (3, 4)),  # b
+        ((3, 4), (4, 4)),  # inserted b
+        ((4, 5), (4, 6)),  # "
+        ((5, 6), (6, 7)),  # c
+        ((0, 6), (0, 7)),
+    ]
+
+    for span, expected_result in tests:
+        result = log.to_input(*span)
+        assert result == expected_result, f"Span: {span}, expected: {expected_result}, result: {result}."
+
+    counter = EventCounter()
+    collector = EventCollector()
+    for sink in (counter, collector):
+        sink(NormalizationEvent("Normalizer", EventKind.REPLACEMENT, "rule", 0, 1, "'", "ʼ"))
+        sink(NormalizationEvent("Normalizer", EventKind.REPLACEMENT, "rule", 3, 4, "'", "ʼ"))
+
+    assert counter.counts == {("Normalizer", "replacement", "rule", None): 2}, counter.counts
+    assert [event.start for event in collector.events] == [0, 3]
+
+    log = ReplacementLog()
+    collector.clear()
+    text = sub_with_events(re.compile("''"), '"', "a''b''c", collector, log, "Normalizer", "double")
+    text = sub_with_events(re.compile('"b'), '"bb', text, collector, log, "Normalizer", "double_b")
+    assert text == 'a"bb"c', text
+    assert [(event.start, event.end, event.original) for event in collector.events] == [
+        (1, 3, "''"), (4, 6, "''"), (1, 4, '"b')
+    ], collector.events
+
+    print("All tests passed!")
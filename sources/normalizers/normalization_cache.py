@@ -0,0 +1,250 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+
+Result = Tuple[str, List[str], List[str]]
+
+
+def content_hash(text: str) -> bytes:
+    """Returns a 128-bit hash of the text, stable across processes and runs unlike hash()."""
+    return blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+class NormalizationCache:
+    """
+    Bounded cache of normalization results, keyed by the fingerprint of a normalizer and the hash of its input.
+
+    Results are kept in memory with least recently used eviction. With a path, they are also stored in an SQLite
+    database, which outlives the run and can be shared by several processes: a memory miss falls back to the
+    database before the normalizer is called. Fingerprints change with the rules of a normalizer, so after a rule
+    change only the results of the changed normalizer miss.
+
+    The cache can be shared by the threads of a thread pool, every method holds a lock of the cache.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 100000,
+        max_characters: Optional[int] = None,
+        path: Optional[str] = None,
+        max_stored_entries: Optional[int] = 10000000,
+        commit_every: int = 1000,
+    ):
+        """
+        Args:
+            max_entries: Maximum number of results in memory
+            max_characters: Maximum total length of cached inputs and outputs in memory, unlimited if not given
+            path: Path to the SQLite database to store the results in, memory only if not given
+            max_stored_entries: Maximum number of results in the database, the least recently stored are removed
+            commit_every: Number of stored results between database commits
+        """
+        self.max_entries = max_entries
+        self.max_characters = max_characters
+        self.path = path
+        self.max_stored_entries = max_stored_entries
+        self.commit_every = commit_every
+
+        self.entries: "OrderedDict[bytes, Tuple[Result, int]]" = OrderedDict()
+        self.characters = 0
+        self.hits = 0
+        self.stored_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.connection: Optional[sqlite3.Connection] = None
+        self.connection_pid = None
+        self.uncommitted = 0
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        # Sent to worker processes empty and without the connection, every process opens its own
+        state = self.__dict__.copy()
+        state.update(entries=OrderedDict(), characters=0, connection=None, connection_pid=None, uncommitted=0)
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def database(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+
+        if self.connection is None or self.connection_pid != os.getpid():
+            # Used by every thread of the process, always under the lock of the cache
+            self.connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, result TEXT NOT NULL)"
+            )
+            self.connection_pid = os.getpid()
+            self.uncommitted = 0
+
+        return self.connection
+
+    @staticmethod
+    def key(fingerprint: str, text: str) -> bytes:
+        return fingerprint.encode("utf-8") + b":" + content_hash(text)
+
+    def get(self, fingerprint: str, text: str) -> Optional[Result]:
+        """Returns the cached result of the normalizer with the fingerprint for the text, or None."""
+        key = self.key(fingerprint, text)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            database = self.database()
+            if database is not None:
+                row = database.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    output, warnings, errors = json.loads(row[0])
+                    result = (text if output is None else output, warnings, errors)
+                    self.remember(key, text, result)
+                    self.stored_hits += 1
+                    return result
+
+            self.misses += 1
+            return None
+
+    def put(self, fingerprint: str, text: str, result: Result):
+        """Caches the result of the normalizer with the fingerprint for the text."""
+        key = self.key(fingerprint, text)
+        if result[0] is not text and result[0] == text:
+            result = (text, result[1], result[2])
+
+        with self.lock:
+            self.remember(key, text, result)
+
+            database = self.database()
+            if database is not None:
+                output, warnings, errors = result
+                stored = json.dumps([None if output == text else output, warnings, errors], ensure_ascii=False)
+                database.execute("INSERT OR REPLACE INTO results (key, result) VALUES (?, ?)", (key, stored))
+
+                self.uncommitted += 1
+                if self.uncommitted >= self.commit_every:
+                    self.commit()
+
+    def remember(self, key: bytes, text: str, result: Result):
+        # Unchanged outputs are the same object as the input, so they take no extra memory
+        size = len(text) + (0 if result[0] is text else len(result[0]))
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.characters -= previous[1]
+
+        self.entries[key] = (result, size)
+        self.characters += size
+
+        while len(self.entries) > self.max_entries or (
+            self.max_characters is not None and self.characters > self.max_characters and len(self.entries) > 1
+        ):
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.characters -= evicted_size
+            self.evictions += 1
+
+    def commit(self):
+        """Writes the stored results to the database and removes the oldest ones above max_stored_entries."""
+        with self.lock:
+            database = self.database()
+            if database is None:
+                return
+
+            if self.max_stored_entries is not None:
+                database.execute(
+                    "DELETE FROM results WHERE rowid <= (SELECT MAX(rowid) FROM results) - ?",
+                    (self.max_stored_entries,),
+                )
+            database.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.connection_pid == os.getpid():
+                self.commit()
+                self.connection.close()
+            self.connection = None
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "stored_hits": self.stored_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "characters": self.characters,
+            }
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    cache = NormalizationCache(max_entries=2)
+    assert cache.get("stage", "a") is None
+    cache.put("stage", "a", ("A", [], []))
+    cache.put("stage", "b", ("b", ["warning"], []))
+    assert cache.get("stage", "a") == ("A", [], [])
+    assert cache.get("other stage", "a") is None
+
+    # "b" is the least recently used entry
+    cache.put("stage", "c", ("C", [], ["error"]))
+    assert cache.get("stage", "b") is None
+    assert cache.get("stage", "a") == ("A", [], [])
+    assert cache.stats() == {
+        "hits": 2, "stored_hits": 0, "misses": 3, "evictions": 1, "entries": 2, "characters": 4
+    }, cache.stats()
+
+    cache = NormalizationCache(max_characters=10)
+    for text in ["aaaa", "bbbb", "cccc"]:
+        cache.put("stage", text, (text, [], []))
+    assert cache.get("stage", "aaaa") is None and cache.get("stage", "cccc") is not None
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.sqlite")
+
+        cache = NormalizationCache(path=path, max_stored_entries=2)
+        cache.put("stage", "a", ("a", [], []))
+        cache.put("stage", "b", ("B", ["warning"], []))
+        cache.put("stage", "c", ("C", [], []))
+        cache.close()
+
+        cache = NormalizationCache(path=path)
+        assert cache.get("stage", "a") is None
+        assert cache.get("stage", "b") == ("B", ["warning"], [])
+        assert cache.get("stage", "b") == ("B", ["warning"], [])
+        assert cache.stats()["stored_hits"] == 1 and cache.stats()["hits"] == 1
+        cache.close()
+
+        # Threads share the memory entries and the database connection
+        import pickle
+        from concurrent.futures import ThreadPoolExecutor
+
+        cache = NormalizationCache(max_entries=50, path=path, commit_every=7)
+
+        def use(thread):
+            for number in range(200):
+                text = f"{thread}-{number % 60}"
+                if cache.get("threads", text) is None:
+                    cache.put("threads", text, (text.upper(), [], []))
+                assert cache.get("threads", text) == (text.upper(), [], [])
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(use, range(8)))
+
+        stats = cache.stats()
+        assert stats["entries"] == 50 and stats["hits"] + stats["stored_hits"] + stats["misses"] == 8 * 200 * 2, stats
+        copy = pickle.loads(pickle.dumps(cache))
+        cache.close()
+        assert not copy.entries and copy.get("threads", "0-1") == ("0-1".upper(), [], [])
+        copy.close()
+
+    print("All tests passed!")
@@ -0,0 +1,526 @@
+from time import perf_counter
+from typing import Tuple, List, Iterable, Iterator, Optional, Sequence, Type, Union
+
+from sources.normalizers.abstract_normalizer import AbstractNormalizer
+from sources.normalizers.apostrophe_normalizer import ApostropheNormalizer
+from sources.normalizers.batch import BatchResult, run_batch
+from sources.normalizers.budget import DocumentBudget
+from sources.normalizers.edits import Edit, apply_edits, compose_edits
+from sources.normalizers.events import EventSink
+from sources.normalizers.normalization_cache import NormalizationCache
+from sources.normalizers.profiling import NormalizationProfiler
+from sources.normalizers.quotation_marks_normalizer import QuotationMarksNormalizer
+from sources.normalizers.streaming import PipelineStream
+from sources.normalizers.redundant_apostrophe_spaces_normalizer import RedundantApostropheSpacesNormalizer
+from sources.normalizers.triggers import Trigger, detect_triggers
+from sources.normalizers.ukrainian_phone_normalizer import UkrainianPhoneNormalizer
+
+# Pairs of normalizer names (earlier, later) that must keep this order when both are in a pipeline
+ORDER_CONSTRAINTS = [
+    # Spaces around apostrophes have to be removed before the apostrophes are classified: «сім ʼ я»
+    (RedundantApostropheSpacesNormalizer.name(), ApostropheNormalizer.name()),
+    # Apostrophes used as quotation marks are replaced with the delimiter that QuotationMarksNormalizer expects
+    (ApostropheNormalizer.name(), QuotationMarksNormalizer.name()),
+]
+
+# A normalizer class runs with its default options, an instance with the options it was created with
+NormalizerSpec = Union[Type[AbstractNormalizer], AbstractNormalizer]
+
+DEFAULT_NORMALIZERS = [
+    UkrainianPhoneNormalizer,
+    RedundantApostropheSpacesNormalizer,
+    ApostropheNormalizer,
+    QuotationMarksNormalizer,
+]
+
+
+class StageObserver:
+    """
+    Receives the result of every stage of a NormalizationPipeline, e.g. to collect statistics of the intermediate
+    texts in the same pass as the normalization, see CorpusStatistics.observe.
+    """
+
+    def stage_sink(self, normalizer: AbstractNormalizer) -> Optional[EventSink]:
+        """Returns the sink of the events of the stage, or None if its events are not needed."""
+        return None
+
+    def observe_stage(self, normalizer: AbstractNormalizer, text: str, result: Tuple[str, List[str], List[str]]):
+        """Called after every stage with the text it was given and its result. A skipped stage returns the text."""
+
+
+def join_sinks(first: Optional[EventSink], second: Optional[EventSink]) -> Optional[EventSink]:
+    """Returns a sink that passes every event to both sinks, or the one that is given."""
+    if first is None or second is None:
+        return first or second
+
+    def sink(event):
+        first(event)
+        second(event)
+
+    return sink
+
+
+class NormalizationPipeline:
+    """
+    Runs an ordered list of normalizers over a text.
+
+    Normalizers are given as classes, which run with their default options, or as configured instances,
+    e.g. ApostropheNormalizer.configured(quote="«"). Classes are resolved to their shared default instances once,
+    so no stage compiles patterns per document.
+
+    The order is validated once on creation. For every document the trigger profile is computed once and shared
+    by all stages: a stage is skipped when the text has none of its trigger classes, and the profile is only
+    recomputed after a stage changes the text. Warnings and errors of all stages are collected into one list each.
+
+    With a cache, the result of the whole pipeline is looked up by the fingerprints of all stages and the hash of
+    the document, and on a miss the result of every stage by its fingerprint and the hash of the stage input,
+    so after a rule change only the changed stages run again. Calls with a sink bypass the cache,
+    because cached results have no events, and calls with an observer bypass the cache of the whole pipeline.
+
+    With a budget, documents over its length limit are passed through unchanged with an error, and so are documents
+    that are still being normalized after its time limit, checked after every stage, see DocumentBudget.
+    """
+
+    def __init__(
+        self,
+        normalizers: Optional[Sequence[NormalizerSpec]] = None,
+        profiler: Optional[NormalizationProfiler] = None,
+        cache: Optional[NormalizationCache] = None,
+        budget: Optional[DocumentBudget] = None,
+    ):
+        """
+        Args:
+            normalizers: Normalizer classes or instances in the order they should run, DEFAULT_NORMALIZERS if not given
+            profiler: Records the time of every stage, phone pattern and document if given
+            cache: Cache of the stage results, see NormalizationCache
+            budget: Length and time limits of a document, see DocumentBudget
+
+        Raises:
+            ValueError: If the list is empty, contains a normalizer twice or breaks ORDER_CONSTRAINTS
+        """
+        if normalizers is None:
+            normalizers = DEFAULT_NORMALIZERS
+
+        self.normalizers = [
+            normalizer if isinstance(normalizer, AbstractNormalizer) else normalizer.default()
+            for normalizer in normalizers
+        ]
+        self.validate_order(self.normalizers)
+        self.profiler = profiler
+        self.cache = cache
+        self.budget = budget
+        self.fingerprints = [normalizer.fingerprint() for normalizer in self.normalizers] if cache else None
+        self.fingerprint = "+".join(self.fingerprints) if cache else None
+
+    @staticmethod
+    def validate_order(normalizers: Sequence[NormalizerSpec]):
+        """
+        Checks that the normalizers can run in the given order.
+
+        Raises:
+            ValueError: If the list is empty, contains a normalizer twice or breaks ORDER_CONSTRAINTS
+        """
+        if not normalizers:
+            raise ValueError("The pipeline must contain at least one normalizer!")
+
+        positions = {}
+        for position, normalizer in enumerate(normalizers):
+            name = normalizer.name()
+            if name in positions:
+                raise ValueError(f"Normalizer {name} is used more than once!")
+            positions[name] = position
+
+        for earlier, later in ORDER_CONSTRAINTS:
+            if earlier in positions and later in positions and positions[earlier] > positions[later]:
+                raise ValueError(f"Normalizer {earlier} must run before {later}!")
+
+    def name(self) -> str:
+        return " -> ".join(normalizer.name() for normalizer in self.normalizers)
+
+    def triggers(self) -> Trigger:
+        triggers = Trigger.NONE
+        for normalizer in self.normalizers:
+            triggers |= normalizer.triggers()
+
+        return triggers
+
+    def normalize(
+        self, text: str, sink: Optional[EventSink] = None, observer: Optional[StageObserver] = None
+    ) -> Tuple[str, List[str], List[str]]:
+        """
+        Runs all normalizers over the text.
+
+        Args:
+            text: Input text for normalization
+            sink: Receives the events of all stages, with spans in the input of the stage that reported them
+            observer: Receives the result of every stage, see StageObserver
+
+        Returns:
+            Tuple[str, List[str], List[str]]: Tuple with normalized text and warnings and errors of all stages
+        """
+        if self.profiler is not None:
+            return self.normalize_with_profiler(text, sink, observer)
+
+        if self.budget is not None and self.budget.exceeds_length(text):
+            return self.budget.fallback(text, DocumentBudget.LENGTH_CODE, self.name(), sink)
+
+        if self.cache is not None and sink is None and observer is None:
+            result = self.cache.get(self.fingerprint, text)
+            if result is None:
+                result = self.normalize_stages(text)
+                if self.budget is not None and self.budget.is_fallback(result):
+                    return result
+                self.cache.put(self.fingerprint, text, result)
+            # Copies, so the caller can change the lists without changing the cache
+            return result[0], list(result[1]), list(result[2])
+
+        return self.normalize_stages(text, sink, observer=observer)
+
+    def normalize_stages(
+        self,
+        text: str,
+        sink: Optional[EventSink] = None,
+        profile: Optional[Trigger] = None,
+        observer: Optional[StageObserver] = None,
+    ) -> Tuple[str, List[str], List[str]]:
+        """
+        Runs every triggered stage, with its results looked up in the cache if the pipeline has one.
+        The profile of the text is computed with detect_triggers if not given.
+        """
+        deadline = None
+        if self.budget is not None:
+            if self.budget.exceeds_length(text):
+                return self.budget.fallback(text, DocumentBudget.LENGTH_CODE, self.name(), sink)
+            deadline = self.budget.deadline()
+
+        original = text
+        warnings = []
+        errors = []
+        if profile is None:
+            profile = detect_triggers(text)
+
+        for position, normalizer in enumerate(self.normalizers):
+            if not normalizer.is_triggered(profile):
+                if observer is not None:
+                    observer.observe_stage(normalizer, text, (text, [], []))
+                continue
+
+            stage_sink = sink if observer is None else join_sinks(sink, observer.stage_sink(normalizer))
+            if stage_sink is not None:
+                output, stage_warnings, stage_errors = normalizer.normalize(text, sink=stage_sink)
+            elif self.cache is not None:
+                output, stage_warnings, stage_errors = self.normalize_cached(position, text)
+            else:
+                output, stage_warnings, stage_errors = normalizer.normalize(text)
+            if observer is not None:
+                observer.observe_stage(normalizer, text, (output, stage_warnings, stage_errors))
+            warnings.extend(stage_warnings)
+            errors.extend(stage_errors)
+
+            if deadline is not None and perf_counter() > deadline:
+                return self.budget.fallback(original, DocumentBudget.TIME_CODE, self.name(), sink)
+
+            if output != text:
+                text = output
+                profile = detect_triggers(text)
+
+        return text, warnings, errors
+
+    def normalize_with_profiler(
+        self, text: str, sink: Optional[EventSink] = None, observer: Optional[StageObserver] = None
+    ) -> Tuple[str, List[str], List[str]]:
+        """
+        Same as normalize, but records the time of every stage and of the whole document in the profiler.
+        Skipped stages are not recorded.
+        """
+        profiler = self.profiler
+        document_started = perf_counter()
+        stage_seconds = {}
+        length = len(text)
+
+        if self.budget is not None and self.budget.exceeds_length(text):
+            return self.budget.fallback(text, DocumentBudget.LENGTH_CODE, self.name(), sink)
+        deadline = None if self.budget is None else self.budget.deadline()
+        original = text
+
+        warnings = []
+        errors = []
+        profile = detect_triggers(text)
+
+        for position, normalizer in enumerate(self.normalizers):
+            if not normalizer.is_triggered(profile):
+                if observer is not None:
+                    observer.observe_stage(normalizer, text, (text, [], []))
+                continue
+
+            options = {}
+            stage_sink = sink if observer is None else join_sinks(sink, observer.stage_sink(normalizer))
+            if stage_sink is not None:
+                options["sink"] = stage_sink
+            if normalizer.PROFILES_RULES:
+                options["profiler"] = profiler
+
+            started = perf_counter()
+            if stage_sink is None and self.cache is not None:
+                output, stage_warnings, stage_errors = self.normalize_cached(position, text, **options)
+            else:
+                output, stage_warnings, stage_errors = normalizer.normalize(text, **options)
+            seconds = perf_counter() - started
+            if observer is not None:
+                observer.observe_stage(normalizer, text, (output, stage_warnings, stage_errors))
+
+            name = normalizer.name()
+            profiler.record_stage(name, seconds, len(text))
+            stage_seconds[name] = seconds
+
+            warnings.extend(stage_warnings)
+            errors.extend(stage_errors)
+
+            if deadline is not None and perf_counter() > deadline:
+                profiler.record_document(perf_counter() - document_started, length, stage_seconds)
+                return self.budget.fallback(original, DocumentBudget.TIME_CODE, self.name(), sink)
+
+            if output != text:
+                text = output
+                profile = detect_triggers(text)
+
+        profiler.record_document(perf_counter() - document_started, length, stage_seconds)
+        return text, warnings, errors
+
+    def normalize_cached(self, position: int, text: str, **options) -> Tuple[str, List[str], List[str]]:
+        """Returns the cached result of the stage at the position for the text, normalizing and caching it on a miss."""
+        fingerprint = self.fingerprints[position]
+        result = self.cache.get(fingerprint, text)
+
+        if result is None:
+            result = self.normalizers[position].normalize(text, **options)
+            self.cache.put(fingerprint, text, result)
+
+        return result
+
+    def normalize_edits(self, text: str) -> Tuple[List[Edit], List[str], List[str]]:
+        """
+        Runs all normalizers over the text and returns the changes of all stages as one edit list against the text.
+        Use apply_edits to get the normalized text and OffsetMap to translate positions between the texts.
+        A document over the budget has no edits and only the error of the budget.
+
+        Args:
+            text: Input text for normalization
+
+        Returns:
+            Tuple[List[Edit], List[str], List[str]]: Sorted (start, end, replacement) edits of the text
+                and warnings and errors of all stages
+        """
+        deadline = None
+        if self.budget is not None:
+            if self.budget.exceeds_length(text):
+                return [], [], [self.budget.length_error]
+            deadline = self.budget.deadline()
+
+        edits = []
+        warnings = []
+        errors = []
+        profile = detect_triggers(text)
+
+        for normalizer in self.normalizers:
+            if not normalizer.is_triggered(profile):
+                continue
+
+            stage_edits, stage_warnings, stage_errors = normalizer.normalize_edits(text)
+            warnings.extend(stage_warnings)
+            errors.extend(stage_errors)
+
+            if deadline is not None and perf_counter() > deadline:
+                return [], [], [self.budget.time_error]
+
+            if stage_edits:
+                edits = compose_edits(edits, stage_edits, text)
+                text = apply_edits(text, stage_edits)
+                profile = detect_triggers(text)
+
+        return edits, warnings, errors
+
+    def stream(self) -> PipelineStream:
+        """
+        Returns a stream that normalizes a text arriving in chunks, e.g. a huge document or a live feed:
+        feed(chunk) returns the part of the output that is already final and finish() returns the rest
+        with the warnings and errors. The output is identical to normalize on the concatenated chunks.
+
+        Stages keep only the text after the last position their rules cannot see across, except where the result
+        depends on the whole text: ApostropheNormalizer keeps the text after the first symbol that becomes
+        a quote or an apostrophe by the number of quotes, and QuotationMarksNormalizer the text after
+        the first quotation mark, because their checks of the whole text can change every mark.
+        """
+        return PipelineStream([normalizer.stream() for normalizer in self.normalizers])
+
+    def normalize_batch(self, texts, workers: int = 1) -> BatchResult:
+        """
+        Runs all normalizers over many texts in one call, e.g. a column of a dataframe or an Arrow table.
+        Profiles of all texts are computed in one pass over the joined texts: texts that no stage is triggered by
+        are returned without a call, and the others start with their profile instead of computing it again.
+
+        Args:
+            texts: Sequence of strings, pyarrow string Array or ChunkedArray, or pandas Series of strings
+            workers: Number of threads sharing the pipeline, its profiler and its cache, see run_batch
+
+        Returns:
+            BatchResult: Normalized texts with flat, offset-indexed warnings and errors, missing values stay None
+        """
+        if self.profiler is not None or self.cache is not None:
+            return run_batch(texts, lambda text, profile: self.normalize(text), self.triggers(), workers)
+
+        return run_batch(
+            texts, lambda text, profile: self.normalize_stages(text, profile=profile), self.triggers(), workers
+        )
+
+    def normalize_many(
+        self, texts: Iterable[str], sink: Optional[EventSink] = None
+    ) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """
+        Lazily normalizes a stream of texts, e.g. the output of read_news_stream.
+
+        Args:
+            texts: Iterable of input texts
+            sink: Receives the events of all stages for all texts
+
+        Returns:
+            Iterator[Tuple[str, List[str], List[str]]]: Normalization result for every text in the input order
+        """
+        for text in texts:
+            yield self.normalize(text, sink)
+
+
+if __name__ == "__main__":
+    from sources.normalizers.events import EventCounter
+
+    pipeline = NormalizationPipeline()
+
+    tests = [
+        ("Сім ` я", "Сімʼя"),
+        ("''Дерево'', прем`єр", "«Дерево», премʼєр"),
+        ("'прем'єр' сказав: „так“", "«премʼєр» сказав: «так»"),
+        ("Телефон: 099 123 45 67", "Телефон: +380 (99) 123-45-67"),
+        ("У 2023 році", "У 2023 році"),
+    ]
+
+    for input, expected_result in tests:
+        output, _, _ = pipeline.normalize(input)
+        assert output == expected_result, f"Input: {input}, expected: {expected_result}, result: {output}."
+
+        manual_output = input
+        for normalizer in DEFAULT_NORMALIZERS:
+            manual_output, _, _ = normalizer.normalize(manual_output)
+        assert output == manual_output, f"Input: {input}, expected: {manual_output}, result: {output}."
+
+    outputs = [output for output, _, _ in pipeline.normalize_many(input for input, _ in tests)]
+    assert outputs == [expected_result for _, expected_result in tests]
+
+    counter = EventCounter(key=lambda event: (event.normalizer, event.original, event.replacement))
+    outputs = [output for output, _, _ in pipeline.normalize_many((input for input, _ in tests), counter)]
+    assert outputs == [expected_result for _, expected_result in tests]
+    assert counter.counts[(UkrainianPhoneNormalizer.name(), "099 123 45 67", "+380 (99) 123-45-67")] == 1
+    assert counter.counts[(RedundantApostropheSpacesNormalizer.name(), " ` ", "`")] == 1
+    assert counter.counts[(ApostropheNormalizer.name(), "''", '"')] == 2
+    assert counter.counts[(QuotationMarksNormalizer.name(), '"', "«")] == 3
+
+    invalid_orders = [
+        [],
+        [ApostropheNormalizer, ApostropheNormalizer],
+        [QuotationMarksNormalizer, ApostropheNormalizer],
+        [ApostropheNormalizer, RedundantApostropheSpacesNormalizer],
+    ]
+
+    for normalizers in invalid_orders:
+        try:
+            NormalizationPipeline(normalizers)
+        except ValueError:
+            continue
+        raise AssertionError(f"Order should be invalid: {[normalizer.name() for normalizer in normalizers]}")
+
+    profiler = NormalizationProfiler(slowest_documents=2)
+    profiled_pipeline = NormalizationPipeline(profiler=profiler)
+    outputs = [output for output, _, _ in profiled_pipeline.normalize_many(input for input, _ in tests)]
+    assert outputs == [expected_result for _, expected_result in tests]
+
+    report = profiler.report()
+    assert report["documents"]["calls"] == len(tests)
+    assert report["stages"][UkrainianPhoneNormalizer.name()]["calls"] == 1
+    assert report["stages"][ApostropheNormalizer.name()]["calls"] == 3
+    assert report["rules"] and all(name.startswith("REGULAR_PHONE_PATTERNS[") for name in report["rules"])
+    assert len(report["slowest_documents"]) == 2
+
+    for input, expected_result in tests:
+        edits, _, _ = pipeline.normalize_edits(input)
+        assert apply_edits(input, edits) == expected_result, f"Input: {input}, edits: {edits}."
+    assert pipeline.normalize_edits("Сім ` я, „так“") == ([(3, 6, "ʼ"), (9, 10, "«"), (13, 14, "»")], [], [])
+
+    for input, expected_result in tests + [("«а „б“ в» і 'г', 099 123 45 67", "")]:
+        for chunk_size in [1, 2, 5]:
+            stream = pipeline.stream()
+            output = "".join(stream.feed(input[start:start + chunk_size]) for start in range(0, len(input), chunk_size))
+            rest, warnings, errors = stream.finish()
+            assert (output + rest, warnings, errors) == pipeline.normalize(input), f"Input: {input}, chunks: {chunk_size}."
+
+    # Without quotation marks only the text after the last safe cut is kept
+    stream = pipeline.stream()
+    text = "Телефон 099 123 45 67, сімʼя та прем'єр. " * 100
+    pending = []
+    for start in range(0, len(text), 50):
+        stream.feed(text[start:start + 50])
+        pending.append(stream.pending)
+    assert max(pending) < 100, max(pending)
+
+    # Configured instances run with their options, classes with the default ones
+    configured_pipeline = NormalizationPipeline([
+        UkrainianPhoneNormalizer,
+        ApostropheNormalizer.configured(apostrophe="'"),
+        QuotationMarksNormalizer.configured(outer_open="<", outer_close=">"),
+    ])
+    assert configured_pipeline.normalizers[0] is UkrainianPhoneNormalizer.default()
+    assert configured_pipeline.normalize("''Дерево'', прем`єр")[0] == "<Дерево>, прем'єр"
+    assert configured_pipeline.triggers() & Trigger.ALWAYS
+
+    texts = [input for input, _ in tests] + [None]
+    batch = pipeline.normalize_batch(texts)
+    assert [batch[index] for index in range(len(tests))] == [pipeline.normalize(input) for input, _ in tests]
+    assert batch.texts[-1] is None and len(batch.warning_offsets) == len(texts) + 1
+    assert ApostropheNormalizer.normalize_batch(texts).texts[:2] == ["Сім ` я", '"Дерево", премʼєр']
+    threaded = pipeline.normalize_batch(texts * 20, workers=4)
+    assert threaded.texts == pipeline.normalize_batch(texts * 20).texts
+    assert threaded.warnings == pipeline.normalize_batch(texts * 20).warnings
+
+    # Documents over the budget are passed through unchanged with an error, which is not cached
+    budget = DocumentBudget(max_length=20)
+    budgeted_pipeline = NormalizationPipeline(budget=budget, cache=NormalizationCache())
+    wall = '"' * 21
+    assert budgeted_pipeline.normalize(wall) == (wall, [], [budget.length_error])
+    assert budgeted_pipeline.normalize_edits(wall) == ([], [], [budget.length_error])
+    assert budgeted_pipeline.normalize_batch([wall, "Сім ` я"]).texts == [wall, "Сімʼя"]
+    counter = EventCounter()
+    budgeted_pipeline.normalize(wall, sink=counter)
+    assert counter.counts == {(budgeted_pipeline.name(), "error", DocumentBudget.RULE, DocumentBudget.LENGTH_CODE): 1}
+
+    budget = DocumentBudget(max_seconds=1e-9)
+    for budgeted_pipeline in [NormalizationPipeline(budget=budget, cache=NormalizationCache()),
+                              NormalizationPipeline(budget=budget, profiler=NormalizationProfiler())]:
+        assert budgeted_pipeline.normalize("Сім ` я") == ("Сім ` я", [], [budget.time_error])
+    assert budgeted_pipeline.normalize("Текст") == ("Текст", [], []), "Documents without triggered stages fit any budget"
+    assert NormalizationPipeline(budget=budget).normalize_edits("Сім ` я") == ([], [], [budget.time_error])
+    assert NormalizationPipeline(budget=DocumentBudget(10 ** 6, 60.0)).normalize('"' * 10 ** 5)[0] == "«" + "»" * (10 ** 5 - 1)
+
+    cache = NormalizationCache()
+    cached_pipeline = NormalizationPipeline(cache=cache)
+    for _ in range(2):
+        outputs = [output for output, _, _ in cached_pipeline.normalize_many(input for input, _ in tests)]
+        assert outputs == [expected_result for _, expected_result in tests]
+    assert cache.hits == len(tests), cache.stats()
+
+    # A rule change of one stage only misses the document and the cached results of that stage
+    cached_pipeline.fingerprints[-1] = "changed"
+    cached_pipeline.fingerprint = "+".join(cached_pipeline.fingerprints)
+    hits, misses = cache.hits, cache.misses
+    output, _, _ = cached_pipeline.normalize("'прем'єр' сказав: „так“")
+    assert output == "«премʼєр» сказав: «так»"
+    assert (cache.hits - hits, cache.misses - misses) == (2, 2), cache.stats()
+
+    print("All tests passed!")
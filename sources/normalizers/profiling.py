@@ -0,0 +1,190 @@
+from collections import Counter
+from typing import Dict, List, Tuple
+import heapq
+import json
+import math
+import threading
+
+
+class LatencyStats:
+    """
+    Number of calls, processed characters and a latency histogram of a stage or rule.
+    The histogram has logarithmic buckets, so percentiles are accurate to about 9% in constant memory,
+    and stats of several processes can be merged.
+    """
+
+    # Every doubling of the latency is split into this number of buckets
+    BUCKETS_PER_OCTAVE = 8
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.characters = 0
+        self.max_seconds = 0.0
+        self.histogram = Counter()
+
+    def add(self, seconds: float, characters: int):
+        self.calls += 1
+        self.seconds += seconds
+        self.characters += characters
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+        nanoseconds = seconds * 1e9
+        self.histogram[int(math.log2(nanoseconds) * self.BUCKETS_PER_OCTAVE) + 1 if nanoseconds >= 1 else 0] += 1
+
+    def merge(self, other: "LatencyStats"):
+        self.calls += other.calls
+        self.seconds += other.seconds
+        self.characters += other.characters
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        self.histogram.update(other.histogram)
+
+    def percentile(self, percent: float) -> float:
+        """Returns the upper bound of the histogram bucket with the given percentile of latencies, in seconds."""
+        if not self.calls:
+            return 0.0
+
+        rank = percent / 100 * self.calls
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= rank:
+                return min(2 ** (bucket / self.BUCKETS_PER_OCTAVE) / 1e9, self.max_seconds)
+
+        return self.max_seconds
+
+    def report(self) -> dict:
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "characters": self.characters,
+            "mean_seconds": self.seconds / self.calls if self.calls else 0.0,
+            "p50_seconds": self.percentile(50),
+            "p90_seconds": self.percentile(90),
+            "p99_seconds": self.percentile(99),
+            "max_seconds": self.max_seconds,
+            "chars_per_sec": self.characters / self.seconds if self.seconds else 0.0,
+        }
+
+
+class NormalizationProfiler:
+    """
+    Collects latencies of every pipeline stage and phone pattern, and keeps the slowest documents
+    with the timings of their stages.
+
+    Documents are numbered in the order they are recorded, starting from next_document,
+    which can be set to the corpus index of the first document of a chunk.
+    The profiler can be shared by the threads of a thread pool, every record holds a lock of the profiler.
+    """
+
+    def __init__(self, slowest_documents: int = 10):
+        """
+        Args:
+            slowest_documents: Number of the slowest documents to keep
+        """
+        self.slowest_documents = slowest_documents
+        self.stages: Dict[str, LatencyStats] = {}
+        self.rules: Dict[str, LatencyStats] = {}
+        self.documents = LatencyStats()
+        self.next_document = 0
+        # Min-heap of (seconds, document, length, (stage, seconds) pairs) of the slowest documents
+        self.slowest: List[Tuple[float, int, int, Tuple[Tuple[str, float], ...]]] = []
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Profilers of worker processes are sent back to be merged, without the lock
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def record_stage(self, name: str, seconds: float, characters: int):
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = LatencyStats()
+            stats.add(seconds, characters)
+
+    def record_rule(self, name: str, seconds: float, characters: int):
+        with self.lock:
+            stats = self.rules.get(name)
+            if stats is None:
+                stats = self.rules[name] = LatencyStats()
+            stats.add(seconds, characters)
+
+    def record_document(self, seconds: float, characters: int, stage_seconds: Dict[str, float]):
+        with self.lock:
+            document = self.next_document
+            self.next_document += 1
+            self.documents.add(seconds, characters)
+
+            entry = (seconds, document, characters, tuple(stage_seconds.items()))
+            if len(self.slowest) < self.slowest_documents:
+                heapq.heappush(self.slowest, entry)
+            elif self.slowest and seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def merge(self, other: "NormalizationProfiler"):
+        """Adds the measurements of another profiler, e.g. of a worker process."""
+        with self.lock:
+            for own, others in [(self.stages, other.stages), (self.rules, other.rules)]:
+                for name, stats in others.items():
+                    own.setdefault(name, LatencyStats()).merge(stats)
+
+            self.documents.merge(other.documents)
+            self.slowest = heapq.nlargest(self.slowest_documents, self.slowest + other.slowest)
+            heapq.heapify(self.slowest)
+
+    def report(self) -> dict:
+        """Returns the measurements as a JSON-serializable dictionary, the slowest rules and documents first."""
+        def by_time(stats: Dict[str, LatencyStats]) -> Dict[str, dict]:
+            return {
+                name: stats[name].report()
+                for name in sorted(stats, key=lambda name: stats[name].seconds, reverse=True)
+            }
+
+        return {
+            "documents": self.documents.report(),
+            "stages": by_time(self.stages),
+            "rules": by_time(self.rules),
+            "slowest_documents": [
+                {"document": document, "seconds": seconds, "characters": characters, "stages": dict(stage_seconds)}
+                for seconds, document, characters, stage_seconds in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.report(), file, indent=2)
+
+
+if __name__ == "__main__":
+    stats = LatencyStats()
+    for microseconds in range(1, 101):
+        stats.add(microseconds / 1e6, 10)
+
+    report = stats.report()
+    assert report["calls"] == 100 and report["characters"] == 1000
+    assert 50e-6 <= report["p50_seconds"] <= 50e-6 * 1.1, report
+    assert 99e-6 <= report["p99_seconds"] <= 100e-6, report
+    assert report["max_seconds"] == 100e-6
+
+    first = NormalizationProfiler(slowest_documents=3)
+    second = NormalizationProfiler(slowest_documents=3)
+    second.next_document = 100
+    for profiler in (first, second):
+        for milliseconds in [5, 1, 7, 3]:
+            profiler.record_stage("Stage", milliseconds / 1e3, 100)
+            profiler.record_document(milliseconds / 1e3, 100, {"Stage": milliseconds / 1e3})
+
+    first.merge(second)
+    report = first.report()
+    assert report["stages"]["Stage"]["calls"] == 8
+    assert [entry["document"] for entry in report["slowest_documents"]] == [102, 2, 100], report["slowest_documents"]
+    json.dumps(report)
+
+    print("All tests passed!")
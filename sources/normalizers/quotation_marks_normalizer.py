@@ -1,8 +1,11 @@
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 import re
 
-from sources.normalizers.abstract_normalizer import AbstractNormalizer
+from sources.normalizers.abstract_normalizer import AbstractNormalizer, default_instance_method
 from sources.normalizers.constants import Constants
+from sources.normalizers.events import EventKind, EventSink, NormalizationEvent, ReplacementLog
+from sources.normalizers.streaming import DeferredStage
+from sources.normalizers.triggers import Trigger
 
 # https://slovnyk.ua/pravopys.php?prav_par=164
 # fill_quotation_marks(input, divider="|", outer_open="[", outer_close="]", inner_open="(", inner_close=")")
@@ -58,54 +61,231 @@ class QuotationMarksNormalizer(AbstractNormalizer):
     3. Implementation of alternating styles for nested quotations
     """
 
-    @staticmethod
-    def name() -> str:
-        return "QuotationMarksNormalizer"
-
-    @staticmethod
-    def normalize(
-        text: str,
+    # str.replace per mark is much faster than str.translate on non-ASCII text
+    UNIFIED_MARKS = [
+        mark
+        for mark in Constants.QUOTATION_MARKS
+        if mark not in (Constants.DEFAULT_QUOTE, Constants.QUOTE_OUTER_OPEN, Constants.QUOTE_OUTER_CLOSE)
+    ]
+    UNIFIED_MARKS_PATTERN = re.compile("[" + re.escape("".join(UNIFIED_MARKS)) + "]")
+    PUNCTUATION_SYMBOLS = frozenset(punct for punct in Constants.PUNCTUATION if len(punct) == 1)
+    LONG_PUNCTUATION = [punct for punct in Constants.PUNCTUATION if len(punct) > 1]
+    HYPHENS = frozenset(Constants.HYPHENS)
+    QUOTATION_MARK_PATTERN = re.compile("[" + re.escape("".join(Constants.QUOTATION_MARKS)) + "]")
+    # Passes of every duplication in replace_quotation_marks_by_patterns before the text is given up on.
+    # Runs of delimiters take one pass, only marks that form new neighbours across a run need more
+    MAX_DUPLICATION_PASSES = 16
+
+    def __init__(
+        self,
         divider=Constants.DEFAULT_QUOTE,
         spacer=Constants.SPACE,
         outer_open=Constants.QUOTE_OUTER_OPEN,
         outer_close=Constants.QUOTE_OUTER_CLOSE,
         inner_open=Constants.QUOTE_INNER_OPEN,
         inner_close=Constants.QUOTE_INNER_CLOSE,
-    ) -> Tuple[str, List[str], List[str]]:
+    ):
         """
-        Main text normalization method.
-
         Args:
-            text: Input text for normalization
             divider: Delimiter symbol that will be replaced with quotation marks
             spacer: Space character
             outer_open: Opening outer quotation mark symbol
             outer_close: Closing outer quotation mark symbol
             inner_open: Opening inner quotation mark symbol
             inner_close: Closing inner quotation mark symbol
+        """
+        self.divider = divider
+        self.spacer = spacer
+        self.outer_open = outer_open
+        self.outer_close = outer_close
+        self.inner_open = inner_open
+        self.inner_close = inner_close
+        self.single_symbol = QuotationMarksNormalizer.is_single_symbol_config(divider, spacer, outer_open, outer_close)
+
+        # Neighbours of a delimiter for replace_quotation_marks
+        skipped = {outer_open, outer_close, inner_open, inner_close, spacer, divider}
+        self.closing_neighbours = (
+            QuotationMarksNormalizer.PUNCTUATION_SYMBOLS - skipped
+        ) | QuotationMarksNormalizer.HYPHENS | {spacer}
+        # Only needed if their first symbol is skipped, e.g. "……" when the spacer is "…"
+        self.long_punctuation = [
+            punct for punct in QuotationMarksNormalizer.LONG_PUNCTUATION if punct[0] in skipped and punct not in skipped
+        ]
+
+        # Only quotation marks of a single symbol can be found by process_nested_quotations
+        marks = [re.escape(mark) for mark in (outer_open, outer_close) if len(mark) == 1]
+        self.outer_marks_pattern = re.compile("|".join(marks)) if marks else None
+
+        # Patterns and replacements of replace_quotation_marks_by_patterns in the order they are applied
+        escaped_divider = re.escape(divider)
+        self.divider_before_word = re.compile(escaped_divider + r'(\w)')
+        self.divider_after_word = re.compile(r'(\w)' + escaped_divider)
+        self.replacements = []
+        for punct in Constants.PUNCTUATION:
+            if punct in skipped:
+                continue
+            # Replace divider next to punctuation: "|," -> "],"
+            self.replacements.append((f"{divider}{punct}", f"{outer_close}{punct}"))
+            # Add support for abbreviations, e.g. "a [b.|. " -> "a [b.] "
+            self.replacements.append((f".{divider}{punct}{spacer}", f".{outer_close}{punct}{spacer}"))
+        # Replace divider next to hyphen: "|-" -> "]-"
+        for hyphen in Constants.HYPHENS:
+            self.replacements.append((f"{divider}{hyphen}", f"{outer_close}{hyphen}"))
+        # Replace divider next to spacer: "| " -> "] " and " |" -> " ["
+        self.replacements.append((f"{divider}{spacer}", f"{outer_close}{spacer}"))
+        self.replacements.append((f"{spacer}{divider}", f"{spacer}{outer_open}"))
+        # Replace on divider duplications
+        self.duplications = [
+            # |] -> ]]
+            (f"{divider}{outer_close}", f"{outer_close}{outer_close}"),
+            # [| -> [[
+            (f"{outer_open}{divider}", f"{outer_open}{outer_open}"),
+            # ]| -> ]]
+            (f"{outer_close}{divider}", f"{outer_close}{outer_close}"),
+            # |[ -> [[
+            (f"{divider}{outer_open}", f"{outer_open}{outer_open}"),
+        ]
+        # Whole runs of delimiters next to a quotation mark for every duplication, "|||]" -> "]]]]" in one pass
+        # instead of a pass per delimiter. Only the same as the passes if the delimiter shares no symbol with the marks
+        self.duplication_runs = None
+        if not set(divider) & set(outer_open + outer_close):
+            escaped_open = re.escape(outer_open)
+            escaped_close = re.escape(outer_close)
+            self.duplication_runs = [
+                (re.compile(f"(?:{escaped_divider})+(?={escaped_close})"), outer_close),
+                (re.compile(f"(?<={escaped_open})(?:{escaped_divider})+"), outer_open),
+                (re.compile(f"(?<={escaped_close})(?:{escaped_divider})+"), outer_close),
+                (re.compile(f"(?:{escaped_divider})+(?={escaped_open})"), outer_open),
+            ]
+
+        # Without the default symbols, any text can contain delimiters and quotation marks of the configuration
+        symbols = [divider, outer_open, outer_close]
+        if all(symbol in Constants.QUOTATION_MARKS for symbol in symbols):
+            self.trigger_classes = Trigger.QUOTATION_MARK
+        else:
+            self.trigger_classes = Trigger.ALWAYS
+
+        context_symbols = set(Constants.QUOTATION_MARKS).union(*[divider, outer_open, outer_close, inner_open, inner_close])
+        self.context_symbols = re.compile("[" + re.escape("".join(sorted(context_symbols))) + "]")
+
+    def options(self) -> dict:
+        return {
+            "divider": self.divider,
+            "spacer": self.spacer,
+            "outer_open": self.outer_open,
+            "outer_close": self.outer_close,
+            "inner_open": self.inner_open,
+            "inner_close": self.inner_close,
+        }
+
+    @staticmethod
+    def name() -> str:
+        return "QuotationMarksNormalizer"
+
+    @default_instance_method
+    def triggers(self) -> Trigger:
+        return self.trigger_classes
+
+    @default_instance_method
+    def stream(self) -> DeferredStage:
+        # Any quotation mark can make the whole text fall back to unified marks or skip nesting
+        return DeferredStage(self, self.context_symbols)
+
+    @default_instance_method
+    def normalize(
+        self,
+        text: str,
+        divider=None,
+        spacer=None,
+        outer_open=None,
+        outer_close=None,
+        inner_open=None,
+        inner_close=None,
+        sink: Optional[EventSink] = None,
+    ) -> Tuple[str, List[str], List[str]]:
+        """
+        Main text normalization method.
+
+        Args:
+            text: Input text for normalization
+            divider: Delimiter symbol that will be replaced with quotation marks, the one of the instance if not given
+            spacer: Space character, the one of the instance if not given
+            outer_open: Opening outer quotation mark symbol, the one of the instance if not given
+            outer_close: Closing outer quotation mark symbol, the one of the instance if not given
+            inner_open: Opening inner quotation mark symbol, the one of the instance if not given
+            inner_close: Closing inner quotation mark symbol, the one of the instance if not given
+            sink: Receives an event for every unified, classified and nested quotation mark and for every error
 
         Returns:
             Tuple[str, List[str], List[str]]: Normalized text, warnings, and errors
         """
+        if (
+            divider is not None or spacer is not None or outer_open is not None or outer_close is not None
+            or inner_open is not None or inner_close is not None
+        ):
+            normalizer = self.with_options(
+                divider=divider, spacer=spacer, outer_open=outer_open, outer_close=outer_close,
+                inner_open=inner_open, inner_close=inner_close,
+            )
+            return normalizer.normalize(text, sink=sink)
+
+        if sink is not None:
+            return self.normalize_with_events(text, sink)
 
         # Step 1: Symbol unification
-        unified_text = QuotationMarksNormalizer.unify_quotes(text)
+        unified_text = self.unify_quotes(text)
 
         # Step 2: Contextual replacement
-        processed_text, errors = QuotationMarksNormalizer.replace_quotation_marks(
-            unified_text, divider, spacer, outer_open, outer_close, inner_open, inner_close
-        )
+        processed_text, errors = self.replace_quotation_marks(unified_text)
 
         if errors:
             return processed_text, [], errors
 
         # Step 3: Nested quotation handling
-        processed_text, warnings = QuotationMarksNormalizer.process_nested_quotations(
-            processed_text, outer_open, outer_close, inner_open, inner_close
-        )
+        processed_text, warnings = self.process_nested_quotations(processed_text)
 
         return processed_text, warnings, []
 
+    @default_instance_method
+    def normalize_with_events(self, text: str, sink: EventSink) -> Tuple[str, List[str], List[str]]:
+        """
+        Same as normalize, but reports every decision to the sink.
+        """
+        name = QuotationMarksNormalizer.name()
+
+        def report(kind, rule, start, end, original, replacement, code=None):
+            start, end = log.to_input(start, end)
+            sink(NormalizationEvent(name, kind, rule, start, end, original, replacement, code))
+
+        # Unification replaces single symbols with the default quote, so it keeps all positions
+        log = ReplacementLog()
+        for match in QuotationMarksNormalizer.UNIFIED_MARKS_PATTERN.finditer(text):
+            report(EventKind.REPLACEMENT, "unify", match.start(), match.end(), match.group(), Constants.DEFAULT_QUOTE)
+        unified_text = self.unify_quotes(text)
+
+        records = []
+        processed_text, errors = self.replace_quotation_marks(unified_text, records=records)
+        if errors:
+            report(EventKind.ERROR, "context", 0, len(unified_text), "", "", "delimiters_left")
+            return processed_text, [], errors
+
+        if self.single_symbol:
+            for index, mark in records:
+                report(EventKind.REPLACEMENT, "context", index, index + 1, self.divider, mark)
+        elif processed_text != unified_text:
+            # Patterns of several symbols change the text as a whole
+            report(EventKind.REPLACEMENT, "patterns", 0, len(unified_text), unified_text, processed_text)
+            log.add_step([(0, len(unified_text), len(processed_text))])
+
+        records = []
+        nested_text, warnings = self.process_nested_quotations(processed_text, records=records)
+        if warnings:
+            report(EventKind.WARNING, "nested", 0, len(processed_text), "", "", "unequal_quotes")
+        for index, mark in records:
+            report(EventKind.REPLACEMENT, "nested", index, index + 1, processed_text[index], mark)
+
+        return nested_text, warnings, []
+
     @staticmethod
     def unify_quotes(text: str) -> str:
         """
@@ -117,91 +297,238 @@ class QuotationMarksNormalizer(AbstractNormalizer):
         Returns:
             str: Text with unified quotation marks
         """
-        marks = Constants.QUOTATION_MARKS.copy()
-
-        marks.remove(Constants.DEFAULT_QUOTE)
-        marks.remove(Constants.QUOTE_OUTER_OPEN)
-        marks.remove(Constants.QUOTE_OUTER_CLOSE)
-
-        for mark in marks:
+        for mark in QuotationMarksNormalizer.UNIFIED_MARKS:
             text = text.replace(mark, Constants.DEFAULT_QUOTE)
 
         return text
 
-    @staticmethod
+    @default_instance_method
     def replace_quotation_marks(
+        self,
         text: str,
-        divider=Constants.DEFAULT_QUOTE,
-        spacer=Constants.SPACE,
-        outer_open=Constants.QUOTE_OUTER_OPEN,
-        outer_close=Constants.QUOTE_OUTER_CLOSE,
-        inner_open=Constants.QUOTE_INNER_OPEN,
-        inner_close=Constants.QUOTE_INNER_CLOSE
+        divider=None,
+        spacer=None,
+        outer_open=None,
+        outer_close=None,
+        inner_open=None,
+        inner_close=None,
+        records: Optional[List[Tuple[int, str]]] = None,
     ) -> Tuple[str, List[str]]:
         """
         Replaces delimiters with contextually appropriate quotation marks.
 
+        Every delimiter is classified once by its neighbours, so the cost depends on the number of delimiters
+        and not on the size of the punctuation table. Delimiters that cannot be classified by their neighbours
+        take the role of the adjacent quotation mark.
+
         Args:
             text: Input text for processing
-            divider: Delimiter symbol that will be replaced with quotation marks
-            spacer: Space character
-            outer_open: Opening outer quotation mark symbol
-            outer_close: Closing outer quotation mark symbol
-            inner_open: Opening inner quotation mark symbol
-            inner_close: Closing inner quotation mark symbol
+            divider, spacer, outer_open, outer_close, inner_open, inner_close: Options that override the instance ones
+            records: List to add (index, quotation mark) to for every replaced delimiter, only for single symbols
+
+        Returns:
+            Tuple[str, List[str]]: Processed text and list of errors
+        """
+        normalizer = self.with_options(
+            divider=divider, spacer=spacer, outer_open=outer_open, outer_close=outer_close,
+            inner_open=inner_open, inner_close=inner_close,
+        )
+        if normalizer is not self:
+            return normalizer.replace_quotation_marks(text, records=records)
+
+        if not self.single_symbol:
+            return self.replace_quotation_marks_by_patterns(text)
+
+        divider = self.divider
+        spacer = self.spacer
+        outer_open = self.outer_open
+        outer_close = self.outer_close
+
+        indices = []
+        index = text.find(divider)
+        while index != -1:
+            indices.append(index)
+            index = text.find(divider, index + 1)
+
+        if not indices:
+            return text, []
+
+        closing_neighbours = self.closing_neighbours
+        long_punctuation = self.long_punctuation
+
+        last_index = len(text) - 1
+        marks = []
+        unresolved = False
+
+        for index in indices:
+            previous_symbol = text[index - 1] if index > 0 else ""
+            next_symbol = text[index + 1] if index < last_index else ""
+
+            # Divider next to alphabet: "a|" -> "a]", "|b" -> "[b"
+            if next_symbol.isalnum() or next_symbol == "_":
+                mark = outer_open
+            elif previous_symbol.isalnum() or previous_symbol == "_":
+                mark = outer_close
+            # Divider on string edges: "|a b c|" -> "[a b c]"
+            elif index == 0:
+                mark = outer_open
+            elif index == last_index:
+                mark = outer_close
+            # Divider before punctuation, hyphen or spacer: "|," -> "],", "|-" -> "]-", "| " -> "] "
+            elif next_symbol in closing_neighbours or any(
+                text.startswith(punct, index + 1) for punct in long_punctuation
+            ):
+                mark = outer_close
+            # Divider after spacer: " |" -> " ["
+            elif previous_symbol == spacer:
+                mark = outer_open
+            else:
+                mark = None
+                unresolved = True
+
+            marks.append(mark)
+
+        if unresolved:
+            QuotationMarksNormalizer.resolve_divider_runs(text, indices, marks, outer_open, outer_close)
+            if None in marks:
+                return text, ["There are delimiters left in the text!"]
+
+        if records is not None:
+            records.extend(zip(indices, marks))
+
+        output = []
+        position = 0
+        for index, mark in zip(indices, marks):
+            output.append(text[position:index])
+            output.append(mark)
+            position = index + 1
+
+        output.append(text[position:])
+        return "".join(output), []
+
+    @staticmethod
+    def resolve_divider_runs(
+        text: str,
+        indices: List[int],
+        marks: List[Optional[str]],
+        outer_open=Constants.QUOTE_OUTER_OPEN,
+        outer_close=Constants.QUOTE_OUTER_CLOSE,
+    ):
+        """
+        Resolves runs of unclassified delimiters by the adjacent quotation marks, in place:
+        "|]" -> "]]", "[|" -> "[[", "]|" -> "]]", "|[" -> "[[", in this order of priority.
+        """
+        mark_by_index = dict(zip(indices, marks))
+
+        def neighbour(position):
+            return mark_by_index.get(position, text[position])
+
+        runs = []
+        for order, mark in enumerate(marks):
+            if mark is not None:
+                continue
+            if runs and runs[-1][1] == order - 1 and indices[order] == indices[order - 1] + 1:
+                runs[-1][1] = order
+            else:
+                runs.append([order, order])
+
+        for first, last in runs:
+            previous_mark = neighbour(indices[first] - 1)
+            next_mark = neighbour(indices[last] + 1)
+
+            if next_mark == outer_close:
+                mark = outer_close
+            elif previous_mark == outer_open:
+                mark = outer_open
+            elif previous_mark == outer_close:
+                mark = outer_close
+            elif next_mark == outer_open:
+                mark = outer_open
+            else:
+                continue
+
+            for order in range(first, last + 1):
+                marks[order] = mark
+
+    @staticmethod
+    def is_single_symbol_config(divider, spacer, outer_open, outer_close) -> bool:
+        """
+        Checks if the symbols allow replace_quotation_marks to classify every delimiter independently.
+        Other configurations fall back to replace_quotation_marks_by_patterns.
+        """
+        symbols = [divider, spacer, outer_open, outer_close]
+        if any(len(symbol) != 1 for symbol in symbols) or len(set(symbols)) != len(symbols):
+            return False
+
+        # Replacements must not create new word, hyphen or escape symbols next to other delimiters
+        for symbol in (divider, outer_open, outer_close):
+            if symbol.isalnum() or symbol in "_\\" or symbol in QuotationMarksNormalizer.HYPHENS:
+                return False
+
+        # Delimiters and the marks that replace them can spell punctuation of several symbols with their neighbours,
+        # e.g. "……" when the delimiter is "…", which the patterns only see after the replacements next to words
+        return not any(
+            symbol in punct
+            for symbol in (divider, outer_open, outer_close)
+            for punct in QuotationMarksNormalizer.LONG_PUNCTUATION
+        )
+
+    @default_instance_method
+    def replace_quotation_marks_by_patterns(
+        self,
+        text: str,
+        divider=None,
+        spacer=None,
+        outer_open=None,
+        outer_close=None,
+        inner_open=None,
+        inner_close=None,
+    ) -> Tuple[str, List[str]]:
+        """
+        Replaces delimiters with quotation marks by applying the context patterns one by one.
+        Used for delimiters and quotation marks of several symbols.
+        Runs of delimiters are replaced in one pass, so walls of delimiters take linear time. A text that still
+        needs more than MAX_DUPLICATION_PASSES passes is returned unchanged with an error.
 
         Returns:
             Tuple[str, List[str]]: Processed text and list of errors
         """
+        normalizer = self.with_options(
+            divider=divider, spacer=spacer, outer_open=outer_open, outer_close=outer_close,
+            inner_open=inner_open, inner_close=inner_close,
+        )
+        if normalizer is not self:
+            return normalizer.replace_quotation_marks_by_patterns(text)
 
+        divider = self.divider
         initial_value = text
         output = text
 
         # Replace divider next to alphabet: "a|" -> "a]", "|b" -> "[b"
-        escaped_divider = re.escape(divider)
-        output = re.sub(escaped_divider + r'(\w)', outer_open + r'\1', output)
-        output = re.sub(r'(\w)' + escaped_divider, r'\1' + outer_close, output)
+        output = self.divider_before_word.sub(self.outer_open + r'\1', output)
+        output = self.divider_after_word.sub(r'\1' + self.outer_close, output)
 
         # Replace divider on string edges: "|a b c|" -> "[a b c]"
         if output.startswith(divider):
-            output = outer_open + output[1:]
+            output = self.outer_open + output[1:]
         if output.endswith(divider):
-            output = output[:-1] + outer_close
+            output = output[:-1] + self.outer_close
 
-        punctuation = Constants.PUNCTUATION
-        for punct in punctuation:
-            if punct in [outer_open, outer_close, inner_open, inner_close, spacer, divider]:
-                continue
-            # Replace divider next to punctuation: "|," -> "],"
-            output = output.replace(f"{divider}{punct}", f"{outer_close}{punct}")
-            # Add support for abbreviations, e.g. "a [b.|. " -> "a [b.] "
-            output = output.replace(f".{divider}{punct}{spacer}", f".{outer_close}{punct}{spacer}")
+        # Replace divider next to punctuation, hyphen and spacer
+        for old, new in self.replacements:
+            output = output.replace(old, new)
 
-        # Replace divider next to hyphen: "|-" -> "]-"
-        for hyphen in Constants.HYPHENS:
-            output = output.replace(f"{divider}{hyphen}", f"{outer_close}{hyphen}")
-
-        # Replace divider next to spacer: "| " -> "] " and " |" -> " ["
-        output = output.replace(f"{divider}{spacer}", f"{outer_close}{spacer}")
-        output = output.replace(f"{spacer}{divider}", f"{spacer}{outer_open}")
-
-        # Replace on divider duplications
-        patterns = [
-            # |] -> ]]
-            (f"{divider}{outer_close}", f"{outer_close}{outer_close}"),
-
-            # [| -> [[
-            (f"{outer_open}{divider}", f"{outer_open}{outer_open}"),
-
-            # ]| -> ]]
-            (f"{outer_close}{divider}", f"{outer_close}{outer_close}"),
+        for number, (old, new) in enumerate(self.duplications):
+            if self.duplication_runs is not None:
+                pattern, mark = self.duplication_runs[number]
+                output = pattern.sub(lambda match: mark * (len(match.group()) // len(divider)), output)
 
-            # |[ -> [[
-            (f"{divider}{outer_open}", f"{outer_open}{outer_open}"),
-        ]
-        for pattern in patterns:
-            while pattern[0] in output:
-                output = output.replace(pattern[0], pattern[1])
+            passes = 0
+            while old in output:
+                if passes == QuotationMarksNormalizer.MAX_DUPLICATION_PASSES:
+                    return initial_value, ["There are too many delimiters next to quotation marks!"]
+                output = output.replace(old, new)
+                passes += 1
 
         # Check if there are any delimiters left
         if output.count(divider) != 0:
@@ -209,38 +536,51 @@ class QuotationMarksNormalizer(AbstractNormalizer):
 
         return output, []
 
-    @staticmethod
+    @default_instance_method
     def process_nested_quotations(
-            text: str,
-            outer_open=Constants.QUOTE_OUTER_OPEN,
-            outer_close=Constants.QUOTE_OUTER_CLOSE,
-            inner_open=Constants.QUOTE_INNER_OPEN,
-            inner_close=Constants.QUOTE_INNER_CLOSE
+        self,
+        text: str,
+        outer_open=None,
+        outer_close=None,
+        inner_open=None,
+        inner_close=None,
+        records: Optional[List[Tuple[int, str]]] = None,
     ) -> Tuple[str, List[str]]:
         """
         Processes nested quotations to implement alternating styles.
 
         Args:
             text: Input text containing quotation marks
-            outer_open: Opening outer quotation mark symbol
-            outer_close: Closing outer quotation mark symbol
-            inner_open: Opening inner quotation mark symbol
-            inner_close: Closing inner quotation mark symbol
+            outer_open, outer_close, inner_open, inner_close: Options that override the instance ones
+            records: List to add (index, quotation mark) to for every replaced quotation mark
 
         Returns:
             Tuple[str, List[str]]: Processed text with proper nested quotations and list of warnings
         """
-        # Find all quotation mark indices
+        normalizer = self.with_options(
+            outer_open=outer_open, outer_close=outer_close, inner_open=inner_open, inner_close=inner_close
+        )
+        if normalizer is not self:
+            return normalizer.process_nested_quotations(text, records=records)
+
+        outer_open = self.outer_open
+        inner_open = self.inner_open
+        inner_close = self.inner_close
+
+        # Find all quotation mark indices, only marks of a single symbol can be found
         quote_indices = []
         open_count = 0
         close_count = 0
 
-        for i, char in enumerate(text):
+        if self.outer_marks_pattern is None:
+            return text, []
+
+        for match in self.outer_marks_pattern.finditer(text):
+            char = match.group()
+            quote_indices.append((match.start(), char))
             if char == outer_open:
-                quote_indices.append((i, char))
                 open_count += 1
-            elif char == outer_close:
-                quote_indices.append((i, char))
+            else:
                 close_count += 1
 
         if not quote_indices:
@@ -249,22 +589,36 @@ class QuotationMarksNormalizer(AbstractNormalizer):
         if open_count != close_count:
             return text, ["The number of open and close quotation marks is not equal!"]
 
-        result = list(text)
+        replacements = []
         stack = []
 
         for idx, char in quote_indices:
             if char == outer_open:
                 if stack and stack[-1] == outer_open:
-                    result[idx] = inner_open
+                    replacements.append((idx, inner_open))
                     stack.append(inner_open)
                 else:
                     stack.append(outer_open)
-            elif char == outer_close:
+            else:
                 if stack:
                     last_open = stack.pop()
                     if last_open == inner_open:
-                        result[idx] = inner_close
+                        replacements.append((idx, inner_close))
 
+        if not replacements:
+            return text, []
+
+        if records is not None:
+            records.extend(replacements)
+
+        result = []
+        position = 0
+        for idx, mark in replacements:
+            result.append(text[position:idx])
+            result.append(mark)
+            position = idx + 1
+
+        result.append(text[position:])
         return ''.join(result), []
 
 
@@ -274,5 +628,31 @@ if __name__ == "__main__":
         result, _, _ = QuotationMarksNormalizer.normalize(input, divider="|", outer_open="[", outer_close="]", inner_open="(", inner_close=")")
         assert result == expected_result, f"Input: {input}, expected: {expected_result}, result: {result}"
 
+    # A configured instance compiles its patterns once and matches the options of normalize
+    normalizer = QuotationMarksNormalizer.configured(divider="|", outer_open="[", outer_close="]", inner_open="(", inner_close=")")
+    assert normalizer.normalize("|a |b| c|") == QuotationMarksNormalizer.normalize("|a |b| c|", divider="|", outer_open="[", outer_close="]", inner_open="(", inner_close=")")
+    assert normalizer.normalize("|a |b| c|")[0] == "[a (b) c]"
+    assert normalizer.triggers() == Trigger.ALWAYS and QuotationMarksNormalizer.triggers() == Trigger.QUOTATION_MARK
+    patterns = QuotationMarksNormalizer.configured(divider="||", outer_open="<<", outer_close=">>")
+    assert patterns.normalize("||a||, ||b||")[0] == "<<a>>, <<b>>"
+
+    # Delimiters and marks that spell "……" with their neighbours are classified like the original patterns did
+    ellipsis = QuotationMarksNormalizer.configured(divider="…", outer_open="[", outer_close="]")
+    assert ellipsis.replace_quotation_marks('_.-??«"………b_!b_— \n') == ('_.-??«"[[[b_!b_— \n', [])
+    ellipsis_open = QuotationMarksNormalizer.configured(divider="|", outer_open="…", outer_close="]")
+    assert ellipsis_open.replace_quotation_marks("b,|…|b?") == ("b,]……b?", [])
+    assert ellipsis_open.replace_quotation_marks("a.|[]—,|…|a|") == ("a.][]—,]……a]", [])
+
+    # Walls of delimiters are resolved in one pass, as the duplications would resolve them one delimiter at a time
+    assert patterns.normalize("a ||" + "||" * 4 + " b")[0] == "a <<" + ">>" * 4 + " b"
+    assert patterns.normalize("a||" + "||" * 3 + " b")[0] == "a" + ">>" * 4 + " b"
+    assert patterns.normalize("||" * 50000)[0] == "<<" + ">>" * 50000
+    # Marks that share symbols with the delimiter are resolved a delimiter per pass, long runs are given up on
+    overlapping = QuotationMarksNormalizer.configured(divider="~~", outer_open="~[", outer_close="]~")
+    assert overlapping.normalize("a ~[~~~~ b")[0] == "a ~[]~]~ b"
+    assert overlapping.normalize("a ~[" + "~~" * 40 + " b") == (
+        "a ~[" + "~~" * 40 + " b", [], ["There are too many delimiters next to quotation marks!"]
+    )
+
     print("All tests passed!")
 #%%
@@ -1,8 +1,11 @@
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 import re
 
-from sources.normalizers.abstract_normalizer import AbstractNormalizer
+from sources.normalizers.abstract_normalizer import AbstractNormalizer, default_instance_method
 from sources.normalizers.constants import Constants
+from sources.normalizers.events import EventSink, ReplacementLog, sub_with_events
+from sources.normalizers.streaming import WindowedStage
+from sources.normalizers.triggers import Trigger
 
 
 class RedundantApostropheSpacesNormalizer(AbstractNormalizer):
@@ -12,14 +15,35 @@ class RedundantApostropheSpacesNormalizer(AbstractNormalizer):
     spacing before apostrophes when the next letter after the spacing is one of the iotated vowels «я», «ю», «є», or «ї».
     """
 
+    SPACED_APOSTROPHE_PATTERNS = [
+        (re.compile(rf" {re.escape(apostrophe)} (?=[яюєї])"), apostrophe) for apostrophe in Constants.APOSTROPHES
+    ]
+    CONTEXT_SYMBOLS = re.compile("[ " + re.escape("".join(Constants.APOSTROPHES)) + "]")
+
     @staticmethod
     def name() -> str:
         return "RedundantApostropheSpacesNormalizer"
 
     @staticmethod
-    def normalize(text: str) -> Tuple[str, List[str], List[str]]:
-        for apostrophe in Constants.APOSTROPHES:
-            text = re.sub(rf" {apostrophe} (?=[яюєї])", f"{apostrophe}", text)
+    def triggers() -> Trigger:
+        return Trigger.APOSTROPHE
+
+    @default_instance_method
+    def stream(self) -> WindowedStage:
+        # Every match is a space, an apostrophe, a space and a letter, so a cut between two other symbols is safe
+        return WindowedStage(self, RedundantApostropheSpacesNormalizer.CONTEXT_SYMBOLS)
+
+    @default_instance_method
+    def normalize(self, text: str, sink: Optional[EventSink] = None) -> Tuple[str, List[str], List[str]]:
+        log = None if sink is None else ReplacementLog()
+
+        for pattern, apostrophe in RedundantApostropheSpacesNormalizer.SPACED_APOSTROPHE_PATTERNS:
+            if sink is None:
+                text = pattern.sub(apostrophe, text)
+            else:
+                text = sub_with_events(
+                    pattern, apostrophe, text, sink, log, RedundantApostropheSpacesNormalizer.name(), "spaced_apostrophe",
+                )
 
         return text, [], []
 
@@ -0,0 +1,178 @@
+from typing import List, Sequence, Tuple
+import re
+
+
+def last_cut(text: str, context_symbols: re.Pattern, start: int = 1) -> int:
+    """
+    Returns the last position p >= start where the text can be cut: neither text[p - 1] nor text[p] is
+    a context symbol, so no rule of the normalizer sees both sides of the cut. Returns 0 if there is none.
+    """
+    for position in range(len(text) - 1, max(start, 1) - 1, -1):
+        if not context_symbols.match(text, position) and not context_symbols.match(text, position - 1):
+            return position
+
+    return 0
+
+
+class StreamingStage:
+    """
+    Normalizes a text that arrives in chunks with a single normalizer.
+
+    The output of feed followed by the output of finish is identical to normalizing the concatenated chunks.
+    This base stage keeps the whole text and normalizes it in finish, which is exact for any normalizer.
+    Normalizers with local rules return stages from stream() that emit text as soon as it is final.
+    """
+
+    def __init__(self, normalizer):
+        """
+        Args:
+            normalizer: Normalizer class, e.g. QuotationMarksNormalizer
+        """
+        self.normalizer = normalizer
+        self.buffer = ""
+
+    @property
+    def pending(self) -> int:
+        """Number of characters received but not emitted yet."""
+        return len(self.buffer)
+
+    def feed(self, chunk: str) -> str:
+        """Adds the next chunk of the text and returns the part of the output that is already final."""
+        self.buffer += chunk
+        return ""
+
+    def finish(self) -> Tuple[str, List[str], List[str]]:
+        """Returns the rest of the output and the warnings and errors of the whole text."""
+        text, self.buffer = self.buffer, ""
+        return self.normalizer.normalize(text)
+
+
+class WindowedStage(StreamingStage):
+    """
+    Stage of a normalizer whose rules only look at runs of context symbols and their direct neighbours,
+    e.g. phone numbers. The text is cut between two symbols that are not context symbols and every part
+    is normalized on its own, so only the text after the last cut is kept.
+    """
+
+    def __init__(self, normalizer, context_symbols: re.Pattern):
+        """
+        Args:
+            normalizer: Normalizer class
+            context_symbols: Pattern of a single symbol that a rule can match or look at
+        """
+        super().__init__(normalizer)
+        self.context_symbols = context_symbols
+        self.warnings = []
+        self.errors = []
+
+    def feed(self, chunk: str) -> str:
+        # Earlier text has no cut, otherwise it would have been normalized already
+        start = len(self.buffer)
+        self.buffer += chunk
+
+        cut = last_cut(self.buffer, self.context_symbols, start)
+        if not cut:
+            return ""
+
+        text, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        return self.normalize_part(text)
+
+    def normalize_part(self, text: str) -> str:
+        output, warnings, errors = self.normalizer.normalize(text)
+        self.warnings.extend(warnings)
+        self.errors.extend(errors)
+        return output
+
+    def finish(self) -> Tuple[str, List[str], List[str]]:
+        text, self.buffer = self.buffer, ""
+        output = self.normalize_part(text) if text else ""
+        return output, self.warnings, self.errors
+
+
+class DeferredStage(StreamingStage):
+    """
+    Stage of a normalizer that leaves text without context symbols unchanged, but decides on the rest
+    by the whole text, e.g. by the number of quotation marks. Text is emitted unchanged up to a cut
+    before the first context symbol, and everything from there on is kept and normalized in finish.
+    """
+
+    def __init__(self, normalizer, context_symbols: re.Pattern):
+        """
+        Args:
+            normalizer: Normalizer class
+            context_symbols: Pattern of a single symbol that the normalizer can change or look at
+        """
+        super().__init__(normalizer)
+        self.context_symbols = context_symbols
+        self.deferred = False
+
+    def feed(self, chunk: str) -> str:
+        start = len(self.buffer)
+        self.buffer += chunk
+        if self.deferred:
+            return ""
+
+        first = self.context_symbols.search(self.buffer, start)
+        end = len(self.buffer) if first is None else first.start()
+        cut = last_cut(self.buffer[:end], self.context_symbols, start)
+        # The text from the last cut before the first context symbol on is normalized in finish
+        self.deferred = first is not None
+        if not cut:
+            return ""
+
+        output, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        return output
+
+
+class PipelineStream:
+    """
+    Chains the stages of a pipeline: the output emitted by a stage is fed to the next one.
+    Created by NormalizationPipeline.stream.
+    """
+
+    def __init__(self, stages: Sequence[StreamingStage]):
+        self.stages = list(stages)
+
+    @property
+    def pending(self) -> int:
+        """Number of characters kept by all stages."""
+        return sum(stage.pending for stage in self.stages)
+
+    def feed(self, chunk: str) -> str:
+        """Adds the next chunk of the text and returns the part of the output that is already final."""
+        for stage in self.stages:
+            if not chunk:
+                return ""
+            chunk = stage.feed(chunk)
+
+        return chunk
+
+    def finish(self) -> Tuple[str, List[str], List[str]]:
+        """Returns the rest of the output and the warnings and errors of all stages for the whole text."""
+        text = ""
+        warnings = []
+        errors = []
+
+        for stage in self.stages:
+            emitted = stage.feed(text) if text else ""
+            output, stage_warnings, stage_errors = stage.finish()
+            text = emitted + output
+            warnings.extend(stage_warnings)
+            errors.extend(stage_errors)
+
+        return text, warnings, errors
+
+
+if __name__ == "__main__":
+    digits = re.compile(r"\d")
+    assert last_cut("ab12cd", digits) == 5
+    assert last_cut("ab12c", digits) == 1
+    assert last_cut("ab12c", digits, start=2) == 0
+    assert last_cut("1a2", digits) == 0
+
+    stage = WindowedStage(None, digits)
+    stage.normalize_part = lambda text: text.upper()
+    assert [stage.feed(chunk) for chunk in ["ab", "1", "cd", "e"]] == ["A", "", "B1C", "D"]
+    assert stage.finish() == ("E", [], [])
+
+    print("All tests passed!")
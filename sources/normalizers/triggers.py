@@ -0,0 +1,114 @@
+from bisect import bisect_right
+from enum import IntFlag
+from typing import List, Optional, Sequence
+import re
+
+from sources.normalizers.constants import Constants
+
+
+class Trigger(IntFlag):
+    """
+    Character classes that a normalizer needs in the text to be able to change it.
+    A text profile is a bitmap of the classes present in the text.
+    """
+
+    NONE = 0
+
+    # Set in every profile, for normalizers that can change any text
+    ALWAYS = 1
+
+    # A run of phone symbols with at least ten digits, the shortest phone number
+    PHONE_DIGITS = 2
+
+    # Any of Constants.APOSTROPHES
+    APOSTROPHE = 4
+
+    # Any of Constants.QUOTATION_MARKS
+    QUOTATION_MARK = 8
+
+
+TRIGGER_PATTERNS = [
+    (Trigger.PHONE_DIGITS, re.compile(r"\d(?:[\s()+\-]*\d){9}")),
+    (Trigger.APOSTROPHE, re.compile("[" + re.escape("".join(Constants.APOSTROPHES)) + "]")),
+    (Trigger.QUOTATION_MARK, re.compile("[" + re.escape("".join(Constants.QUOTATION_MARKS)) + "]")),
+]
+
+
+def detect_triggers(text: str) -> Trigger:
+    """
+    Computes the profile of the text: a bitmap of the trigger classes present in it.
+
+    Args:
+        text: Input text
+
+    Returns:
+        Trigger: Trigger classes present in the text, always including Trigger.ALWAYS
+    """
+    triggers = Trigger.ALWAYS
+
+    for trigger, pattern in TRIGGER_PATTERNS:
+        if pattern.search(text):
+            triggers |= trigger
+
+    return triggers
+
+
+# Joins the texts of a batch, no trigger pattern can match across it
+BATCH_SEPARATOR = "\x00"
+
+
+def detect_batch_triggers(texts: Sequence[Optional[str]]) -> List[Trigger]:
+    """
+    Computes the profiles of many texts at once. The texts are joined into one buffer and every pattern
+    jumps from a match to the next text, so texts without a trigger class are skipped by the regex engine.
+
+    Args:
+        texts: Input texts, None for missing values
+
+    Returns:
+        List[Trigger]: Profile of every text, the same as detect_triggers, and Trigger.NONE for missing values
+    """
+    # Plain integers while matching, operators of IntFlag create a new member every time
+    profiles = [Trigger.NONE.value if text is None else Trigger.ALWAYS.value for text in texts]
+    starts = []
+    position = 0
+    for text in texts:
+        starts.append(position)
+        position += len(text or "") + len(BATCH_SEPARATOR)
+
+    buffer = BATCH_SEPARATOR.join(text or "" for text in texts)
+    for trigger, pattern in TRIGGER_PATTERNS:
+        match = pattern.search(buffer)
+        while match is not None:
+            row = bisect_right(starts, match.start()) - 1
+            profiles[row] |= trigger.value
+            if row + 1 == len(starts):
+                break
+            match = pattern.search(buffer, starts[row + 1])
+
+    members = {value: Trigger(value) for value in set(profiles)}
+    return [members[value] for value in profiles]
+
+
+if __name__ == "__main__":
+    tests = [
+        ("У 2023 році", Trigger.ALWAYS),
+        ("Телефон 099 123 45 67", Trigger.ALWAYS | Trigger.PHONE_DIGITS),
+        ("099 123 45 6", Trigger.ALWAYS),
+        ("прем'єр", Trigger.ALWAYS | Trigger.APOSTROPHE),
+        ("«Дерево»", Trigger.ALWAYS | Trigger.QUOTATION_MARK),
+        ("‘жити’, „так“", Trigger.ALWAYS | Trigger.APOSTROPHE | Trigger.QUOTATION_MARK),
+    ]
+
+    for input, expected_result in tests:
+        result = detect_triggers(input)
+        assert result == expected_result, f"Input: {input}, expected: {expected_result!r}, result: {result!r}."
+
+    texts = [input for input, _ in tests]
+    assert detect_batch_triggers(texts) == [expected_result for _, expected_result in tests]
+    # Digits of neighbouring texts do not form a phone number
+    assert detect_batch_triggers(["099 123", "45 67", None, "'"]) == [
+        Trigger.ALWAYS, Trigger.ALWAYS, Trigger.NONE, Trigger.ALWAYS | Trigger.APOSTROPHE
+    ]
+
+    print("All tests passed!")
@@ -1,7 +1,12 @@
 import re
-from typing import Tuple, List
+from time import perf_counter
+from typing import Tuple, List, Optional
 
-from sources.normalizers.abstract_normalizer import AbstractNormalizer
+from sources.normalizers.abstract_normalizer import AbstractNormalizer, default_instance_method
+from sources.normalizers.events import EventKind, EventSink, NormalizationEvent, ReplacementLog
+from sources.normalizers.profiling import NormalizationProfiler
+from sources.normalizers.streaming import WindowedStage
+from sources.normalizers.triggers import Trigger
 
 
 class UkrainianPhoneNormalizer(AbstractNormalizer):
@@ -82,18 +87,38 @@ class UkrainianPhoneNormalizer(AbstractNormalizer):
         r"0[\s-]?(800|900)[\s-]?(\d{1})(\d{1})[\s-]?(\d{1})(\d{1})[\s-]?(\d{1})(\d{1})",
     ]
 
+    # A phone number can only consist of these symbols, so every match lies within a single run of them
+    PHONE_SYMBOLS_RUN = re.compile(r"\d[\d\s()+\-]*")
+    DIGIT = re.compile(r"\d")
+    # The shortest phone pattern contains ten digits
+    MIN_PHONE_DIGITS = 10
+    # Symbols of phone runs, rules only look at them and at the two symbols before a run
+    PHONE_SYMBOL = re.compile(r"[\d\s()+\-]")
+
+    PROFILES_RULES = True
+
     @staticmethod
     def name() -> str:
         return "UkrainianPhoneNormalizer"
 
     @staticmethod
-    def normalize(text: str) -> Tuple[str, List[str], List[str]]:
+    def triggers() -> Trigger:
+        return Trigger.PHONE_DIGITS
+
+    @default_instance_method
+    def stream(self) -> WindowedStage:
+        return WindowedStage(self, UkrainianPhoneNormalizer.PHONE_SYMBOL)
+
+    @default_instance_method
+    def normalize(
+        self, text: str, sink: Optional[EventSink] = None, profiler: Optional[NormalizationProfiler] = None
+    ) -> Tuple[str, List[str], List[str]]:
         warnings = []
         errors = []
 
-        output = UkrainianPhoneNormalizer.normalize_special_phone_numbers(text)
-
-        output = UkrainianPhoneNormalizer.normalize_regular_phone_numbers(output)
+        output = UkrainianPhoneNormalizer.normalize_phone_numbers(
+            text, special=True, regular=True, sink=sink, profiler=profiler
+        )
 
         return output, warnings, errors
 
@@ -102,34 +127,152 @@ class UkrainianPhoneNormalizer(AbstractNormalizer):
         """
         Normalizes phone numbers with a three-part code.
         """
-        output = text
-        for pattern in UkrainianPhoneNormalizer.SPECIAL_PHONE_PATTERNS:
-            def replace(match):
-                if UkrainianPhoneNormalizer.should_not_match(output, match):
-                    return match.group(0)
+        return UkrainianPhoneNormalizer.normalize_phone_numbers(text, special=True, regular=False)
+
+    @staticmethod
+    def normalize_regular_phone_numbers(text: str) -> str:
+        """
+        Normalizes phone numbers with a two-part code.
+        """
+        return UkrainianPhoneNormalizer.normalize_phone_numbers(text, special=False, regular=True)
+
+    @staticmethod
+    def normalize_phone_numbers(
+        text: str,
+        special: bool = True,
+        regular: bool = True,
+        sink: Optional[EventSink] = None,
+        profiler: Optional[NormalizationProfiler] = None,
+    ) -> str:
+        """
+        Normalizes phone numbers in a single scan over the text.
+
+        Instead of running every pattern over the whole text, finds runs of phone symbols (digits, spaces,
+        hyphens, brackets and plus signs) with at least ten digits and applies the patterns only to them.
+        Replacements consist of the same symbols, so the runs never merge or split, and the result is
+        identical to applying the special patterns and then the regular patterns to the whole text.
+
+        Args:
+            text: Input text for normalization
+            special: Whether to apply SPECIAL_PHONE_PATTERNS
+            regular: Whether to apply REGULAR_PHONE_PATTERNS
+            sink: Receives an event for every phone number matched by a pattern, even if it is already normalized
+            profiler: Records the time of every pattern applied to a run
+
+        Returns:
+            str: Text with normalized phone numbers
+        """
+        output = []
+        position = 0
 
-                return UkrainianPhoneNormalizer.format_special_phone_number(match)
+        for run in UkrainianPhoneNormalizer.PHONE_SYMBOLS_RUN.finditer(text):
+            start, end = run.span()
+            if end - start < UkrainianPhoneNormalizer.MIN_PHONE_DIGITS:
+                continue
 
-            output = re.sub(pattern, replace, output)
+            while start > position and (text[start - 1] in "()+-" or text[start - 1].isspace()):
+                start -= 1
 
-        return output
+            if len(UkrainianPhoneNormalizer.DIGIT.findall(text, start, end)) < UkrainianPhoneNormalizer.MIN_PHONE_DIGITS:
+                continue
+
+            # The two symbols before the run are never changed, but should_not_match looks at them
+            context_start = max(0, start - 2)
+            if sink is None and profiler is None:
+                normalized_run = UkrainianPhoneNormalizer.normalize_phone_run(text[context_start:end], special, regular)
+            else:
+                normalized_run = UkrainianPhoneNormalizer.normalize_phone_run(
+                    text[context_start:end], special, regular, sink, context_start, profiler
+                )
+
+            output.append(text[position:start])
+            output.append(normalized_run[start - context_start:])
+            position = end
+
+        if not output:
+            return text
+
+        output.append(text[position:])
+        return "".join(output)
 
     @staticmethod
-    def normalize_regular_phone_numbers(text: str) -> str:
+    def normalize_phone_run(
+        run: str,
+        special: bool = True,
+        regular: bool = True,
+        sink: Optional[EventSink] = None,
+        offset: int = 0,
+        profiler: Optional[NormalizationProfiler] = None,
+    ) -> str:
         """
-        Normalizes phone numbers with a two-part code.
+        Applies the phone patterns in their priority order to a single run of phone symbols.
+        Events are reported with spans shifted by the offset of the run in the text.
+        """
+        passes = []
+        if special and ("800" in run or "900" in run):
+            passes.append(("SPECIAL_PHONE_PATTERNS", UkrainianPhoneNormalizer.SPECIAL_PASSES,
+                           UkrainianPhoneNormalizer.format_special_phone_number))
+        if regular:
+            passes.append(("REGULAR_PHONE_PATTERNS", UkrainianPhoneNormalizer.REGULAR_PASSES,
+                           UkrainianPhoneNormalizer.format_regular_phone_number))
+
+        log = ReplacementLog() if sink is not None else None
+
+        for patterns_name, patterns, formatter in passes:
+            for number, (pattern, literal) in enumerate(patterns):
+                if literal not in run:
+                    continue
+
+                if sink is None and profiler is None:
+                    run = UkrainianPhoneNormalizer.apply_pattern(run, pattern, formatter)
+                    continue
+
+                rule = f"{patterns_name}[{number}]"
+                matches = None if sink is None else []
+                started = perf_counter()
+                output = UkrainianPhoneNormalizer.apply_pattern(run, pattern, formatter, matches)
+
+                if profiler is not None:
+                    profiler.record_rule(rule, perf_counter() - started, len(run))
+
+                if sink is not None:
+                    for start, end, original, replacement in matches:
+                        input_start, input_end = log.to_input(start, end)
+                        sink(NormalizationEvent(
+                            UkrainianPhoneNormalizer.name(), EventKind.REPLACEMENT, rule,
+                            offset + input_start, offset + input_end, original, replacement,
+                        ))
+
+                    log.add_step([
+                        (start, end, len(replacement)) for start, end, original, replacement in matches
+                        if original != replacement
+                    ])
+
+                run = output
+
+        return run
+
+    @staticmethod
+    def apply_pattern(text: str, pattern: re.Pattern, formatter, matches: Optional[list] = None) -> str:
         """
-        output = text
-        for pattern in UkrainianPhoneNormalizer.REGULAR_PHONE_PATTERNS:
-            def replace(match):
-                if UkrainianPhoneNormalizer.should_not_match(output, match):
-                    return match.group(0)
+        Replaces all matches of the pattern that pass should_not_match with the formatted phone number.
+        Replaced matches are added to the matches list as (start, end, original, replacement) if it is given.
+        """
+        def replace(match):
+            if UkrainianPhoneNormalizer.should_not_match(text, match):
+                return match.group(0)
+
+            return formatter(match)
 
-                return UkrainianPhoneNormalizer.format_regular_phone_number(match)
+        def replace_and_record(match):
+            if UkrainianPhoneNormalizer.should_not_match(text, match):
+                return match.group(0)
 
-            output = re.sub(pattern, replace, output)
+            replacement = formatter(match)
+            matches.append((match.start(), match.end(), match.group(0), replacement))
+            return replacement
 
-        return output
+        return pattern.sub(replace if matches is None else replace_and_record, text)
 
     @staticmethod
     def format_regular_phone_number(match) -> str:
@@ -154,24 +297,62 @@ class UkrainianPhoneNormalizer(AbstractNormalizer):
         """
         Checks if the matched phone number should not be normalized.
         """
+        start, end = match.span()
 
-        previous_two_symbols = text[max(0, match.start() - 2):match.start()]
-        if re.match(r"\d[ -]|\d|-", previous_two_symbols):
-            return True
+        # Same as re.match(r"\d[ -]|\d|-") on the two previous symbols
+        if start > 0:
+            previous_symbol = text[max(0, start - 2)]
+            if previous_symbol.isdecimal() or previous_symbol == "-":
+                return True
 
-        next_two_symbols = text[match.end():min(len(text), match.end() + 2)]
-        if re.match(r"[ -]\d|\d|-", next_two_symbols):
-            return True
+        # Same as re.match(r"[ -]\d|\d|-") on the two next symbols
+        if end < len(text):
+            next_symbol = text[end]
+            if next_symbol.isdecimal() or next_symbol == "-":
+                return True
+            if next_symbol == " " and end + 1 < len(text) and text[end + 1].isdecimal():
+                return True
 
-        code = match.group(1)
+        return match.group(1) not in UkrainianPhoneNormalizer.PHONE_CODES
 
-        is_ukraine_operator_code = re.fullmatch(UkrainianPhoneNormalizer.UKRAINE_OPERATOR_CODES, code)
-        is_ukraine_special_code = re.fullmatch(UkrainianPhoneNormalizer.UKRAINE_SPECIAL_CODES, code)
 
-        if is_ukraine_operator_code or is_ukraine_special_code:
-            return False
-
-        return True
+def required_literal(pattern: str) -> str:
+    """
+    Returns the literal prefix that every match of the phone pattern contains, skipping a leading optional plus.
+    """
+    if pattern.startswith(r"\+?"):
+        pattern = pattern[3:]
+
+    literal = ""
+    while pattern:
+        if pattern[:2] in (r"\+", r"\("):
+            if pattern[2:3] == "?":
+                break
+            literal += pattern[1]
+            pattern = pattern[2:]
+        elif pattern[0].isdigit() and pattern[1:2] != "?":
+            literal += pattern[0]
+            pattern = pattern[1:]
+        else:
+            break
+
+    return literal
+
+
+# Two-digit operator codes and three-digit special codes accepted by should_not_match
+UkrainianPhoneNormalizer.PHONE_CODES = frozenset(
+    code
+    for code in [f"{number:02d}" for number in range(100)] + [f"{number:03d}" for number in range(1000)]
+    if re.fullmatch(UkrainianPhoneNormalizer.UKRAINE_OPERATOR_CODES, code)
+    or re.fullmatch(UkrainianPhoneNormalizer.UKRAINE_SPECIAL_CODES, code)
+)
+# Compiled patterns in their priority order with the literal that a run must contain to match them
+UkrainianPhoneNormalizer.SPECIAL_PASSES = [
+    (re.compile(pattern), required_literal(pattern)) for pattern in UkrainianPhoneNormalizer.SPECIAL_PHONE_PATTERNS
+]
+UkrainianPhoneNormalizer.REGULAR_PASSES = [
+    (re.compile(pattern), required_literal(pattern)) for pattern in UkrainianPhoneNormalizer.REGULAR_PHONE_PATTERNS
+]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,493 @@
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, List, Optional, Sequence, Set, Tuple
+import asyncio
+import json
+import os
+import time
+
+from sources.helpers.corpus_runner import init_worker, normalize_chunk
+from sources.normalizers.normalization_pipeline import NormalizerSpec
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class ServiceMetrics:
+    """
+    Counters of a NormalizationService and the latencies of its recent documents,
+    from the moment a request is parsed until its result is ready.
+    """
+
+    def __init__(self, latency_window: int = 10000):
+        """
+        Args:
+            latency_window: Number of the most recent latencies the percentiles are computed from
+        """
+        self.started = time.monotonic()
+        self.requests = 0
+        self.documents = 0
+        self.failures = 0
+        self.batches = 0
+        self.batched_documents = 0
+        self.latencies = deque(maxlen=latency_window)
+
+    def record_latency(self, seconds: float):
+        self.latencies.append(seconds)
+
+    def record_batch(self, size: int):
+        self.batches += 1
+        self.batched_documents += size
+
+    @staticmethod
+    def percentile(values: List[float], fraction: float) -> float:
+        """Returns the value below which the fraction of the sorted values lies, by the nearest rank."""
+        if not values:
+            return 0.0
+
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+    def snapshot(self, pending: int = 0) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "uptime_seconds": round(time.monotonic() - self.started, 3),
+            "requests": self.requests,
+            "documents": self.documents,
+            "failures": self.failures,
+            "batches": self.batches,
+            "mean_batch_size": round(self.batched_documents / self.batches, 2) if self.batches else 0.0,
+            "pending_documents": pending,
+            "latency_ms": {
+                name: round(self.percentile(latencies, fraction) * 1000, 3)
+                for name, fraction in [("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)]
+            },
+        }
+
+
+class MicroBatcher:
+    """
+    Groups documents of concurrent requests into batches for the worker pool. A batch is dispatched when it reaches
+    max_batch_size documents or max_delay seconds after its first document, whichever comes first, so a single
+    request waits at most max_delay, and under load the pool gets full batches instead of one task per document.
+    At most max_pending_batches batches are in the pool at once, later ones wait in the event loop.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        metrics: ServiceMetrics,
+        max_batch_size: int = 32,
+        max_delay: float = 0.002,
+        max_pending_batches: int = 4,
+    ):
+        self.executor = executor
+        self.metrics = metrics
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.slots = asyncio.Semaphore(max_pending_batches)
+
+        self.pending: List[Tuple[str, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks: Set[asyncio.Task] = set()
+        self.waiting = 0
+
+    @property
+    def pending_documents(self) -> int:
+        """Number of documents submitted and not normalized yet."""
+        return len(self.pending) + self.waiting
+
+    def submit(self, text: str) -> asyncio.Future:
+        """Adds a document to the current batch and returns the future of its result."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((text, future))
+
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_delay, self.flush)
+
+        return future
+
+    def flush(self):
+        """Dispatches the current batch."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, []
+        self.waiting += len(batch)
+        task = asyncio.get_running_loop().create_task(self.dispatch(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def dispatch(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        try:
+            async with self.slots:
+                self.metrics.record_batch(len(batch))
+                results, _ = await asyncio.get_running_loop().run_in_executor(self.executor, normalize_chunk, texts)
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            self.waiting -= len(batch)
+
+        for (text, future), (output, warnings, errors) in zip(batch, results):
+            if not future.done():
+                future.set_result((text if output is None else output, warnings, errors))
+
+    async def close(self):
+        self.flush()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+class NormalizationService:
+    """
+    Normalization server on asyncio, for services that cannot import the normalizers.
+
+    Speaks HTTP/JSON on a TCP port and newline-delimited JSON on a Unix socket. Documents of concurrent requests
+    are grouped by a MicroBatcher and normalized by the pipeline in a pool of worker processes.
+
+    HTTP endpoints:
+        POST /normalize with {"text": "..."} returns {"text": "...", "warnings": [...], "errors": [...]},
+            with {"texts": [...]} returns {"results": [...]} with an object like that for every text
+        GET /health returns {"status": "ok", ...}
+        GET /metrics returns ServiceMetrics.snapshot
+
+    Every line on the Unix socket is a request object like the body of POST /normalize, and is answered by
+    a line with its result, with the "id" of the request if it had one. Requests of a connection are processed
+    concurrently, so results can come in another order than the requests.
+    """
+
+    def __init__(
+        self,
+        normalizers: Optional[Sequence[NormalizerSpec]] = None,
+        workers: Optional[int] = None,
+        max_batch_size: int = 32,
+        max_delay: float = 0.002,
+        max_pending_batches: Optional[int] = None,
+        max_request_bytes: int = 16 << 20,
+        latency_window: int = 10000,
+    ):
+        """
+        Args:
+            normalizers: Normalizer classes or instances of the pipeline, DEFAULT_NORMALIZERS if not given
+            workers: Number of worker processes, os.cpu_count() if not given. With 0, batches are normalized
+                in a single thread of the server process
+            max_batch_size: Maximum number of documents in a batch
+            max_delay: Maximum time in seconds a document waits for its batch to fill up
+            max_pending_batches: Maximum number of batches in the pool, twice the number of workers if not given
+            max_request_bytes: Maximum size of a request body or line
+            latency_window: Number of the most recent latencies the percentiles are computed from
+        """
+        self.normalizers = normalizers
+        self.workers = os.cpu_count() if workers is None else workers
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_pending_batches = max_pending_batches or 2 * max(1, self.workers)
+        self.max_request_bytes = max_request_bytes
+
+        self.metrics = ServiceMetrics(latency_window)
+        self.executor: Optional[Executor] = None
+        self.batcher: Optional[MicroBatcher] = None
+        self.servers: List[asyncio.AbstractServer] = []
+
+    @property
+    def port(self) -> Optional[int]:
+        """Port of the HTTP server, useful when it was started on port 0."""
+        for server in self.servers:
+            for sock in server.sockets:
+                address = sock.getsockname()
+                if isinstance(address, tuple):
+                    return address[1]
+
+        return None
+
+    async def start(self, host: str = "127.0.0.1", port: Optional[int] = 8080, unix_path: Optional[str] = None):
+        """
+        Starts the worker pool and the servers.
+
+        Args:
+            host: Host of the HTTP server
+            port: Port of the HTTP server, 0 for a free one, no HTTP server if None
+            unix_path: Path of the Unix socket for newline-delimited JSON, no socket if not given
+        """
+        initargs = (self.normalizers, None, None)
+        if self.workers:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=initargs)
+        else:
+            self.executor = ThreadPoolExecutor(1, initializer=init_worker, initargs=initargs)
+        self.batcher = MicroBatcher(
+            self.executor, self.metrics, self.max_batch_size, self.max_delay, self.max_pending_batches
+        )
+
+        # Workers are forked before the servers open sockets, otherwise they would inherit the client connections
+        # and keep them open after the server closes them. Also takes the start-up time out of the first requests
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[
+            loop.run_in_executor(self.executor, normalize_chunk, []) for _ in range(max(1, self.workers))
+        ])
+
+        if port is not None:
+            self.servers.append(await asyncio.start_server(self.handle_http, host, port, limit=self.max_request_bytes))
+        if unix_path is not None:
+            self.servers.append(
+                await asyncio.start_unix_server(self.handle_lines, unix_path, limit=self.max_request_bytes)
+            )
+
+    async def close(self):
+        """Stops accepting connections, finishes the pending batches and shuts the pool down."""
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.servers = []
+
+        if self.batcher is not None:
+            await self.batcher.close()
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    async def normalize_text(self, text: Any) -> dict:
+        if not isinstance(text, str):
+            raise ValueError("Every text must be a string!")
+
+        started = time.perf_counter()
+        self.metrics.documents += 1
+        output, warnings, errors = await self.batcher.submit(text)
+        self.metrics.record_latency(time.perf_counter() - started)
+
+        return {"text": output, "warnings": warnings, "errors": errors}
+
+    async def normalize_request(self, request: Any) -> dict:
+        """
+        Normalizes the text or texts of a request object.
+
+        Raises:
+            ValueError: If the request has neither a text nor a list of texts
+        """
+        self.metrics.requests += 1
+        if isinstance(request, dict) and "text" in request:
+            return await self.normalize_text(request["text"])
+        if isinstance(request, dict) and isinstance(request.get("texts"), list):
+            return {"results": list(await asyncio.gather(*map(self.normalize_text, request["texts"])))}
+
+        raise ValueError('The request must be an object with a "text" string or a "texts" list!')
+
+    async def route(self, method: str, path: str, body: bytes) -> Tuple[int, dict]:
+        if path == "/normalize":
+            if method != "POST":
+                return 405, {"error": "Use POST to normalize texts!"}
+            try:
+                return 200, await self.normalize_request(json.loads(body))
+            except ValueError as error:
+                # json.JSONDecodeError is a ValueError too
+                self.metrics.failures += 1
+                return 400, {"error": str(error)}
+
+        if path in ("/health", "/metrics"):
+            if method != "GET":
+                return 405, {"error": f"Use GET for {path}!"}
+            if path == "/health":
+                return 200, {"status": "ok", "workers": self.workers, "pending_documents": self.batcher.pending_documents}
+            return 200, self.metrics.snapshot(self.batcher.pending_documents)
+
+        return 404, {"error": f"Unknown path {path}!"}
+
+    async def handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves HTTP/1.1 requests of a connection, which is kept alive unless the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                parts = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0) or 0)
+                if len(parts) != 3:
+                    status, response, keep_alive = 400, {"error": "Malformed request line!"}, False
+                elif length > self.max_request_bytes:
+                    status, response, keep_alive = 413, {"error": "The request is too large!"}, False
+                else:
+                    method, target, version = parts
+                    body = await reader.readexactly(length) if length else b""
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                    try:
+                        status, response = await self.route(method, target.split("?", 1)[0], body)
+                    except Exception as error:
+                        self.metrics.failures += 1
+                        status, response = 500, {"error": f"{type(error).__name__}: {error}"}
+
+                payload = json.dumps(response, ensure_ascii=False).encode("utf-8")
+                head = [
+                    f"HTTP/1.1 {status} {HTTP_REASONS[status]}",
+                    "Content-Type: application/json; charset=utf-8",
+                    f"Content-Length: {len(payload)}",
+                ]
+                if not keep_alive:
+                    head.append("Connection: close")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_lines(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves newline-delimited JSON requests of a connection concurrently."""
+        tasks = set()
+
+        async def answer(line: bytes):
+            request_id = None
+            try:
+                request = json.loads(line)
+                request_id = request.get("id") if isinstance(request, dict) else None
+                response = await self.normalize_request(request)
+            except ValueError as error:
+                self.metrics.failures += 1
+                response = {"error": str(error)}
+            except Exception as error:
+                self.metrics.failures += 1
+                response = {"error": f"{type(error).__name__}: {error}"}
+
+            if request_id is not None:
+                response = {"id": request_id, **response}
+            writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.get_running_loop().create_task(answer(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: Optional[int] = 8080,
+    unix_path: Optional[str] = None,
+    **options,
+):
+    """
+    Runs a NormalizationService until it is interrupted.
+
+    Args:
+        host: Host of the HTTP server
+        port: Port of the HTTP server, no HTTP server if None
+        unix_path: Path of the Unix socket for newline-delimited JSON, no socket if not given
+        **options: Arguments of NormalizationService
+    """
+    async def run():
+        service = NormalizationService(**options)
+        await service.start(host, port, unix_path)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if unix_path is not None and os.path.exists(unix_path):
+            os.remove(unix_path)
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    from sources.normalizers.normalization_pipeline import NormalizationPipeline
+
+    news = ["Сім ` я", "''Дерево'', прем`єр", "Телефон: 099 123 45 67", "У 2023 році", "'Він!' - сказав він"] * 40
+    pipeline = NormalizationPipeline()
+    expected = [dict(zip(("text", "warnings", "errors"), pipeline.normalize(text))) for text in news]
+
+    async def http_request(port: int, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, dict]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        payload = b"" if body is None else json.dumps(body).encode("utf-8")
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(payload)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + payload
+        )
+        response = await reader.read()
+        writer.close()
+
+        head, _, content = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(content)
+
+    async def test():
+        with tempfile.TemporaryDirectory() as directory:
+            unix_path = os.path.join(directory, "normalizer.sock")
+            service = NormalizationService(workers=2, max_batch_size=16, max_delay=0.005)
+            await service.start(port=0, unix_path=unix_path)
+
+            responses = await asyncio.gather(*[
+                http_request(service.port, "POST", "/normalize", {"text": text}) for text in news
+            ])
+            assert [response for _, response in responses] == expected
+            assert all(status == 200 for status, _ in responses)
+
+            status, response = await http_request(service.port, "POST", "/normalize", {"texts": news[:5]})
+            assert status == 200 and response == {"results": expected[:5]}, response
+            assert (await http_request(service.port, "POST", "/normalize", {"txt": ""}))[0] == 400
+            assert (await http_request(service.port, "GET", "/normalize"))[0] == 405
+            assert (await http_request(service.port, "GET", "/unknown"))[0] == 404
+            assert (await http_request(service.port, "GET", "/health"))[1]["status"] == "ok"
+
+            reader, writer = await asyncio.open_unix_connection(unix_path)
+            for number, text in enumerate(news):
+                writer.write(json.dumps({"id": number, "text": text}).encode("utf-8") + b"\n")
+            writer.write(b"not json\n")
+            writer.write_eof()
+            lines = [json.loads(line) for line in (await reader.read()).splitlines()]
+            writer.close()
+
+            results = {line["id"]: {key: line[key] for key in ("text", "warnings", "errors")}
+                       for line in lines if "id" in line}
+            assert [results[number] for number in range(len(news))] == expected
+            assert sum("error" in line for line in lines) == 1
+
+            status, metrics = await http_request(service.port, "GET", "/metrics")
+            assert metrics["documents"] == 2 * len(news) + 5, metrics
+            # Concurrent requests share batches
+            assert metrics["batches"] < metrics["documents"] and metrics["mean_batch_size"] > 1, metrics
+            assert 0 < metrics["latency_ms"]["p50"] <= metrics["latency_ms"]["p99"] <= metrics["latency_ms"]["max"]
+
+            await service.close()
+
+    asyncio.run(test())
+    print("All tests passed!")